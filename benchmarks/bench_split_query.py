@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+# Benchmark of the sub-window (split) probe query against the full exact query.
+# Synthetic ROI databases of increasing size, with the oligo count growing with the
+# ROI so that the oligo density stays constant. Reports probe cost and wall time.
+#
+#   python benchmarks/bench_split_query.py [--split 50] [--threads 4]
+
+import os
+import sys
+import time
+import click
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "probe_design", "src"))
+from probe_query import OligoDB, solve_exact, solve_split, probe_cost
+
+
+def synthetic_db(size:int, length:int=40, seed:int=0)->OligoDB:
+    # ROI of size nt with one candidate oligo every ~3 nt, as after filtering
+    rng = np.random.default_rng(seed)
+    start = np.cumsum(rng.integers(1, 6, size//3))
+    start = start[start + length <= size]
+    frame = pd.DataFrame({'name': 'ROI_1', 'chromosome': 'chr1',
+                          'start': start, 'end': start + length,
+                          'oligo_cost': rng.gamma(2, 0.5, len(start))})
+    return OligoDB(None, frame=frame)
+
+
+@click.command()
+@click.option('--split', type=click.INT, default=50, help="Oligos per sub-window.")
+@click.option('--threads', type=click.INT, default=1)
+@click.option('--pw', type=click.FLOAT, default=1e-4)
+@click.option('--full/--no-full', default=True, help="Also run the full exact query (slow on large ROIs).")
+def main(split:int, threads:int, pw:float, full:bool)->None:
+    rows = []
+    for size in [50_000, 100_000, 200_000, 400_000, 800_000]:
+        db = synthetic_db(size)
+        n = size//1000              # one oligo per kb
+        ideal = db.ideal_gap(n)
+
+        t = time.perf_counter()
+        selection, _ = solve_split(db, n, pw, split, threads=threads)
+        t_split = time.perf_counter() - t
+        cost_split = probe_cost(db, selection, pw, ideal)
+
+        t_full, cost_full = np.nan, np.nan
+        if full:
+            t = time.perf_counter()
+            selection = solve_exact(db, n, pw)
+            t_full = time.perf_counter() - t
+            cost_full = probe_cost(db, selection, pw, ideal)
+
+        rows.append([size, len(db), n, cost_full, cost_split, 100*(cost_split/cost_full - 1), t_full, t_split])
+
+    print(tabulate(rows, headers=['ROI (nt)', 'oligos in DB', 'oligos', 'cost full', 'cost split',
+                                  'excess (%)', 'full (s)', 'split (s)'], floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
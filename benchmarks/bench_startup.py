@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+# Benchmark of the prb start-up: `prb --help`, `import probe_design` and the dispatch of a
+# python command (`prb seed_hush --help`), each in a new interpreter as from the shell.
+# With --baseline, the same for the package at an earlier git revision (exported with
+# git archive), e.g. the commit before the lazy imports, to compare before and after.
+#
+#   python benchmarks/bench_startup.py [--repeat 10] [--baseline <rev>]
+
+import os
+import sys
+import time
+import tarfile
+import tempfile
+import subprocess
+import statistics
+import click
+from tabulate import tabulate
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+cases = {'prb --help':           "import sys; sys.argv=['prb','--help']; from probe_design.main import main; main()",
+         'import probe_design':  "import probe_design",
+         'prb seed_hush --help': "import sys; sys.argv=['prb','seed_hush','--help']; from probe_design.main import main; main()"}
+
+
+def timings(code:str, tree:str, repeat:int)->list[float]:
+    # wall time of a new interpreter running code with the package of tree
+    env = {**os.environ, 'PYTHONPATH': tree}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, cwd=tree, check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def export(rev:str, folder:str)->None:
+    # probe_design folder of rev
+    archive = os.path.join(folder, "tree.tar")
+    subprocess.run(["git", "-C", ROOT, "archive", "-o", archive, rev, "probe_design"], check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(folder)
+
+
+@click.command()
+@click.option('--repeat', type=click.INT, default=10, help="Runs per case.")
+@click.option('--baseline', type=click.STRING, default=None, help="Git revision to compare with.")
+def main(repeat:int, baseline:str|None)->None:
+    trees = {'this tree': ROOT}
+    with tempfile.TemporaryDirectory() as folder:
+        if baseline is not None:
+            export(baseline, folder)
+            trees[baseline] = folder
+        rows = []
+        for case, code in cases.items():
+            row = [case]
+            for tree in trees.values():
+                timings(code, tree, 1)      # warm the file cache and __pycache__
+                times = timings(code, tree, repeat)
+                row += [statistics.median(times), min(times)]
+            rows.append(row)
+    headers = ['case'] + [f"{name} {stat} (s)" for name in trees for stat in ['median', 'min']]
+    print(tabulate(rows, headers=headers, floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,5 @@
-# Expose this functions to outside as a module
-from .src import (
-    cycling_query,
-    escafish_score,
-    exclude_region,
-    generate_exclude,
-    get_oligos,
-    HUSH_feedback,
-    reform_hush_combined,
-    reform_hush_consec,
-    reform_hush,
-    select_probe,
-    split_fasta,
-    summarize_probes_cumul,
-    summarize_probes_final,
-    summarize_probes,
-    download_chr_list,
-    download_chr,
-    download_ref_genome)
+# Expose this functions to outside as a module (imported on first use, see src/__init__.py)
+from . import src
 
 
 __all__ = ["cycling_query",
@@ -36,8 +19,33 @@ __all__ = ["cycling_query",
             "download_chr_list",
             "download_chr",
             "download_ref_genome",
+            "probe_query",
+            "probe_metrics",
+            "validate_probes",
+            "seed_hush",
+            "fm_index",
+            "blacklist_filter",
+            "abundant_kmers",
+            "tm_engine",
+            "melt_secs",
+            "thermo_cache",
+            "prefilter",
+            "abundance_filter",
+            "run",
+            "nhush_driver",
             ]
 
+
+def __getattr__(name:str):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = getattr(src, name)
+    return globals()[name]
+
+
+def __dir__()->list[str]:
+    return sorted(set(globals()) | set(__all__))
+
 # CONSTANTS
 import os
 
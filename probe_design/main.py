@@ -1,7 +1,7 @@
 import sys
 import os
-import argparse
 import subprocess
+import importlib
 
 # PATH constants
 PATHMAIN = os.path.dirname(__file__)
@@ -10,24 +10,65 @@ PATHSHELL = os.path.join(PATHMAIN, "shell")
 PATHDATA = os.path.join(PATHMAIN, "data")
 PATHNOTEBOOK = os.path.join(PATHMAIN, "notebooks")
 
-# SCRIPTS: absolute paths
-shell_scripts = [os.path.join(PATHSHELL, x) for x in os.listdir(PATHSHELL)]
-py_scripts = [os.path.join(PATHSRC, x) for x in os.listdir(PATHSRC)]
-notebook_scripts = [os.path.join(PATHNOTEBOOK, x) for x in os.listdir(PATHNOTEBOOK)]
-
-# SCRIPTS: names
-shell_scripts_names = [x.split("/")[-1] for x in shell_scripts if "__" not in x.split("/")[-1]]
-py_scripts_names = [x.split("/")[-1] for x in py_scripts if "__" not in x.split("/")[-1]]
-notebook_scripts_names = [x.split("/")[-1] for x in notebook_scripts if "__" not in x.split("/")[-1]]
-
-# SCRIPTS: no extension
-shell_scripts_no_ext = [x.split(".")[0] for x in shell_scripts_names]
-py_scripts_no_ext = [x.split(".")[0] for x in py_scripts_names]
-notebook_scripts_no_ext = [x.split(".")[0] for x in notebook_scripts_names]
-
-# SCRIPTS: all
-ALL_SCRIPTS = shell_scripts_names + py_scripts_names + notebook_scripts_names
-ALL_COMMANDS = shell_scripts_no_ext + py_scripts_no_ext + notebook_scripts_no_ext
+# COMMANDS: name -> (folder, script, entry point). Add new scripts here.
+# Python scripts with an entry point (what their __main__ block calls) run in the prb process,
+# from probe_design.src, with the arguments in sys.argv; the others in a new process.
+COMMANDS = {
+    # shell scripts
+    "apply_blacklist":          (PATHSHELL, "apply_blacklist.sh", None),
+    "build-db":                 (PATHSHELL, "build-db.sh", None),
+    "build-db_BL":              (PATHSHELL, "build-db_BL.sh", None),
+    "build-db_cc":              (PATHSHELL, "build-db_cc.sh", None),
+    "generate_blacklist":       (PATHSHELL, "generate_blacklist.sh", None),
+    "get_ref_genome":           (PATHSHELL, "get_ref_genome.sh", None),
+    "makedirs":                 (PATHSHELL, "makedirs.sh", None),
+    "melt_secs_parallel":       (PATHSHELL, "melt_secs_parallel.sh", None),
+    "pipeline":                 (PATHSHELL, "pipeline.sh", None),
+    "pipeline_exclude":         (PATHSHELL, "pipeline_exclude.sh", None),
+    "probe-query":              (PATHSHELL, "probe-query.sh", None),
+    "run_nHUSH":                (PATHSHELL, "run_nHUSH.sh", None),
+    "run_nHUSH_excl":           (PATHSHELL, "run_nHUSH_excl.sh", None),
+    "show":                     (PATHSHELL, "show.sh", None),
+    "test_shell":               (PATHSHELL, "test_shell.sh", None),
+    "unfinished_HUSH":          (PATHSHELL, "unfinished_HUSH.sh", None),
+    "validation_oldHUSH_BLAST": (PATHSHELL, "validation_oldHUSH_BLAST.sh", None),
+    # python scripts
+    "HUSH_feedback":            (PATHSRC, "HUSH_feedback.py", None),
+    "abundance_filter":         (PATHSRC, "abundance_filter.py", "main"),
+    "abundant_kmers":           (PATHSRC, "abundant_kmers.py", "main"),
+    "blacklist_filter":         (PATHSRC, "blacklist_filter.py", "main"),
+    "cycling_query":            (PATHSRC, "cycling_query.py", "cycling_query"),
+    "download_chromosomes":     (PATHSRC, "download_chromosomes.py", "download_ref_genome"),
+    "escafish_score":           (PATHSRC, "escafish_score.py", None),
+    "exclude_region":           (PATHSRC, "exclude_region.py", "exclude_region"),
+    "fm_index":                 (PATHSRC, "fm_index.py", "main"),
+    "generate_exclude":         (PATHSRC, "generate_exclude.py", "generate_exclude"),
+    "get_oligos":               (PATHSRC, "get_oligos.py", None),
+    "melt_secs":                (PATHSRC, "melt_secs.py", "main"),
+    "nhush_driver":             (PATHSRC, "nhush_driver.py", "main"),
+    "prefilter":                (PATHSRC, "prefilter.py", "main"),
+    "prepare_input":            (PATHSRC, "prepare_input.r", None),
+    "probe_metrics":            (PATHSRC, "probe_metrics.py", None),
+    "probe_query":              (PATHSRC, "probe_query.py", "main"),
+    "reform_hush":              (PATHSRC, "reform_hush.py", None),
+    "reform_hush_combined":     (PATHSRC, "reform_hush_combined.py", None),
+    "reform_hush_consec":       (PATHSRC, "reform_hush_consec.py", None),
+    "run":                      (PATHSRC, "run.py", "main"),
+    "seed_hush":                (PATHSRC, "seed_hush.py", "main"),
+    "select_probe":             (PATHSRC, "select_probe.py", None),
+    "split_fasta":              (PATHSRC, "split_fasta.py", None),
+    "summarize_probes":         (PATHSRC, "summarize_probes.py", "summarize_probes"),
+    "summarize_probes_cumul":   (PATHSRC, "summarize_probes_cumul.py", "summarize_probes_cumul"),
+    "summarize_probes_final":   (PATHSRC, "summarize_probes_final.py", "summarize_probes_final"),
+    "test":                     (PATHSRC, "test.py", None),
+    "thermo_cache":             (PATHSRC, "thermo_cache.py", "main"),
+    "tm_engine":                (PATHSRC, "tm_engine.py", "main"),
+    "validate_probes":          (PATHSRC, "validate_probes.py", "main"),
+    # jupyter notebooks
+    "plot_oligos":              (PATHNOTEBOOK, "plot_oligos.ipynb", None),
+    "plot_probe_candidates":    (PATHNOTEBOOK, "plot_probe_candidates.ipynb", None),
+    "plot_probes":              (PATHNOTEBOOK, "plot_probes.ipynb", None),
+}
 
 def show_available() -> None:
     # ANSI escape codes for text color
@@ -38,7 +79,7 @@ def show_available() -> None:
 
     print("Available scripts:\n")
 
-    for c, s in zip(ALL_COMMANDS, ALL_SCRIPTS):
+    for c, (_, s, _) in COMMANDS.items():
         colored_c = f"{green_code}{c}{reset_code}"
         colored_s = f"{blue_code}{s}{reset_code}"
         print(f"{colored_c:<{35}}---> ({colored_s})")
@@ -46,33 +87,46 @@ def show_available() -> None:
     return None
 
 
-def run_command(command:str,script_arguments)->None:
-    if command in shell_scripts_no_ext: # bash scripts
-        subprocess.run(["bash",os.path.join(PATHSHELL, command+".sh"),*script_arguments])
-    elif command in py_scripts_no_ext: # python scripts
-        subprocess.run([sys.executable, os.path.join(PATHSRC, command+".py"),*script_arguments])
-    elif command in notebook_scripts_no_ext: # jupyter notebooks
-        subprocess.run(["jupyter", "execute", os.path.join(PATHNOTEBOOK, command+".ipynb"),*script_arguments])
-    else:
+def run_entry(script:str, entry:str, script_arguments)->int:
+    # as `python script args`, without starting another interpreter
+    module = importlib.import_module(".src."+script.split(".")[0], __package__)
+    sys.argv = [os.path.join(PATHSRC, script), *script_arguments]
+    getattr(module, entry)()     # click commands exit with their status themselves
+    return 0
+
+
+def run_command(command:str,script_arguments)->int:
+    if command not in COMMANDS:
         print("Command not found. Please check below for the available commands.")
         show_available()
-    
-    return None
+        return 1
+
+    folder, script, entry = COMMANDS[command]
+    path = os.path.join(folder, script)
+    if script.endswith(".sh"): # bash scripts
+        return subprocess.run(["bash",path,*script_arguments]).returncode
+    elif script.endswith(".ipynb"): # jupyter notebooks
+        return subprocess.run(["jupyter", "execute", path,*script_arguments]).returncode
+    elif script.endswith(".r"): # R scripts
+        return subprocess.run(["Rscript", path,*script_arguments]).returncode
+    elif entry is not None and __package__: # python scripts with an entry point
+        return run_entry(script, entry, script_arguments)
+    else: # other python scripts
+        return subprocess.run([sys.executable, path,*script_arguments]).returncode
 
 
 def main():
-    if len(sys.argv) == 1:
-        print("Please specify a command. Check below for the available commands.")
+    if len(sys.argv) == 1 or sys.argv[1] in ["-h", "--help"]:
+        if len(sys.argv) == 1:
+            print("Please specify a command. Check below for the available commands.")
         print("Usage: prb <command> [arguments...]")
         show_available()
         return
     else:
         command = sys.argv[1]
         script_arguments = sys.argv[2:]
-        run_command(command, script_arguments)
-    
-    return
+        sys.exit(run_command(command, script_arguments))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -16,6 +16,8 @@ Help()
    echo "L     kmer length"
    echo "c     Min abundance of an oligo to be included in the blacklist"
    echo "d     Minimum Hamming distance to any oligo in the blacklist."
+   echo "E     Engine: escafish (default) or python (in-package, multi-core, bl_dist written in place)"
+   echo "t     Number of processes for the python engine (default: 1)"
    echo ""
    echo "Options:"
    echo "h     Show help"
@@ -26,12 +28,17 @@ Help()
 length=40
 cutoff=100
 hamdist=9
+engine=escafish
+threads=1
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 
-while getopts "d:L:c:h" flag; do
+while getopts "d:L:c:E:t:h" flag; do
    case "${flag}" in
       d) hamdist=${OPTARG};;
       L) length=${OPTARG};;
       c) cutoff=${OPTARG};;
+      E) engine=${OPTARG};;
+      t) threads=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -43,6 +50,13 @@ done
 
 data=$PWD'/data'
 BLfolder="$data"/blacklist/
+
+if [ "$engine" = python ]
+then
+   python3 "$srcpath"/blacklist_filter.py -L "$length" -c "$cutoff" -d "$hamdist" -t "$threads" --dbfolder "$data"/db_tsv --blfolder "$BLfolder"
+   echo "Done!"
+   exit
+fi
    
 for dbfile in "$data"/db_tsv/db*.tsv
    do 
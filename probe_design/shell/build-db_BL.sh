@@ -21,6 +21,8 @@ Help()
    echo "m     Longest consecutive match allowed (default: 24 nt)"
    echo "i     Longest homopolymer allower (default: 6 nt)"
    echo "T     Target melting temperature (default: 72C)"
+   echo "E     Blacklist engine: escafish (default) or python (in-package, multi-core)"
+   echo "t     Number of processes for the python blacklist engine (default: 1)"
    echo ""
    echo "Options:"
    echo "h     Show help"
@@ -35,8 +37,11 @@ scoref="q_bl"
 maxconsec=24
 maxid=6
 targetTemp=72
+engine=escafish
+threads=1
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 
-while getopts "d:L:c:f:m:i:T:h" flag; do
+while getopts "d:L:c:f:m:i:T:E:t:h" flag; do
    case "${flag}" in
       d) hamdist=${OPTARG};;
       L) length=${OPTARG};;
@@ -45,6 +50,8 @@ while getopts "d:L:c:f:m:i:T:h" flag; do
       m) maxconsec=${OPTARG};;
       i) maxid=${OPTARG};;
       T) targetTemp=${OPTARG};;
+      E) engine=${OPTARG};;
+      t) threads=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -90,6 +97,10 @@ mkdir db_tsv
 for d in db_temp1/*; do echo $d; sed -r 's/'$'\t''111([0-9]+)987([0-9]+)'$'\t''/'$'\t''\1'$'\t''\2'$'\t''/' $d | sed -r $'s/off_target_no\t/off_target_no\toff_target_sum\t/' > db_temp2/$(basename $d); done
 
 echo "Comparing oligo database to blacklist"
+if [ "$engine" = python ]
+then
+   python3 "$srcpath"/blacklist_filter.py -L "$length" -c "$cutoff" -d "$hamdist" -t "$threads" --dbfolder db_temp2 --blfolder "$BLfolder" --suffix .bl_filtered.fa
+else
 for dbfile in db_temp2/db*.tsv
    do 
       roi=`echo $(basename -- "$dbfile") | sed 's/.*.\(roi_[0-9]\+\).*/\1\.fa/'`
@@ -102,6 +113,7 @@ for dbfile in db_temp2/db*.tsv
          escafish apply_blacklist --db "$dbfile" --bl "$genomeBL"   
       fi
 done      
+fi
 
 echo "Attributing oligo score."
 echo "Using the following score function: $scoref"
@@ -14,6 +14,10 @@ Help()
    echo "Arguments:"
    echo "L     kmer length"
    echo "c     Min abundance of an oligo to be included in the blacklist"
+   echo "E     Engine: nhush (default) or python (in-package, bounded memory)"
+   echo "t     Number of processes for the python engine (default: 1)"
+   echo "M     Memory limit in GB for the python engine (default: 4)"
+   echo "      The python engine derives the masked genome blacklists from the counts of genome.fa"
    echo ""
    echo "Options:"
    echo "h     Show help"
@@ -23,11 +27,18 @@ Help()
 # Variables
 length=40
 cutoff=100
+engine=nhush
+threads=1
+memory=4
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 
-while getopts "L:c:h" flag; do
+while getopts "L:c:E:t:M:h" flag; do
    case "${flag}" in
       L) length=${OPTARG};;
       c) cutoff=${OPTARG};;
+      E) engine=${OPTARG};;
+      t) threads=${OPTARG};;
+      M) memory=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -43,6 +54,11 @@ mkdir "$data"/blacklist
    
 for genomefile in "$data"/ref/genome*.fa
    do 
-      nhush find-abundant --file "$genomefile" --length "$length" --threshold "$cutoff" --out ./data/blacklist/$(basename -- "$genomefile").abundant_L"$length"_T"$cutoff".fa
+      if [ "$engine" = python ]
+      then
+         python3 "$srcpath"/abundant_kmers.py -L "$length" -c "$cutoff" -t "$threads" -M "$memory" -o ./data/blacklist --derive "$genomefile"
+      else
+         nhush find-abundant --file "$genomefile" --length "$length" --threshold "$cutoff" --out ./data/blacklist/$(basename -- "$genomefile").abundant_L"$length"_T"$cutoff".fa
+      fi
 done      
 echo "Done!"
\ No newline at end of file
@@ -1,6 +1,7 @@
 #!/bin/bash
 
 data=$PWD'/data'
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 cd $data
 suffix='Reference'
 if [ ! -z "$1" ]
@@ -10,6 +11,12 @@ case "$1" in
 	RNA) suffix="RevCompl";;
 esac
 fi
+# melting temperature engine: melt_duplex (default) or python (in-package, tm_engine.py)
+engine='melt_duplex'
+if [ ! -z "$2" ]
+then
+	engine="$2"
+fi
 mkdir melt
 mkdir secs
 
@@ -21,13 +28,22 @@ set -m
 process () {
     local file=$1
     cd $data
-    echo "Calculating melting temperatures"
-    melt_duplex -C -t DNA:DNA -o 0.05e-6 -n 1.04 -f 50 $file > "$data"/melt/$(basename $file) 2>/dev/null 
+    if [ "$engine" != python ]
+    then
+        echo "Calculating melting temperatures"
+        melt_duplex -C -t DNA:DNA -o 0.05e-6 -n 1.04 -f 50 $file > "$data"/melt/$(basename $file) 2>/dev/null 
+    fi
     cd "$data"/secs
     echo "Calculating secondary structures"
     hybrid-ss-min -n DNA -N 1.04 $file >/dev/null 2>&1
 }
 
+# all ROIs at once, vectorized
+if [ "$engine" = python ]
+then
+    python3 "$srcpath"/tm_engine.py -C -t DNA:DNA -o 0.05e-6 -n 1.04 -f 50 --outfolder "$data"/melt "$data"/candidates/*"$suffix".fa
+fi
+
 for f in "$data"/candidates/*"$suffix".fa; do process "$f" & done
 # Wait for all parallel jobs to finish
 wait
@@ -16,12 +16,17 @@ mkdir HUSH
 # 1. Reformat input
 Rscript ./src/prepare_input.r
 
+# steps 3 to 8 and the summary can also be run at once, only what is out of date (per ROI):
+# python ./src/run.py -d DNA -L 40 -l 21 -m 3 -t 8 -j 5 -q "-greedy -stepdown 10"
+
 # 2. Generate black list of abundantly repeated oligos for each reference genome
 bash ./shell/generate_blacklist.sh -L 40 -c 100
 # only needs to be run once for a given reference genome
 
 # 3. Retrieve sequences and extract k-mers
 python ./src/get_oligos.py DNA/RNA [applyGCfilter 0/1] [extfolder] # RNA assumes already existing transcript sequences. Default> DNA
+# optional: drop the k-mers failing the hard filters (homopolymers, N, dinucleotide repeats, blacklist)
+python ./src/prefilter.py -i 6 -r 5 -c 100
 
 # 4. Run nHUSH and reconstitute into full-length oligos if using sublength hashing
 bash ./shell/run_nHUSH.sh -d DNA -L 40 -l 21 -m 3 -t 40 -i 14 # 40 threads for max perf. Add -g for genome ref
@@ -29,12 +34,15 @@ bash ./shell/run_nHUSH.sh -d RNA -L 35 -m 5 -t 40 -i 14
 
 # only in case HUSH didn't finish successfully
 bash ./shell/unfinished_HUSH.sh
+# or, resumable (skips the ROIs already done) with the ROIs sharing the threads
+python ./src/nhush_driver.py -d DNA -L 40 -l 21 -m 3 -t 40 -i 14
 
 # 5. Recapitulate HUSH results
 python ./src/reform_hush_combined.py DNA|RNA|-RNA length sublength until
 
 # 6. Calculate secondary structures and melting temperature
 bash ./shell/melt_secs_parallel.sh DNA|RNA
+# or, with at most 64 jobs at the same time, resumable: python ./src/melt_secs.py DNA|RNA -j 64
 
 # 7. Create database and convert to TSV for querying. Attribute score to each oligo
 bash ./shell/build-db.sh q_combined 32 6 70 #(optional score function: q/q_combined, default: q)
@@ -37,7 +37,7 @@ bash ./shell/run_nHUSH_excl.sh -d DNA -L 40 -l 21 -m 3 -t 40 -i 14 # 40 threads
 bash ./shell/unfinished_HUSH.sh
 
 # 7. only if using sublength:
-python ./src/reform_hush_combined.py DNA|RNA|-RNA length sublength until
+python ./src/reform_hush_combined.py DNA|RNA|-RNA length sublength until nhush|fmindex excl
 
 # 8. Calculate secondary structures and melting temperature
 bash ./shell/melt_secs_parallel.sh DNA|RNA
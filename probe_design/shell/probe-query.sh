@@ -16,12 +16,14 @@ Help()
    echo "-e specific ROI to query"
    echo "If not provided, querying all ROIs listed in all_regions.tsv"
    echo "-g Greedy probe query, speed > quality"
+   echo "-r Run folder (cycling_query -rundir) with the filtered databases and the outputs"
+   echo "If not provided, ./data"
    echo "-h display help"
 }
 
 greedy=''
 
-while getopts "L:p:o:s:e:l:hg" flag; do
+while getopts "L:p:o:s:e:l:r:hg" flag; do
    case "${flag}" in
       L) length=${OPTARG};;
       p) pw=${OPTARG};;
@@ -29,6 +31,7 @@ while getopts "L:p:o:s:e:l:hg" flag; do
       s) type=${OPTARG};;
       e) probe=${OPTARG};;
       g) greedy='--greedy';;
+      r) rundir=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -40,7 +43,11 @@ while getopts "L:p:o:s:e:l:hg" flag; do
 done
 
 expfolder="$PWD/data"
-input="$expfolder/db_tsv"
+if [ -z "$rundir" ]
+then
+    rundir="$expfolder"
+fi
+input="$rundir/db_tsv"
 suffix='Reference'
 if [ ! -z "$type" ]
 then 
@@ -56,12 +63,12 @@ randomid=$( cat /dev/urandom | tr -cd '0-9' | head -c 6 )       # to avoid folde
 #output="$expfolder/probe_candidates/query_output_t_$ts""-$randomid""_p_$pwi"
 if [ -z $oligos ]
 then
-    output="$expfolder/probe_candidates/query_output_t_$ts"   
+    output="$rundir/probe_candidates/query_output_t_$ts"   
 else
-    output="$expfolder/probe_candidates/query_output_o_$oligos""_t_$ts"
+    output="$rundir/probe_candidates/query_output_o_$oligos""_t_$ts"
 fi
 
-mkdir "$expfolder/probe_candidates"
+mkdir "$rundir/probe_candidates"
 mkdir $output
 
 
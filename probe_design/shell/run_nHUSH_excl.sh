@@ -21,6 +21,9 @@ Help()
    echo "m     Max number of mismatches being investigated"
    echo "t     Number of threads used for computing"
    echo "i     Initial hash length"
+   echo "E     Engine: nhush (default) or python (in-package seed index, no nhush needed)"
+   echo "a     Abundance of the blacklist (generate_blacklist -c): sublength oligos found in it are not searched (optional)"
+   echo "x     Max consecutive match of the scoring function, with -a (default: 32)"
    echo
    echo "Options:"
    echo "h     Display help"
@@ -32,8 +35,11 @@ Help()
 # Variables
 skip=false
 gen=false
+engine=nhush
+maxconsec=32
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 
-while getopts "f:L:l:m:t:i:d:s:hgcp" flag; do
+while getopts "f:L:l:m:t:i:d:s:E:a:x:hgcp" flag; do
    case "${flag}" in
       f) exppath=${OPTARG};;
       d) fishtype=${OPTARG};;
@@ -43,6 +49,9 @@ while getopts "f:L:l:m:t:i:d:s:hgcp" flag; do
       m) mismatch=${OPTARG};;
       t) threads=${OPTARG};;
       i) inhash=${OPTARG};;
+      E) engine=${OPTARG};;
+      a) abundance=${OPTARG};;
+      x) maxconsec=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -85,6 +94,11 @@ fi
 echo "Mismatches: $mismatch"
 echo "Threads: $threads"
 echo "Hash length: $inhash"
+echo "Engine: $engine"
+if [ ! -z "$abundance" ]
+then
+	echo "Abundance prefilter: blacklist of cutoff $abundance, max consecutive match $maxconsec"
+fi
 
 if $gen
 then
@@ -124,7 +138,21 @@ if [ ! -z "$sublength" ]
 then
    if ! $skip
 	then
-		for d in "$datapath"/candidates/*"$suffix".fa; do nhush fasplit --length "$length" --sub-length "$sublength" --file "$d"; done
+		for d in "$datapath"/candidates/*"$suffix".fa; do
+			if [ "$engine" = python ]
+			then
+				python3 "$srcpath"/seed_hush.py --fasplit -q "$d" -L "$length" -l "$sublength"
+			else
+				nhush fasplit --length "$length" --sub-length "$sublength" --file "$d"
+			fi
+			# prefilter of an earlier run, for the previous query
+			rm -f "$d"."$sublength"mers.abundant.npz
+		done
+		if [ ! -z "$abundance" ]
+		then
+			python3 "$srcpath"/abundance_filter.py -L "$length" -l "$sublength" -c "$abundance" -x "$maxconsec" -s "$suffix" -e \
+				--candfolder "$datapath"/candidates --blfolder "$datapath"/blacklist
+		fi
 	fi
 	for d in "$datapath"/regions/*.fa
         do
@@ -137,7 +165,18 @@ then
             then
                 genfile=genome.fa
             fi
-            nhush --hash "$inhash" --length "$sublength" --until "$mismatch" --threads "$threads" --external "$oligolist" --file "$genfile" --sfp
+            if [ ! -s "$oligolist" ]
+            then
+                # all sublength oligos left out by the abundance prefilter
+                : > "$oligolist".nh.L"$sublength".mindist.uint8
+                continue
+            fi
+            if [ "$engine" = python ]
+            then
+            	python3 "$srcpath"/seed_hush.py --mindist -q "$oligolist" -r "$genfile" -L "$sublength" -m "$mismatch" -t "$threads"
+            else
+            	nhush --hash "$inhash" --length "$sublength" --until "$mismatch" --threads "$threads" --external "$oligolist" --file "$genfile" --sfp
+            fi
             #nhush dump-mindist "$d" "$d".mindist.uint8 "$sublength"
 	    done
     # reshape FASTA files in place
@@ -158,7 +197,12 @@ else
             then
                 genfile=genome.fa
             fi
-			nhush --hash "$inhash" --length "$length" --until "$mismatch" --threads "$threads" --external "$oligolist" --file "$genfile" --sfp
+			if [ "$engine" = python ]
+			then
+				python3 "$srcpath"/seed_hush.py --mindist -q "$oligolist" -r "$genfile" -L "$length" -m "$mismatch" -t "$threads"
+			else
+				nhush --hash "$inhash" --length "$length" --until "$mismatch" --threads "$threads" --external "$oligolist" --file "$genfile" --sfp
+			fi
 			#nhush dump-mindist "$d" "$d".mindist.uint8 "$length"		
 		done
     # reshape FASTA files in place
@@ -20,6 +20,7 @@ Help()
    echo "m     Max number of mismatches being investigated"
    echo "t     Number of threads used for computing"
    echo "e     Exclude mode"
+   echo "E     Engine: hushp (default) or python (in-package seed index, no hushp needed)"
    echo
    echo "Options:"
    echo "h     Display help"
@@ -30,14 +31,17 @@ Help()
 # Variables
 gen=false
 exclude=false
+engine=hushp
+srcpath="$(cd "$(dirname "${BASH_SOURCE[0]}")"/../src && pwd)"
 
-while getopts "f:L:m:t:he" flag; do
+while getopts "f:L:m:t:E:he" flag; do
    case "${flag}" in
       f) exppath=${OPTARG};;
       L) length=${OPTARG};;
       m) mismatch=${OPTARG};;
       t) threads=${OPTARG};;
       e) exclude=true;;
+      E) engine=${OPTARG};;
       h) # display Help
          Help
          exit;;
@@ -110,7 +114,12 @@ do
       genomeroi="genome.fa"
    fi   
    queryfolder="$datapath"/selected_probes/$(basename $pfa .fa)_split_mm_$mismatch
-   hushp -l $length -t $threads -r "$datapath"/ref/$genomeroi -q $queryfolder -m $mismatch -f 0 -C --verbose 1
+   if [ "$engine" = python ]
+   then
+      python3 "$srcpath"/seed_hush.py -L $length -t $threads -r "$datapath"/ref/$genomeroi -q $queryfolder -m $mismatch
+   else
+      hushp -l $length -t $threads -r "$datapath"/ref/$genomeroi -q $queryfolder -m $mismatch -f 0 -C --verbose 1
+   fi
 done
 wait
 echo 'Exporting results'
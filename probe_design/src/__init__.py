@@ -1,19 +1,13 @@
-# Expose the following functions to the main package
-from .cycling_query import cycling_query
-from .escafish_score import escafish_score
-from .exclude_region import exclude_region
-from .generate_exclude import generate_exclude
-from .get_oligos import get_oligos
-from .HUSH_feedback import HUSH_feedback
-from .reform_hush_combined import reform_hush_combined
-from .reform_hush_consec import reform_hush_consec
-from .reform_hush import reform_hush
-from .select_probe import select_probe
-from .split_fasta import split_fasta
-from .summarize_probes_cumul import summarize_probes_cumul
-from .summarize_probes_final import summarize_probes_final
-from .summarize_probes import summarize_probes
-from .download_chromosomes import download_chr_list, download_chr, download_ref_genome
+# Expose the following functions to the main package. Their modules are only imported on
+# first use (module __getattr__), so that `import probe_design` and prb itself do not load
+# pandas, Biopython, joblib... Each function lives in the module of the same name, except:
+import sys
+import types
+import importlib
+
+_modules = {"download_chr_list": "download_chromosomes",
+            "download_chr": "download_chromosomes",
+            "download_ref_genome": "download_chromosomes"}
 
 
 __all__ = ["cycling_query",
@@ -32,7 +26,44 @@ __all__ = ["cycling_query",
             "summarize_probes",
             "download_chr_list",
             "download_chr",
-            "download_ref_genome"]
+            "download_ref_genome",
+            "probe_query",
+            "probe_metrics",
+            "validate_probes",
+            "seed_hush",
+            "fm_index",
+            "blacklist_filter",
+            "abundant_kmers",
+            "tm_engine",
+            "melt_secs",
+            "thermo_cache",
+            "prefilter",
+           "abundance_filter",
+           "run",
+           "nhush_driver"]
+
+
+def __getattr__(name:str):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module("."+_modules.get(name, name), __name__)
+    globals()[name] = getattr(module, name)
+    return globals()[name]
+
+
+def __dir__()->list[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name:str, value)->None:
+        # importing a submodule binds it on the package: keep the function of the same name instead
+        if name in __all__ and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
 
 import os
 # PATHMAIN is different from main init file
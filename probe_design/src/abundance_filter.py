@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+# Abundance prefilter before the sublength nHUSH run. A sublength l-mer contained in an
+# abundant L-mer of the blacklist (generate_blacklist, at least c >= 2 occurrences) occurs
+# elsewhere in the genome: its nhush --sfp min distance is 0, no need to search it.
+# The l-mers of the blacklist are kept as a sorted array of 2-bit packed l-mers (l <= 32).
+#   - l-mers found in it are removed from the nHUSH query (<candidates>.<l>mers) and get distance 0,
+#   - candidates with a run of such l-mers longer than max_consec (consecutive match > max_consec,
+#     cost 1e10 in the scoring functions) are removed from the query altogether; their other
+#     l-mers get the sentinel distance 255, set to until+1 by reform_hush_combined.
+# Which l-mers were searched and the known distances are stored in <candidates>.<l>mers.abundant.npz,
+# from which reform_hush_combined rebuilds the full mindist array, with the checksum of the query
+# written: the npz of an earlier run with the prefilter is ignored once the query is split again.
+
+import numpy as np
+import os
+import glob
+import hashlib
+import click
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta
+    from .blacklist_filter import roi_blacklist
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta
+    from blacklist_filter import roi_blacklist
+
+sentinel = 255
+
+lookup = np.full(256, 4, dtype=np.uint8)     # A C G T -> 0 1 2 3, anything else -> 4
+for base, code in zip(b'ACGTacgt', [0, 1, 2, 3]*2):
+    lookup[base] = code
+
+
+def pack_lmers(sequences:list[str], sublength:int)->tuple[np.ndarray,np.ndarray]:
+    # 2-bit packed l-mers of same-length sequences, sequence-major, and whether they are valid
+    if len(sequences) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    length = len(sequences[0])
+    codes = lookup[np.frombuffer(''.join(sequences).encode(), dtype=np.uint8)].reshape(len(sequences), length)
+    w = length - sublength + 1
+    values = np.zeros((len(sequences), w), dtype=np.uint64)
+    valid = np.ones((len(sequences), w), dtype=bool)
+    for j in range(sublength):
+        values = (values << np.uint64(2)) | (codes[:, j:j+w] & 3).astype(np.uint64)
+        valid &= codes[:, j:j+w] < 4
+    return values.ravel(), valid.ravel()
+
+
+def abundant_lmers(blacklist:os.PathLike, length:int, sublength:int, batch:int=1<<20)->np.ndarray:
+    # sorted unique l-mers of the abundant L-mers (both orientations are in the blacklist)
+    _, entries = read_fasta(blacklist)
+    entries = [seq for seq in entries if len(seq) == length]
+    lmers = np.zeros(0, dtype=np.uint64)
+    for k in range(0, len(entries), batch):
+        values, valid = pack_lmers(entries[k:k+batch], sublength)
+        lmers = np.union1d(lmers, values[valid])
+    return lmers
+
+
+def checksum(path:os.PathLike)->str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1<<20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def consecutive_hits(hit:np.ndarray)->np.ndarray:
+    # longest run of True per row
+    longest = np.zeros(len(hit), dtype=np.int64)
+    run = np.zeros(len(hit), dtype=np.int64)
+    for j in range(hit.shape[1]):
+        run = np.where(hit[:, j], run + 1, 0)
+        longest = np.maximum(longest, run)
+    return longest
+
+
+def filter_lmers(lmerfile:os.PathLike, lmers:np.ndarray, length:int, sublength:int,
+                 max_consec:int=32)->tuple[int,int,int]:
+    # rewrites the l-mer query without the l-mers of known distance.
+    # Returns the number of candidates left out, of candidates, and of l-mers still searched
+    names, seqs = read_fasta(lmerfile)
+    w = length - sublength + 1
+    values, valid = pack_lmers([seq.upper() for seq in seqs], sublength)
+    hit = (valid & np.isin(values, lmers)).reshape(-1, w)
+    hopeless = sublength + consecutive_hits(hit) - 1 > max_consec
+
+    known = np.where(hit, 0, sentinel).astype(np.uint8)
+    queried = ~hit & ~hopeless[:, None]
+    with open(lmerfile+'.tmp', 'w') as f:
+        f.writelines(f">{names[k]}\n{seqs[k]}\n" for k in np.flatnonzero(queried.ravel()))
+    np.savez(lmerfile+'.abundant.tmp.npz', queried=queried.ravel(), known=known.ravel(), checksum=checksum(lmerfile+'.tmp'))
+    os.replace(lmerfile+'.abundant.tmp.npz', lmerfile+'.abundant.npz')
+    os.replace(lmerfile+'.tmp', lmerfile)
+    return int(hopeless.sum()), len(hopeless), int(queried.sum())
+
+
+def expand_mindist(hush:os.PathLike, lmerfile:os.PathLike)->np.ndarray:
+    # mindist of all l-mers, from the searched ones and the known ones
+    mindist = np.fromfile(hush, 'uint8')
+    if not os.path.exists(lmerfile+'.abundant.npz'):
+        return mindist
+    prefilter = np.load(lmerfile+'.abundant.npz')
+    if str(prefilter['checksum']) != checksum(lmerfile):
+        # query split again since, without the prefilter
+        return mindist
+    if prefilter['queried'].sum() != len(mindist):
+        raise RuntimeError(f"{len(mindist)} min distances in {os.path.basename(hush)} for {prefilter['queried'].sum()} searched l-mers.")
+    full = prefilter['known'].copy()
+    full[prefilter['queried']] = mindist
+    return full
+
+
+def abundance_filter(length:int=40, sublength:int=21, cutoff:int=100, max_consec:int=32, suffix:str='Reference',
+                     excl:bool=False, candfolder:os.PathLike='./data/candidates',
+                     blfolder:os.PathLike='./data/blacklist')->None:
+    # all <candidates>.<l>mers query files of the candfolder
+    cached = {}
+    for lmerfile in tqdm(sorted(glob.glob(os.path.join(candfolder, f"*{suffix}.fa.{sublength}mers"))), desc="Abundance prefilter"):
+        if excl:
+            blacklist = roi_blacklist(lmerfile, blfolder, length, cutoff)
+        else:
+            blacklist = os.path.join(blfolder, f"genome.fa.abundant_L{length}_T{cutoff}.fa")
+        if blacklist not in cached:
+            cached[blacklist] = abundant_lmers(blacklist, length, sublength)
+        hopeless, total, queried = filter_lmers(lmerfile, cached[blacklist], length, sublength, max_consec)
+        print(f"{os.path.basename(lmerfile)}: {hopeless} of {total} candidates left out, {queried} of "
+              f"{total*(length-sublength+1)} sublength oligos searched.")
+
+
+@click.command(
+    name="abundance_filter",
+    help="Remove from the sublength nHUSH query the l-mers found in abundant oligos of the blacklist, "
+         "and the candidates with a match longer than max_consec in them."
+)
+@click.option('-L', '--length', type=click.INT, default=40, help="Oligo length (as generate_blacklist -L).")
+@click.option('-l', '--sublength', type=click.INT, default=21, help="Sublength used for nHUSH.")
+@click.option('-c', '--cutoff', type=click.INT, default=100, help="Abundance of the blacklist (generate_blacklist -c).")
+@click.option('-x', '--maxconsec', type=click.INT, default=32, help="Max consecutive match of the scoring function (build-db -m).")
+@click.option('-s', '--suffix', type=click.Choice(['Reference', 'RevCompl']), default='Reference')
+@click.option('-e', '--excl', is_flag=True, help="Exclusion mode: blacklist of the masked genome of each ROI.")
+@click.option('--candfolder', type=click.Path(exists=True), default='./data/candidates')
+@click.option('--blfolder', type=click.Path(exists=True), default='./data/blacklist')
+def main(length:int, sublength:int, cutoff:int, maxconsec:int, suffix:str, excl:bool, candfolder:str, blfolder:str)->None:
+    if sublength > 32:
+        raise click.BadParameter("the sublength oligos are packed in 64 bits, at most 32 nt.")
+    abundance_filter(length, sublength, cutoff, maxconsec, suffix, excl, candfolder, blfolder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+
+# In-package replacement for `nhush find-abundant`: L-mers occurring at least c times in a
+# genome (both strands), written to data/blacklist/<genome>.abundant_L<L>_T<c>.fa.
+# The genome is streamed in chunks: canonical L-mers (2 uint64 words, L <= 64) are
+# partitioned by their minimizer into on-disk buckets, and the buckets are then counted
+# in parallel, one sort per bucket. The number of buckets follows from the memory limit,
+# so that `threads` buckets can be counted at the same time within it. Buckets that still
+# outgrow their share (repeats sharing a minimizer) are split again by a hash of the L-mers.
+# The counts of the abundant L-mers are kept (<blacklist>.counts.npz): in exclusion mode, the
+# blacklist of genome_roi_N.fa is derived from them by subtracting the L-mers of the
+# intervals masked by data/exclude/excl_roi_N.bed, instead of counting the genome again.
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import glob
+import shutil
+import click
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+codes = np.full(256, 4, dtype=np.uint8)        # A C G T -> 0 1 2 3, anything else (N) -> 4
+for base, code in zip(b'ACGTacgt', [0, 1, 2, 3]*2):
+    codes[base] = code
+bytes_per_kmer = 64     # peak memory per L-mer while counting a bucket
+
+
+def pack_kmers(sequence:np.ndarray, length:int)->tuple[np.ndarray,np.ndarray,np.ndarray]:
+    # forward and reverse complement L-mers at every position, (n, 2) uint64 each, and validity
+    n = len(sequence) - length + 1
+    forward = np.zeros((n, 2), dtype=np.uint64)
+    reverse = np.zeros((n, 2), dtype=np.uint64)
+    bases = (sequence & 3).astype(np.uint64)
+    for j in range(length):
+        word = j//32
+        forward[:, word] = (forward[:, word] << np.uint64(2)) | bases[j:j+n]
+        reverse[:, word] = (reverse[:, word] << np.uint64(2)) | (np.uint64(3) - bases[length-1-j:length-1-j+n])
+    invalid = np.concatenate([[0], np.cumsum(sequence > 3)])
+    valid = invalid[length:] == invalid[:n]
+    return forward, reverse, valid
+
+
+def canonical(forward:np.ndarray, reverse:np.ndarray)->np.ndarray:
+    # lexicographically smaller of the two strands
+    less = (forward[:, 0] < reverse[:, 0]) | ((forward[:, 0] == reverse[:, 0]) & (forward[:, 1] <= reverse[:, 1]))
+    return np.where(less[:, None], forward, reverse)
+
+
+def sliding_min(values:np.ndarray, window:int)->np.ndarray:
+    # min of every window of consecutive values, by doubling
+    out, span = values, 1
+    while 2*span <= window:
+        out = np.minimum(out[:-span], out[span:])
+        span *= 2
+    n = len(values) - window + 1
+    return np.minimum(out[:n], out[window-span:window-span+n])
+
+
+def minimizers(sequence:np.ndarray, length:int, m:int)->np.ndarray:
+    # hash of the canonical minimizer (m-mer) of every L-mer: the same for both strands
+    n = len(sequence) - m + 1
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    bases = (sequence & 3).astype(np.uint64)
+    for j in range(m):
+        forward = (forward << np.uint64(2)) | bases[j:j+n]
+        reverse = (reverse << np.uint64(2)) | (np.uint64(3) - bases[m-1-j:m-1-j+n])
+    hashes = np.minimum(forward, reverse)*np.uint64(0x9E3779B97F4A7C15) >> np.uint64(20)
+    return sliding_min(hashes, length - m + 1)
+
+
+def genome_chunks(path:os.PathLike, length:int, chunk:int):
+    # encoded sequence chunks of about chunk bases, consecutive chunks of a record overlapping by length-1
+    buffer, size = [], 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if size >= length:
+                    yield codes[np.frombuffer(b''.join(buffer), dtype=np.uint8)]
+                buffer, size = [], 0
+                continue
+            line = line.rstrip()
+            buffer.append(line)
+            size += len(line)
+            if size >= chunk:
+                sequence = b''.join(buffer)
+                yield codes[np.frombuffer(sequence, dtype=np.uint8)]
+                buffer, size = [sequence[len(sequence)-length+1:]], length-1
+    if size >= length:
+        yield codes[np.frombuffer(b''.join(buffer), dtype=np.uint8)]
+
+
+def partition(path:os.PathLike, length:int, buckets:int, tmpdir:os.PathLike,
+              chunk:int, m:int=12)->list[str]:
+    # canonical L-mers of the genome, appended to the bucket of their minimizer
+    files = [os.path.join(tmpdir, f"bucket_{b:05d}.u64") for b in range(buckets)]
+    for sequence in tqdm(genome_chunks(path, length, chunk), desc=f"Partitioning the {length}-mers of {os.path.basename(path)}"):
+        forward, reverse, valid = pack_kmers(sequence, length)
+        kmers = canonical(forward[valid], reverse[valid])
+        bucket = (minimizers(sequence, length, m)[valid] % np.uint64(buckets)).astype(np.int64)
+        order = np.argsort(bucket, kind='stable')
+        bounds = np.searchsorted(bucket[order], np.arange(buckets+1))
+        for b in np.flatnonzero(np.diff(bounds)):
+            with open(files[b], 'ab') as f:
+                kmers[order[bounds[b]:bounds[b+1]]].tofile(f)
+    return [file for file in files if os.path.exists(file)]
+
+
+def collapse(kmers:np.ndarray, counts:np.ndarray)->tuple[np.ndarray,np.ndarray]:
+    # distinct L-mers, with their summed counts
+    order = np.lexsort((kmers[:, 1], kmers[:, 0]))
+    kmers, counts = kmers[order], counts[order]
+    new = np.concatenate([[True], (kmers[1:] != kmers[:-1]).any(axis=1)]) if len(kmers) > 0 else np.zeros(0, dtype=bool)
+    starts = np.flatnonzero(new)
+    return kmers[starts], np.add.reduceat(counts, starts) if len(starts) > 0 else counts[:0]
+
+
+def count_bucket(path:os.PathLike, threshold:int, limit:int, level:int=0)->tuple[np.ndarray,np.ndarray]:
+    # L-mers of the bucket occurring at least threshold times, with their counts.
+    # limit: L-mers counted at once. A bucket over the limit (the L-mers of a repeat family share
+    # their minimizers) is read in pieces, each one collapsed to distinct L-mers and counts, which
+    # are split into sub-buckets by a hash of the whole L-mer and counted the same way.
+    # Top-level buckets hold L-mers (2 words), sub-buckets L-mers and counts (3 words)
+    width = 2 if level == 0 else 3
+    size = os.path.getsize(path)//(8*width)
+    if size <= limit or level >= 4:
+        records = np.fromfile(path, dtype=np.uint64).reshape(-1, width)
+        counts = records[:, 2].astype(np.int64) if level > 0 else np.ones(len(records), dtype=np.int64)
+        kmers, counts = collapse(records[:, :2], counts)
+        keep = counts >= threshold
+        return kmers[keep], counts[keep]
+
+    parts = int(np.ceil(size/limit))
+    files = [f"{path}.{level}_{p:04d}" for p in range(parts)]
+    for offset in range(0, size, limit):
+        records = np.fromfile(path, dtype=np.uint64, count=limit*width, offset=8*width*offset).reshape(-1, width)
+        counts = records[:, 2].astype(np.int64) if level > 0 else np.ones(len(records), dtype=np.int64)
+        kmers, counts = collapse(records[:, :2], counts)
+        mixed = (kmers[:, 0]*np.uint64(0x9E3779B97F4A7C15) ^ kmers[:, 1] ^ np.uint64(level+1))*np.uint64(0xBF58476D1CE4E5B9)
+        part = ((mixed >> np.uint64(32)) % np.uint64(parts)).astype(np.int64)
+        for p in np.unique(part):
+            with open(files[p], 'ab') as f:
+                np.column_stack([kmers[part == p], counts[part == p].astype(np.uint64)]).tofile(f)
+    os.remove(path)
+    results = [count_bucket(file, threshold, limit, level+1) for file in files if os.path.exists(file)]
+    return np.concatenate([kmers for kmers, _ in results]), np.concatenate([counts for _, counts in results])
+
+
+def decode(kmers:np.ndarray, length:int)->list[str]:
+    letters = np.zeros((len(kmers), length), dtype=np.uint8)
+    for j in range(length):
+        shift = 2*(min(length, 32*(j//32+1)) - 1 - j)
+        letters[:, j] = (kmers[:, j//32] >> np.uint64(shift)) & np.uint64(3)
+    return np.frombuffer(np.frombuffer(b'ACGT', dtype=np.uint8)[letters].tobytes(), dtype=f'S{length}').astype(str).tolist()
+
+
+def abundant_kmers(genome:os.PathLike, length:int=40, threshold:int=100, threads:int=1,
+                   memory:float=4, outfolder:os.PathLike='./data/blacklist',
+                   tmpdir:os.PathLike|None=None)->str:
+    # memory: GB available for counting (all threads) and for the partitioning chunks
+    if length > 64:
+        raise ValueError(f"L-mers are packed in two 64-bit words: length {length} > 64.")
+    budget = memory*1e9
+    buckets = max(1, int(np.ceil(2*os.path.getsize(genome)*bytes_per_kmer*threads/budget)))      # both strands, canonical
+    chunk = max(1<<20, int(budget/(8*bytes_per_kmer)))
+    os.makedirs(outfolder, exist_ok=True)
+    tmpdir = os.path.join(tmpdir if tmpdir is not None else outfolder, f"tmp_{os.path.basename(genome)}_L{length}")
+    os.makedirs(tmpdir, exist_ok=True)
+    try:
+        files = partition(genome, length, buckets, tmpdir, chunk)
+        limit = max(1<<16, int(budget/(threads*bytes_per_kmer)))      # L-mers per bucket and thread
+        results = Parallel(n_jobs=threads)(delayed(count_bucket)(file, threshold, limit)
+                                           for file in tqdm(files, desc="Counting the buckets"))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    out = os.path.join(outfolder, f"{os.path.basename(genome)}.abundant_L{length}_T{threshold}.fa")
+    kmers = np.concatenate([kmers for kmers, _ in results]) if len(results) > 0 else np.zeros((0, 2), dtype=np.uint64)
+    counts = np.concatenate([counts for _, counts in results]) if len(results) > 0 else np.zeros(0, dtype=np.int64)
+    np.savez(out[:-3]+'.counts.npz', kmers=kmers, counts=counts)
+    write_blacklist(kmers, counts, length, out)
+    return out
+
+
+def write_blacklist(kmers:np.ndarray, counts:np.ndarray, length:int, out:os.PathLike)->None:
+    with open(out, 'w') as f:
+        k = 0
+        # both orientations, so that oligos from either strand are compared to their repeat
+        for seq, count in zip(decode(kmers, length), counts):
+            rc = seq[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+            for oligo in dict.fromkeys([seq, rc]):
+                f.write(f">abundant_{k} count={count}\n{oligo}\n")
+                k += 1
+
+
+def masked_kmers(bed:os.PathLike, ref:os.PathLike, length:int)->np.ndarray:
+    # canonical L-mers overlapping the masked intervals (chromStart to chromEnd included,
+    # as in exclude_region), each genome position counted once
+    bd = pd.read_csv(bed, sep="\t", header=0)
+    kmers = []
+    for chrom, intervals in bd.groupby('chrom'):
+        path = os.path.join(ref, f"{chrom}.fa")
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            sequence = codes[np.frombuffer(b''.join(line.rstrip() for line in f if not line.startswith(b'>')), dtype=np.uint8)]
+        # start positions of the L-mers overlapping any interval, merged
+        starts = np.zeros(len(sequence) + 1, dtype=np.int64)
+        np.add.at(starts, np.maximum(intervals.chromStart.to_numpy() - length + 1, 0), 1)
+        np.add.at(starts, np.minimum(intervals.chromEnd.to_numpy() + 1, len(sequence)), -1)
+        covered = np.cumsum(starts)[:len(sequence) - length + 1] > 0
+        forward, reverse, valid = pack_kmers(sequence, length)
+        kmers.append(canonical(forward[covered & valid], reverse[covered & valid]))
+    return np.concatenate(kmers) if len(kmers) > 0 else np.zeros((0, 2), dtype=np.uint64)
+
+
+def masked_blacklist(table:os.PathLike, bed:os.PathLike, length:int, threshold:int,
+                     out:os.PathLike, ref:os.PathLike='./data/ref/')->str:
+    # blacklist of a masked genome from the counts of the base genome (table):
+    # L-mers in the masked intervals no longer occur there, the threshold is applied again
+    base = np.load(table)
+    counts = pd.DataFrame({'w0': base['kmers'][:, 0], 'w1': base['kmers'][:, 1], 'count': base['counts']})
+    masked = masked_kmers(bed, ref, length)
+    masked = pd.DataFrame({'w0': masked[:, 0], 'w1': masked[:, 1]}).value_counts().rename('masked').reset_index()
+    counts = counts.merge(masked, on=['w0', 'w1'], how='left').fillna({'masked': 0})
+    counts['count'] -= counts.masked.astype(np.int64)
+    counts = counts[counts['count'] >= threshold]
+    write_blacklist(counts[['w0', 'w1']].to_numpy(dtype=np.uint64), counts['count'].to_numpy(), length, out)
+    return out
+
+
+@click.command(
+    name="abundant_kmers",
+    help="Write the L-mers occurring at least c times in the reference genome(s), in place of nhush find-abundant."
+)
+@click.option('-L', '--length', type=click.INT, default=40, help="Oligo length (at most 64).")
+@click.option('-c', '--cutoff', type=click.INT, default=100, help="Min abundance of an oligo to be included in the blacklist.")
+@click.option('-t', '--threads', type=click.INT, default=1, help="Buckets counted in parallel.")
+@click.option('-M', '--memory', type=click.FLOAT, default=4, help="Memory limit in GB.")
+@click.option('--tmpdir', type=click.Path(), help="Folder for the on-disk buckets. Default: the output folder.")
+@click.option('-o', '--outfolder', type=click.Path(), default='./data/blacklist')
+@click.option('--derive', is_flag=True, help="Derive the blacklists of the masked genome_roi_N.fa from the counts of genome.fa "
+              "and the data/exclude/excl_roi_N.bed intervals instead of counting them.")
+@click.argument('genomes', nargs=-1, type=click.Path(exists=True))
+def main(length:int, cutoff:int, threads:int, memory:float, tmpdir:str|None, outfolder:str, derive:bool, genomes:tuple[str])->None:
+    if len(genomes) == 0:
+        genomes = sorted(glob.glob('./data/ref/genome*.fa'))
+    for genome in genomes:
+        roi = re.fullmatch(r'genome_(roi_\d+)\.fa', os.path.basename(genome))
+        if derive and roi is not None:
+            bed = os.path.join('./data/exclude', f"excl_{roi.group(1)}.bed")
+            table = os.path.join(outfolder, f"genome.fa.abundant_L{length}_T{cutoff}.counts.npz")
+            if os.path.isfile(bed):
+                if not os.path.isfile(table):
+                    abundant_kmers(os.path.join(os.path.dirname(genome), 'genome.fa'), length, cutoff, threads, memory, outfolder, tmpdir)
+                out = os.path.join(outfolder, f"{os.path.basename(genome)}.abundant_L{length}_T{cutoff}.fa")
+                print(f"Abundant {length}-mers of {genome}, from genome.fa: {masked_blacklist(table, bed, length, cutoff, out, os.path.dirname(genome))}")
+                continue
+        print(f"Abundant {length}-mers of {genome}: {abundant_kmers(genome, length, cutoff, threads, memory, outfolder, tmpdir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+# In-package replacement for `escafish apply_blacklist`: Hamming distance of every oligo of
+# the ROI databases to the abundant-oligo blacklist, written as the bl_dist column.
+# Oligos and blacklist entries are packed in 2-bit uint64 words (32 nt per word). Pigeonhole:
+# an oligo within d mismatches of a blacklist entry matches one of its d+1 segments exactly,
+# so the blacklist is indexed by segment and only the entries sharing a segment with the
+# oligo are compared, with XOR/popcount. Distances above d are reported as d+1.
+# ROIs are processed in a process pool, each against the blacklist of its masked genome
+# (genome_roi_N.fa.abundant_L*_T*.fa) when there is one, as in apply_blacklist.sh.
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import glob
+import click
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta
+
+lookup = np.zeros(256, dtype=np.uint64)     # A C G T -> 0 1 2 3
+for base, code in zip(b'ACGTacgt', [0, 1, 2, 3]*2):
+    lookup[base] = code
+even = np.uint64(0x5555555555555555)
+
+
+def pack(sequences:list[str], length:int)->np.ndarray:
+    # (n, words) uint64, 2 bits per nucleotide, first nucleotide in the high bits
+    codes = lookup[np.frombuffer(''.join(sequences).encode(), dtype=np.uint8)].reshape(len(sequences), length)
+    words = np.zeros((len(sequences), (length+31)//32), dtype=np.uint64)
+    for j in range(length):
+        words[:, j//32] = (words[:, j//32] << np.uint64(2)) | codes[:, j]
+    return words
+
+
+def popcount(x:np.ndarray)->np.ndarray:
+    x = x - ((x >> np.uint64(1)) & even)
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((x * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def hamming(a:np.ndarray, b:np.ndarray)->np.ndarray:
+    # mismatching nucleotides between packed rows
+    x = a ^ b
+    return popcount((x | (x >> np.uint64(1))) & even).sum(axis=1)
+
+
+def segment_keys(sequences:list[str], length:int, segments:np.ndarray, size:int)->np.ndarray:
+    # (n, d+1) 2-bit packed segments
+    codes = lookup[np.frombuffer(''.join(sequences).encode(), dtype=np.uint8)].reshape(len(sequences), length)
+    keys = np.zeros((len(sequences), len(segments)), dtype=np.uint64)
+    for j in range(size):
+        keys = (keys << np.uint64(2)) | codes[:, segments + j]
+    return keys
+
+
+class Blacklist:
+    # packed blacklist entries and, per segment, the entries sorted by segment
+
+    def __init__(self, path:os.PathLike, length:int, hamdist:int):
+        _, entries = read_fasta(path)
+        entries = [seq.upper() for seq in entries if len(seq) == length]
+        self.length, self.hamdist = length, hamdist
+        if length//(hamdist+1) < 1:
+            raise ValueError(f"Cannot search {length}-mers within {hamdist} mismatches: the segments would be empty.")
+        self.size = min(length//(hamdist+1), 32)
+        self.segments = np.arange(hamdist+1)*(length//(hamdist+1))
+        self.words = pack(entries, length)
+        keys = segment_keys(entries, length, self.segments, self.size)
+        self.order = np.argsort(keys, axis=0, kind='stable')
+        self.keys = np.take_along_axis(keys, self.order, axis=0)
+
+
+def min_distance(blacklist:Blacklist, sequences:list[str], batch:int=1<<22)->np.ndarray:
+    # min Hamming distance of each sequence to the blacklist, d+1 above d
+    nq, length = len(sequences), blacklist.length
+    distance = np.full(nq, blacklist.hamdist+1, dtype=np.int64)
+    if nq == 0 or len(blacklist.words) == 0:
+        return distance
+    words = pack(sequences, length)
+    keys = segment_keys(sequences, length, blacklist.segments, blacklist.size)
+    lo = np.stack([np.searchsorted(blacklist.keys[:, s], keys[:, s], 'left') for s in range(len(blacklist.segments))], axis=1)
+    hi = np.stack([np.searchsorted(blacklist.keys[:, s], keys[:, s], 'right') for s in range(len(blacklist.segments))], axis=1)
+    hits = (hi - lo).ravel()
+
+    # expand the candidates of a few oligos at a time to bound the memory
+    per = hits.reshape(nq, -1).sum(axis=1)
+    edges = np.unique(np.concatenate([[0], np.searchsorted(np.cumsum(per), np.arange(batch, per.sum(), batch), 'right'), [nq]]))
+    for first, last in zip(edges[:-1], edges[1:]):
+        pair = np.arange(first*len(blacklist.segments), last*len(blacklist.segments))
+        count = hits[pair]
+        pair = np.repeat(pair, count)
+        rank = np.arange(len(pair)) - np.repeat(np.cumsum(count) - count, count)
+        oligo, segment = pair//len(blacklist.segments), pair % len(blacklist.segments)
+        entry = blacklist.order[lo.ravel()[pair] + rank, segment]
+        np.minimum.at(distance, oligo, hamming(words[oligo], blacklist.words[entry]))
+    return np.minimum(distance, blacklist.hamdist+1)
+
+
+def apply_blacklist(dbfile:os.PathLike, blacklist:Blacklist, out:os.PathLike|None=None)->None:
+    # bl_dist column of the oligo DB, written in place unless out is given
+    db = pd.read_csv(dbfile, sep="\t", header=0)
+    db['bl_dist'] = min_distance(blacklist, db.sequence.str.upper().to_list())
+    db.to_csv(out if out is not None else dbfile, index=False, sep="\t")
+
+
+def roi_blacklist(dbfile:os.PathLike, blfolder:os.PathLike, length:int, cutoff:int)->str:
+    # blacklist of the masked genome of the ROI if there is one, of the whole genome otherwise
+    roi = re.search(r'roi_\d+', os.path.basename(dbfile))
+    if roi is not None:
+        path = os.path.join(blfolder, f"genome_{roi.group(0)}.fa.abundant_L{length}_T{cutoff}.fa")
+        if os.path.exists(path):
+            return path
+    return os.path.join(blfolder, f"genome.fa.abundant_L{length}_T{cutoff}.fa")
+
+
+def blacklist_filter(length:int=40, cutoff:int=100, hamdist:int=8, threads:int=1,
+                     dbfolder:os.PathLike='./data/db_tsv', blfolder:os.PathLike='./data/blacklist',
+                     suffix:str='')->None:
+    # all db*.tsv of dbfolder; results written to <db><suffix> (in place by default)
+    dbfiles = sorted(glob.glob(os.path.join(dbfolder, "db*.tsv")))
+    groups = {}
+    for dbfile in dbfiles:
+        groups.setdefault(roi_blacklist(dbfile, blfolder, length, cutoff), []).append(dbfile)
+
+    for path, files in groups.items():
+        print(f"Comparing {len(files)} oligo databases to {os.path.basename(path)}.")
+        blacklist = Blacklist(path, length, hamdist)
+        Parallel(n_jobs=threads)(delayed(apply_blacklist)(dbfile, blacklist, dbfile+suffix)
+                                 for dbfile in tqdm(files, desc="Applying the blacklist"))
+
+
+@click.command(
+    name="blacklist_filter",
+    help="Hamming distance of the ROI oligo databases to the abundant-oligo blacklist (bl_dist), in place of escafish apply_blacklist."
+)
+@click.option('-L', '--length', type=click.INT, default=40, help="Oligo length.")
+@click.option('-c', '--cutoff', type=click.INT, default=100, help="Min abundance of an oligo to be included in the blacklist.")
+@click.option('-d', '--hamdist', type=click.INT, default=8, help="Distances are exact up to this value, larger ones are reported as d+1.")
+@click.option('-t', '--threads', type=click.INT, default=1)
+@click.option('--dbfolder', type=click.Path(exists=True), default='./data/db_tsv', help="Folder of the db*.tsv oligo databases.")
+@click.option('--blfolder', type=click.Path(exists=True), default='./data/blacklist', help="Folder of the blacklists.")
+@click.option('--suffix', type=click.STRING, default='', help="Write to <db><suffix> instead of in place.")
+def main(length:int, cutoff:int, hamdist:int, threads:int, dbfolder:str, blfolder:str, suffix:str)->None:
+    blacklist_filter(length, cutoff, hamdist, threads, dbfolder, blfolder, suffix)
+
+
+if __name__ == "__main__":
+    main()
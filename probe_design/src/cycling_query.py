@@ -15,11 +15,22 @@ import shutil
 from itertools import compress
 import subprocess
 import logging
+import time
 from datetime import datetime
 import multiprocessing as mp
 from joblib import Parallel, delayed
 import joblib
 import contextlib
+import json
+
+try:
+    from .probe_query import query_roi, adaptive_query_roi, repair_roi, roi_db_path, pw_from_filename
+    from .probe_metrics import probe_metrics
+    from .validate_probes import validate_probes
+except ImportError:     # run as a script through prb
+    from probe_query import query_roi, adaptive_query_roi, repair_roi, roi_db_path, pw_from_filename
+    from probe_metrics import probe_metrics
+    from validate_probes import validate_probes
 
 pd.options.mode.chained_assignment = None  # default='warn'. Suppress SettingWithCopyWarning
 
@@ -58,8 +69,24 @@ def tqdm_joblib(tqdm_object):
 @click.option('-greedy', is_flag=True)
 @click.option('-excl', is_flag=True)
 @click.option('-noquerylog', is_flag=True)
+@click.option('-pysolver', is_flag=True, help="Query with the in-package solver instead of escafish.")
+@click.option('-adaptivepw', is_flag=True, help="Search for the smallest accepted pair weight instead of scanning 1e-1 to 1e-7.")
+@click.option('-pwtol', type=click.FLOAT, help="Bracket width of the adaptive pair weight search, in decades. Default: 1")
+@click.option('-repair', is_flag=True, help="Replace only the oligos rejected by HUSH instead of querying the whole probe again.")
+@click.option('-roitime', type=click.FLOAT, help="Time budget per ROI and round for the probe query (s). The best probe found so far is kept.")
+@click.option('-budget', type=click.FLOAT, help="Time budget for all probe queries (s). Past it, probes are only queried greedily.")
+@click.option('-split', type=click.INT, help="Solve probes with more oligos in sub-windows of this many oligos (in-package solver).")
+@click.option('-nohushcache', is_flag=True, help="Validate every selected oligo with HUSH again, ignoring the validation cache.")
+@click.option('-hushengine', type=click.Choice(['hushp', 'python']), default='hushp', help="Off-target counter for the validation: hushp or the in-package seed index.")
+@click.option('-resume', is_flag=True, help="Continue an interrupted run from its last completed round, skipping the ROIs already in final_probes.")
+@click.option('-rundir', '--run-dir', 'rundir', type=click.Path(file_okay=False),
+              help="Workspace of this run: round files, logs, state, final_probes and the oligos it excluded. "
+                   "The ROI databases of data/db_tsv are only read, so that several runs can share the project. Default: data/")
 
 def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:int, greedy:bool,excl:bool,noquerylog:bool, 
+           pysolver:bool = False, adaptivepw:bool = False, pwtol:float|None = None, repair:bool = False,
+           roitime:float|None = None, budget:float|None = None, split:int|None = None,
+           nohushcache:bool = False, hushengine:str = 'hushp', resume:bool = False, rundir:os.PathLike|None = None,
            gappercent:int|None = None, stepdown:int|None = None, probe:int|None=None,
            start:int|None=None, end:int|None =None, step:int|None=None,
            currentfolder = './data/', # can be adapted so the code can be run in other folders
@@ -67,11 +94,15 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
            cutoff_oligo:float = 10, # max allowed cost for a single oligo
            finished:bool = False,
            count:int = 1,
-           completelyfailed:list = [],
+           completelyfailed:list|None = None,
            )->None:
     # initialization
-    
-    logdir = os.path.join(currentfolder,"logfiles/")
+
+    # everything written by this run goes to its workspace, the data folder by default
+    rundir = os.path.join(rundir, '') if rundir else currentfolder
+    os.makedirs(rundir, exist_ok=True)
+
+    logdir = os.path.join(rundir,"logfiles/")
     try:
         os.mkdir(logdir)
     except FileExistsError:
@@ -90,16 +121,35 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
     logging.info(f"Oligo length             : {length}")
     logging.info(f"HUSH mismatches          : {mismatch}")
     logging.info(f"Max nb of off-targets    : {cutoff}")
+    logging.info(f"Run folder               : {rundir}")
     if(excl):
         logging.info(f"Masking probe region from HUSH runs.")
+    if(split):
+        pysolver = True     # sub-window queries need the in-package solver
+        logging.info(f"Large probes solved in sub-windows of {split} oligos.")
+    if(pysolver):
+        logging.info(f"Querying probes with the in-package solver.")
+    if(adaptivepw):
+        if (not pwtol):
+            pwtol = 1
+        logging.info(f"Adaptive pair weight search, bracket width: {pwtol} decade(s).")
+    if(repair):
+        logging.info(f"Repairing probes rejected by HUSH locally.")
+    if(hushengine == 'python'):
+        logging.info(f"Validating oligos with the in-package seed index instead of hushp.")
+    deadline = None
+    if(roitime):
+        logging.info(f"Probe query time budget per ROI: {roitime} s.")
+    if(budget):
+        deadline = time.monotonic() + budget
+        logging.info(f"Probe query time budget for all ROIs: {budget} s.")
     
 
-    outprobes = os.path.join(currentfolder,"final_probes/")
+    outprobes = os.path.join(rundir,"final_probes/")
     try:
         os.mkdir(outprobes)
     except FileExistsError:
         pass
-    # TO DO: check already completed probes and skip
 
     # parameters
           # max total cost of a probe. Exclude probe if even one oligo has a prohibitive cost
@@ -139,6 +189,39 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
     else:
         toprocess = rdroi[rdroi.window_id == probe]      
           
+    repairs = {}        # roi: (probe, rejected oligos, pw) of the probes rejected by HUSH in the last round
+    if completelyfailed is None:
+        completelyfailed = []
+    finishedrois = []   # rois moved to final_probes
+
+    # state of the loop, saved after every round
+    statepath = os.path.join(rundir,"cycling_query.state.json")
+    parameters = {'strand': strand, 'length': length, 'mismatch': mismatch, 'cutoff': cutoff, 'probe': probe,
+                  'start': start, 'end': end, 'step': step, 'stepdown': stepdown}
+    if not resume and os.path.exists(statepath):
+        os.remove(statepath)    # state of an earlier run
+    if resume:
+        state = load_state(statepath)
+        if state is not None:
+            if state['parameters'] != parameters:
+                raise click.UsageError(f"{statepath} was saved with other parameters: {state['parameters']}.")
+            if state['complete']:
+                print(f"The run saved in {statepath} is complete.")
+                return
+            count, sweep = state['count'], state['sweep']
+            completelyfailed, finishedrois = state['completelyfailed'], state['finished']
+            toprocess = rdroi.loc[state['toprocess']['index']]
+            toprocess['window'] = state['toprocess']['window']
+            repairs = {int(roi): (pd.DataFrame(probedata), np.array(rejected), pw) for roi, (probedata, rejected, pw) in state['repairs'].items()}
+            logging.info(f"Resuming at round {count} with {len(toprocess)} ROIs.")
+        # probes already finished, in this run or an earlier one
+        done = set(finishedrois) | final_rois(outprobes)
+        logging.info(f"Skipping {len(set(toprocess.window_id) & done)} ROIs already in {outprobes}.")
+        toprocess = toprocess[~toprocess.window_id.isin(done)]
+        if len(toprocess) == 0:
+            finished = True
+            print(f"All ROIs are already in {outprobes}.")
+
     while (not finished):
 
         logging.warning(f"Probe generation round {count}.")
@@ -147,16 +230,16 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
 
         # EMPTY SELECTED_PROBES FOLDER + MAKE SURE PROBE QUERY FOLDERS DON'T COLLIDE
         try:
-            shutil.rmtree(os.path.join(currentfolder , "probe_candidates"))
+            shutil.rmtree(os.path.join(rundir , "probe_candidates"))
         except:
             pass
         try:
-            shutil.rmtree(os.path.join(currentfolder , "selected_probes")) 
+            shutil.rmtree(os.path.join(rundir , "selected_probes")) 
         except:
             pass       
 
-        os.mkdir(os.path.join(currentfolder,"probe_candidates/"))
-        os.mkdir(os.path.join(currentfolder,"selected_probes/"))
+        os.mkdir(os.path.join(rundir,"probe_candidates/"))
+        os.mkdir(os.path.join(rundir,"selected_probes/"))
         
         toprocessRoi = toprocess.window_id.to_list()
         toprocessOligos = toprocess.window.to_list()
@@ -164,13 +247,22 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
         # update the probe databases with removed oligos
         #filterdatabase(currentfolder,cutoff_oligo,toprocessRoi)    
 
-        filterdatabase_par(currentfolder,cutoff_oligo,threads,toprocessRoi) 
+        filterdatabase_par(currentfolder,cutoff_oligo,threads,toprocessRoi,rundir) 
 
-        if excl:
-            flag = "-e"
-        else:
-            flag=""    
+        querypath = os.path.join(rundir, "probe_candidates", "query_output_round_"+str(count))
 
+        # keep the accepted oligos of rejected probes and only fill the gaps, full query if that fails
+        repaired = []
+        torepair = [roi for roi in toprocessRoi if roi in repairs]
+        if(len(torepair)>0):
+            with tqdm_joblib(tqdm(desc="Repairing rejected probes", total=len(torepair))) as progress_bar:
+                success = Parallel(n_jobs=threads, prefer="threads")(delayed(repair_roi)(roi_db_path(rundir,strand,roi),roi,*repairs[roi],querypath,
+                                                                     cutoff_cost,cutoff_d,cutoff_d_pc)
+                                                                     for roi in torepair)
+            repaired = list(compress(torepair,success))
+            logging.info(f"Round {count}: {len(repaired)} probes repaired, {len(torepair)-len(repaired)} fully queried again.")
+
+        pyjobs = []     # (roi, oligo counts) solved in-package, one database load per ROI
         for n in tqdm(range(len(toprocess)),"Generating probe candidates..."):
             # retrieve ROI number from ROI name
             roinumber = toprocessRoi[n]
@@ -183,23 +275,47 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
                 logging.warning(f"No probe could be found for ROI "+str(roinumber)+". Proceeding with the other probes.")
                 continue
 
+            if roinumber in repaired:
+                continue
+
+            if pysolver or adaptivepw or roitime or budget:
+                pyjobs.append((roinumber, list(oligorange) if sweep else [oligos]))
+                continue
+
             # if the user provided start/end/step, use as range of oligo numbers to design probes for the first time!
             if sweep:
                 querylogpath = logdir + "query_roi_"+str(roinumber)+"_oli_sweep_round_"+str(count)+"_" + ts_string + ".txt"
                 timeout=9999999
                 with tqdm_joblib(tqdm(desc="Sweeping oligo counts in region "+str(roinumber), total=len(oligorange))) as progress_bar:
-                    Parallel(n_jobs=threads,timeout=timeout)(delayed(probequery)(length,strand,roinumber,oligos,querylogpath,greedy,noquerylog) for oligos in oligorange)
+                    Parallel(n_jobs=threads,timeout=timeout)(delayed(probequery)(length,strand,roinumber,oligos,querylogpath,greedy,noquerylog,rundir) for oligos in oligorange)
             else:
                 querylogpath = logdir + "query_roi_"+str(roinumber)+"_oli_"+str(oligos)+"_round_"+str(count)+"_" + ts_string + ".txt"
                 # use as input for probe query (only process remaining ROIs)
-                probequery(length,strand,roinumber,oligos,querylogpath,greedy,noquerylog)
+                probequery(length,strand,roinumber,oligos,querylogpath,greedy,noquerylog,rundir)
+
+        if(len(pyjobs)>0):
+            engine = 'python' if pysolver else 'escafish'
+            # threads of each ROI, for the sub-windows of split queries, when fewer ROIs than threads
+            roithreads = max(1, (threads or 1)//len(pyjobs))
+            if adaptivepw:
+                with tqdm_joblib(tqdm(desc="Searching pair weights per region", total=len(pyjobs))) as progress_bar:
+                    solves = Parallel(n_jobs=threads, prefer="threads")(delayed(adaptive_query_roi)(roi_db_path(rundir,strand,roi),roi,oligolist,querypath,
+                                                                        cutoff_cost,cutoff_d,cutoff_d_pc,greedy=greedy,engine=engine,tol=pwtol,
+                                                                        timeout=roitime,deadline=deadline,split=split,threads=roithreads) 
+                                                                        for roi, oligolist in pyjobs)
+                logging.info(f"Round {count}: {sum(solves)} probe solves for {len(pyjobs)} regions.")
+            else:
+                with tqdm_joblib(tqdm(desc="Solving all pair weights per region", total=len(pyjobs))) as progress_bar:
+                    Parallel(n_jobs=threads, prefer="threads")(delayed(query_roi)(roi_db_path(rundir,strand,roi),roi,oligolist,querypath,greedy=greedy,
+                                                               engine=engine,timeout=roitime,deadline=deadline,split=split,threads=roithreads)
+                                                               for roi, oligolist in pyjobs)
 
         # select best probes
         print(f"Selecting probes...")
         if(sweep):
-            selection = selectprobes(currentfolder, toprocessRoi, [start]*len(toprocessRoi), cutoff_cost, cutoff_d, cutoff_d_pc) 
+            selection = selectprobes(currentfolder, toprocessRoi, [start]*len(toprocessRoi), cutoff_cost, cutoff_d, cutoff_d_pc, threads, rundir) 
         else:
-            selection = selectprobes(currentfolder, toprocessRoi, toprocessOligos, cutoff_cost, cutoff_d, cutoff_d_pc) 
+            selection = selectprobes(currentfolder, toprocessRoi, toprocessOligos, cutoff_cost, cutoff_d, cutoff_d_pc, threads, rundir) 
     
         failedlist = selection[selection.success == 0].index.to_list()
         logging.info(f'Length of failedlist: '+str(len(failedlist)))
@@ -213,12 +329,14 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
             hushlogpath = logdir + "hush_roi_round_"+str(count)+"_" + ts_string + ".txt"
             print(f"Checking the oligos with (old)HUSH...")
             with open(hushlogpath,'w') as f:
-#            subprocess.run("./validation_oldHUSH_BLAST.sh -L "+str(length)+" -m "+str(mismatch)+" -t "+str(threads)+flag+" > "+hushlogpath, shell=True,check=True)
-                subprocess.run(["./validation_oldHUSH_BLAST.sh", '-L', str(length),"-m",str(mismatch),"-t",str(threads),flag],stdout=f) # TO FIX: PATH
+                hits, total = validate_probes(length,mismatch,threads,excl,currentfolder,log=f,cache=not nohushcache,engine=hushengine,rundir=rundir)    # one hushp run per reference genome
+            if not nohushcache:
+                logging.info(f"Round {count}: HUSH validation cache hit rate {hits}/{total} oligos ({100*hits/max(total,1):.1f}%).")
             print(f"Removing poor oligos from database")
 
         # apply results from HUSH to exclude poor oligos
-        rerunlist = feedback(currentfolder,outprobes,count,cutoff,logpath)
+        repairs = {}
+        rerunlist = feedback(currentfolder,outprobes,count,cutoff,logpath,repairs if repair else None,finishedrois,rundir)
 
         combinedlist = np.unique(failedlist+rerunlist)
 
@@ -227,6 +345,7 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
             logging.info(f"Done! :)")
             if(len(completelyfailed)>0):
                 logging.info(f"No probe could be found for the following regions: "+''.join(str(e)+", " for e in completelyfailed)+".")
+            save_state(statepath, parameters, count, sweep, toprocess, completelyfailed, finishedrois, repairs, complete=True)
             break
         else:
             print(f""+str(len(combinedlist))+" probes need to be re-run.")
@@ -251,22 +370,25 @@ def output(strand:str, length:int, mismatch:int, cutoff:int, threads:int, gap:in
 
             count = count+1  
             sweep = False   
+            save_state(statepath, parameters, count, sweep, toprocess, completelyfailed, finishedrois, repairs)
 
 
 # -----------------------------------------------------------------------------------------------------------------------      
 # -----------------------------------------------------------------------------------------------------------------------            
 
 
-def selectprobes(input_folder, toprocessroi, toprocessoligos, cutoff_cost, cutoff_d, cutoff_d_pc):
+def selectprobes(input_folder, toprocessroi, toprocessoligos, cutoff_cost, cutoff_d, cutoff_d_pc, threads=1, rundir=None):
+    if rundir is None:
+        rundir = input_folder
 
     # retrieve probe queries
-    selectedfolder = input_folder + 'selected_probes/'
+    selectedfolder = rundir + 'selected_probes/'
     try:
         os.mkdir(selectedfolder)
     except FileExistsError:
         pass
     # identify probe files
-    pattern = input_folder+"probe_candidates/**/probe_*.tsv"   #probelet
+    pattern = rundir+"probe_candidates/**/probe_*.tsv"   #probelet
     #pattern = "data/**/probe*/**oligos.tsv"    #ifpd2 query
     #pattern = "data/**/*.best_probe.tsv"   #jupyternb
     filenames = glob.glob(pattern,recursive=True)
@@ -274,59 +396,8 @@ def selectprobes(input_folder, toprocessroi, toprocessoligos, cutoff_cost, cutof
     roilist = input_folder+'rois/all_regions.tsv'
     rdroi = pd.read_csv(roilist,sep="\t",header=0)
 
-    probelist = pd.DataFrame(columns=['fullpath', 'folder', 'probe_set', 'roi', 'chr', 'probe_start', 'probe_end', \
-            'nOligos', 'pw', 'probe_size', 'region_size', 'coverage', \
-            'centrality', 'd_max_pcregion', 'd_max_pcprobe',\
-            'd_mean', 'd_min', 'd_max', 'd_std', \
-            'tm_range', 'tm_mean', 'tm_std', \
-            'gc_range', 'gc_mean', 'gc_std', \
-            'mean_closestMM', 'min_closestMM', 'max_closestMM', 'std_closestMM', \
-            'mean_cumulMM', 'min_cumulMM', 'max_cumulMM', 'std_cumulMM', \
-            'mean_oligo_cost', 'min_oligo_cost', 'max_oligo_cost', 'std_oligo_cost' ,\
-            'sum_inv_cost'])
-            #'mean_sumMM', 'min_sumMM', 'max_sumMM', 'std_sumMM'   ])
-        
-
-    # read probe files
-    if len(filenames)>0:
-        for file in tqdm(filenames, "Summarizing probe candidates..."):
-            rd = pd.read_csv(file,sep="\t")
-            last = len(probelist)+1
-            
-            # find coordinates of the corresponding roi
-            current_roi = rd.name[0][4:]
-            for k in range(len(rdroi)):
-                if str(rdroi.window_id[k]) == current_roi:
-                    current = k
-
-            roi_start = rdroi.Window_start[current]
-            roi_end = rdroi.Window_end[current]
-            roi_center = ((roi_start+roi_end)/2)-roi_start  #adjusted roi center
-
-        # calculate summary measures and add as last row
-
-            inv_cost = np.divide(np.ones(len(rd.name.tolist())),rd.oligo_cost)
-
-        # replace off_target_no by min_mismatch for new queries
-            probe_start = min(rd.start[:])
-            probe_end = max(rd.end[:])
-            probe_center = ((probe_start+probe_end)/2)-roi_start    #adjusted probe center
-
-            filesplit = file.split("/")         # split numbers will have to be adjusted for running in different folders
-
-            probelist.loc[last] = [file, filesplit[3], filesplit[4], int(rd.name[0][4:]), rd.chromosome[0], probe_start, probe_end, \
-                len(rd), float(filesplit[4][-8:-4]), probe_end-probe_start+1, int(roi_end)-int(roi_start)+1, (probe_end-probe_start+1)/(int(roi_end)-int(roi_start)+1), \
-                min(probe_center/roi_center,2-(probe_center/roi_center)), 100*(rd.start-rd.end.shift()).max()/(int(roi_end)-int(roi_start)+1), 100*(rd.start-rd.end.shift()).max()/(int(probe_end)-int(probe_start)+1),\
-                (rd.start-rd.end.shift()).mean(), (rd.start-rd.end.shift()).min(), (rd.start-rd.end.shift()).max(), (rd.start-rd.end.shift()).std(), \
-                max(rd.Tm)-min(rd.Tm), stat.mean(rd.Tm), stat.stdev(rd.Tm), \
-                max(rd.gc_content)-min(rd.gc_content), stat.mean(rd.gc_content), stat.stdev(rd.gc_content), \
-                stat.mean(rd.off_target_no), min(rd.off_target_no), max(rd.off_target_no), stat.stdev(rd.off_target_no), \
-                stat.mean(rd.off_target_sum), min(rd.off_target_sum), max(rd.off_target_sum), stat.stdev(rd.off_target_sum), \
-                stat.mean(rd.oligo_cost), min(rd.oligo_cost), max(rd.oligo_cost), stat.stdev(rd.oligo_cost), \
-                inv_cost.sum()]
-            # stat.mean(rd.off_target_sum), min(rd.off_target_sum), max(rd.off_target_sum), stat.stdev(rd.off_target_sum)]  
-        
-        probelist.loc[:,'fullpath'] = probelist.loc[:,'fullpath'].astype(str)
+    # summary measures of all probe candidates
+    probelist = probe_metrics(filenames, rdroi, threads)
 
     selection = pd.DataFrame(columns=['roi','oligos','pw','success'])   # summary of selection results
     selection.set_index('roi',inplace=True)
@@ -355,10 +426,12 @@ def selectprobes(input_folder, toprocessroi, toprocessoligos, cutoff_cost, cutof
 # -----------------------------------------------------------------------------------------------------------------------            
 
 
-def feedback(currentfolder,outfolder,count,cutoff,logpath):
-    selectedfolder = currentfolder + 'selected_probes/'
+def feedback(currentfolder,outfolder,count,cutoff,logpath,repairs=None,finished=None,rundir=None):
+    if rundir is None:
+        rundir = currentfolder
+    selectedfolder = rundir + 'selected_probes/'
     # identify probe files
-    hushpattern = currentfolder+"selected_probes/query_*.out"   # HUSH validation output
+    hushpattern = rundir+"selected_probes/query_*.out"   # HUSH validation output
     hushnames = glob.glob(hushpattern,recursive=True)
 
     logging.info(f'Length of hushnames: '+str(len(hushnames)))
@@ -404,8 +477,8 @@ def feedback(currentfolder,outfolder,count,cutoff,logpath):
 
             if(len(exclude)>0):
                 logging.info(f'Excluding '+str(len(exclude))+' oligos from the database.')
-                # attribute prohibitive escafish score in the ROI oligo database
-                roioligos = pd.read_csv(roiDb,sep="\t",header=0)
+                # attribute prohibitive escafish score in the ROI oligo database (the copy of this run)
+                roioligos = pd.read_csv(working_db(roiDb,rundir),sep="\t",header=0)
                 cols = list(roioligos.columns.values)       # save the order of the columns to restore it later
                 roioligos = roioligos.set_index('start')
                 roioligos.loc[exclude.index,'oligo_cost'] = 1e10
@@ -413,16 +486,26 @@ def feedback(currentfolder,outfolder,count,cutoff,logpath):
                 # export the updated database in place
                 roioligos = roioligos.reset_index()
                 roioligos = roioligos[cols]
-                roioligos.to_csv(roiDb,index=False,sep="\t")
+                roiDb = run_db(roiDb,rundir)
+                os.makedirs(os.path.dirname(roiDb),exist_ok=True)
+                roioligos.to_csv(roiDb+".tmp",index=False,sep="\t")
+                os.replace(roiDb+".tmp",roiDb)
 
                 rerunlist.append(int(roiname[4:]))  # the probe will have to be queried again from the updated oligo database
 
+                if repairs is not None:
+                    # keep the probe for a local repair of the rejected oligos in the next round
+                    probe = pd.read_csv(tsvfile,sep="\t",header=0)
+                    repairs[int(roiname[4:])] = (probe, np.array(hushscores) > cutoff, pw_from_filename(tsvfile))
+
             else:
                 logging.info(f'No oligos were excluded.')  
                 # move probe to final selection folder
                 tsvname = basename[6:basename.find('.fa')]+".tsv"
                 shutil.move(selectedfolder + tsvname,outfolder)
                 shutil.move(selectedfolder + basename,outfolder)    # also keep the .out file (all other files will be deleted)      
+                if finished is not None:
+                    finished.append(int(roiname[4:]))
                     
 
     logging.info(f'Length of rerunlist: '+str(len(rerunlist)))
@@ -435,7 +518,43 @@ def feedback(currentfolder,outfolder,count,cutoff,logpath):
 # -----------------------------------------------------------------------------------------------------------------------            
 
 
-def filterdatabase(currentfolder,cutoff,toprocessRoi):
+def save_state(statepath,parameters,count,sweep,toprocess,completelyfailed,finished,repairs,complete=False):
+    # written atomically: an interrupted run resumes from the last completed round
+    state = {'parameters': parameters, 'count': count, 'sweep': sweep, 'complete': complete,
+             'toprocess': {'index': toprocess.index.to_list(), 'window': [int(w) for w in toprocess.window]},
+             'completelyfailed': [int(roi) for roi in completelyfailed], 'finished': [int(roi) for roi in finished],
+             'repairs': {str(roi): (probedata.to_dict('list'), rejected.tolist(), pw) for roi, (probedata, rejected, pw) in repairs.items()}}
+    with open(statepath+".tmp",'w') as f:
+        json.dump(state, f, default=lambda x: x.item())
+    os.replace(statepath+".tmp", statepath)
+
+
+def load_state(statepath):
+    if not os.path.exists(statepath):
+        return None
+    with open(statepath) as f:
+        return json.load(f)
+
+
+def final_rois(outfolder):
+    # rois with a probe in final_probes
+    return set(int(re.search(r'probe_roi_(\d+)\.', os.path.basename(name)).group(1)) for name in glob.glob(outfolder+"probe_roi_*.tsv"))
+
+
+def run_db(db,rundir):
+    # copy of a ROI database in the run folder (the database itself when the run folder is the data folder)
+    return os.path.join(rundir,'db_tsv',os.path.basename(db))
+
+
+def working_db(db,rundir):
+    # ROI database as updated by this run, unless it was built again since
+    rundb = run_db(db,rundir)
+    if os.path.exists(rundb) and os.path.getmtime(rundb) >= os.path.getmtime(db):
+        return rundb
+    return db
+
+
+def filterdatabase(currentfolder,cutoff,toprocessRoi,rundir=None):
     # generate a filtered copy of the oligo database for each ROI
     # filter by removing oligos over a certain threshold cost
 
@@ -453,12 +572,9 @@ def filterdatabase(currentfolder,cutoff,toprocessRoi):
     # open the updated (full) database and export a filtered version without discarded oligos       
 
     for db in tqdm(filtereddblist,"Preparing filtered oligo databases..."):
-        # retrieve oligos with poor HUSH score
-        oligodb = pd.read_csv(db,sep="\t",header=0)
-        filtereddb = oligodb[oligodb.oligo_cost < cutoff]
-        filtereddb.to_csv(db+".filt",index=False,sep="\t")
+        filterdb(db,cutoff,rundir if rundir is not None else currentfolder)
 
-def filterdatabase_par(currentfolder,cutoff,threads,toprocessRoi):
+def filterdatabase_par(currentfolder,cutoff,threads,toprocessRoi,rundir=None):
     # generate a filtered copy of the oligo database for each ROI
     # filter by removing oligos over a certain threshold cost
 
@@ -475,30 +591,31 @@ def filterdatabase_par(currentfolder,cutoff,threads,toprocessRoi):
     # for each database file
     # open the updated (full) database and export a filtered version without discarded oligos
     with tqdm_joblib(tqdm(desc="Filtering oligo databases", total=len(filtereddblist))) as progress_bar:
-        Parallel(n_jobs=threads)(delayed(filterdb)(db,cutoff) for db in filtereddblist)
+        Parallel(n_jobs=threads)(delayed(filterdb)(db,cutoff,rundir if rundir is not None else currentfolder) for db in filtereddblist)
  
 
-def filterdb(db,cutoff):
+def filterdb(db,cutoff,rundir):
      # retrieve oligos with poor HUSH score
-    oligodb = pd.read_csv(db,sep="\t",header=0)
+    oligodb = pd.read_csv(working_db(db,rundir),sep="\t",header=0)
     filtereddb = oligodb[oligodb.oligo_cost < cutoff]
-    filtereddb.to_csv(db+".filt",index=False,sep="\t")       
+    os.makedirs(os.path.join(rundir,'db_tsv'),exist_ok=True)
+    filtereddb.to_csv(run_db(db,rundir)+".filt",index=False,sep="\t")       
 
 # -----------------------------------------------------------------------------------------------------------------------      
 # -----------------------------------------------------------------------------------------------------------------------            
 
 
-def probequery(length,strand,roi,oligos,logpath,greedy,noquerylog):
+def probequery(length,strand,roi,oligos,logpath,greedy,noquerylog,rundir='./data/'):
     suffix = ""
     if(greedy): 
         suffix = "-g"
     if noquerylog:    
         #subprocess.run("./probe-query.sh -s "+strand+" -e "+str(roi)+" -o "+str(oligos)+suffix+"> /dev/null 2>&1", shell=True)
-        subprocess.run(["./shell/probe-query.sh","-s",strand,"-e",str(roi),"-o",str(oligos),suffix], stdout=None)
+        subprocess.run(["./shell/probe-query.sh","-s",strand,"-e",str(roi),"-o",str(oligos),"-r",rundir,suffix], stdout=None)
     else:
         with open(logpath,'w') as f:
         #subprocess.run("./probe-query.sh -s "+strand+" -e "+str(roi)+" -o "+str(oligos)+suffix+" > "+logpath+" 2>&1", shell=True)
-            subprocess.run(["./shell/probe-query.sh","-s",strand,"-e",str(roi),"-o",str(oligos),suffix],stderr=subprocess.STDOUT,stdout=f)
+            subprocess.run(["./shell/probe-query.sh","-s",strand,"-e",str(roi),"-o",str(oligos),"-r",rundir,suffix],stderr=subprocess.STDOUT,stdout=f)
 
 # -----------------------------------------------------------------------------------------------------------------------      
 # -----------------------------------------------------------------------------------------------------------------------            
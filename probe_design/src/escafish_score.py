@@ -288,5 +288,3 @@ if __name__ == "__main__":
             score = 0
 
         print(f"{line}\t{score}")
-
-    escafish_score()
\ No newline at end of file
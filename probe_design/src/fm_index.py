@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+
+# Exact longest off-target match of every oligo, with an FM-index of the reference.
+# The index covers both strands (reference, then its reverse complement) and is stored
+# next to the reference as <reference>.fm.{bwt,occ,C}.npy, built once by sorting the suffixes in
+# on-disk buckets of a bounded size: the build takes the memory limit plus about 3 bytes per
+# reference base (both strands) and 8 bytes per base of temporary disk (16 above 2 Gb). The
+# index takes 3 bytes per base on disk.
+# For every end position of an oligo, a batched backward search extends the match to
+# the left while the substring still occurs off-target: more often than its on-target
+# occurrence, which is skipped when the full oligo is found in the reference (as nhush --sfp).
+# The longest such substring replaces the consecutive sublength match of reform_hush_combined.
+
+import numpy as np
+import os
+import shutil
+import click
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta, bucket_of, write_buckets
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta, bucket_of, write_buckets
+
+block = 64      # occurrence checkpoints every block characters of the BWT
+max_seed = 10   # intervals of all seed-mers are tabulated, the search starts seed characters in
+bucket_prefix = 7       # the suffixes are sorted in buckets of whole bucket_prefix-character ranges
+max_window = 4096       # most characters of a suffix compared at once
+bytes_per_suffix = 96   # peak memory per suffix while sorting a bucket
+
+codes = np.full(256, 5, dtype=np.uint8)        # terminal 0, A C G T -> 1 2 3 4, anything else (N, record breaks) -> 5
+for base, code in zip(b'ACGTacgt', [1, 2, 3, 4]*2):
+    codes[base] = code
+complement = np.array([0, 4, 3, 2, 1, 5], dtype=np.uint8)
+
+
+def encode(seq:str|bytes)->np.ndarray:
+    if isinstance(seq, str):
+        seq = seq.encode()
+    return codes[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def packed(text:np.ndarray, positions:np.ndarray, width:int)->np.ndarray:
+    # the first width characters of every suffix, 3 bits each
+    key = np.zeros(len(positions), dtype=np.uint64)
+    for j in range(width):
+        key = (key << np.uint64(3)) | text[positions + j].astype(np.uint64)
+    return key
+
+
+def sort_suffixes(text:np.ndarray, positions:np.ndarray)->np.ndarray:
+    # positions sorted by their suffix, compared a window of characters at a time: the next
+    # window only for the ties, which the unique terminal ends. The windows widen as the ties
+    # get fewer, within about 24 bytes per suffix. The text is padded with max_window zeros
+    windows = np.lib.stride_tricks.sliding_window_view(text, max_window)
+    group = np.zeros(len(positions), dtype=np.int64)       # first slot of the tie of every suffix
+    idx = np.arange(len(positions))
+    offset = 0
+    while len(idx) > 0:
+        width = int(min(max_window, max(24, 24*len(positions)//len(idx))))
+        keys = np.empty((len(idx), 8+width), dtype=np.uint8)
+        keys[:, :8] = group[idx].astype('>u8').view(np.uint8).reshape(-1, 8)      # ties stay in their slots
+        keys[:, 8:] = windows[positions[idx] + offset, :width]
+        keys = keys.view(f'S{8+width}').ravel()
+        order = np.argsort(keys, kind='stable')
+        positions[idx] = positions[idx][order]
+        keys = keys[order]
+        new = np.ones(len(idx), dtype=bool)
+        new[1:] = keys[1:] != keys[:-1]
+        group[idx] = np.maximum.accumulate(np.where(new, idx, 0))
+        tied = ~new
+        tied[:-1] |= ~new[1:]
+        idx = idx[tied]
+        offset += width
+    return positions
+
+
+class FMIndex:
+    # BWT of reference + reverse complement, with occurrence checkpoints
+
+    def __init__(self, reference:os.PathLike, mmap:bool=False, memory:float=4):
+        # memory: GB for building the index, on top of the reference text
+        self.reference = os.path.realpath(reference)
+        self.prefix = f"{self.reference}.fm"
+        if not self.cached():
+            self.build(memory)
+        mode = 'r' if mmap else None
+        self.bwt = np.load(self.prefix+'.bwt.npy', mmap_mode=mode)
+        self.occ = np.load(self.prefix+'.occ.npy', mmap_mode=mode)
+        self.C = np.load(self.prefix+'.C.npy')
+        self.kmers = np.load(self.prefix+'.kmers.npy', mmap_mode=mode)
+        self.seed = (len(self.kmers).bit_length() - 1)//2
+        self.size = len(self.bwt) - block       # the BWT is padded for the in-block counts
+
+    def cached(self)->bool:
+        files = [self.prefix+ext for ext in ['.bwt.npy', '.occ.npy', '.C.npy', '.kmers.npy']]
+        return all(os.path.exists(file) and os.path.getmtime(file) >= os.path.getmtime(self.reference) for file in files)
+
+    def build(self, memory:float=4)->None:
+        print(f"Building the FM-index of {self.reference}.")
+        chunks = []
+        with open(self.reference, 'rb') as f:
+            for line in f:
+                if line.startswith(b'>'):
+                    chunks.append(b'N')     # no match spans two records
+                else:
+                    chunks.append(line.rstrip())
+        forward = encode(b''.join(chunks) + b'N')
+        del chunks
+        run = np.zeros(len(forward), dtype=bool)
+        run[1:] = (forward[1:] == 5) & (forward[:-1] == 5)
+        forward = forward[~run]         # N runs as a single N, which no match spans either
+        del run
+        n = 2*len(forward) + 1
+        text = np.concatenate([forward, complement[forward[::-1]], np.zeros(1+max_window)]).astype(np.uint8)
+        del forward
+
+        # suffixes partitioned by their first bucket_prefix characters, buckets sorted one at a time
+        limit = max(1, int(memory*1e9/bytes_per_suffix))
+        step = max(limit, 1<<20)//block*block      # suffixes per pass over the text (a pass takes less per suffix than a sort)
+        dtype = np.uint32 if n < 1<<32 else np.int64
+        histogram = np.zeros(8**bucket_prefix, dtype=np.int64)
+        for start in range(0, n, step):
+            histogram += np.bincount(packed(text, np.arange(start, min(start+step, n)), bucket_prefix).astype(np.int64), minlength=8**bucket_prefix)
+        bucket = bucket_of(histogram, limit)
+        tmpdir = self.prefix+'.tmp'
+        shutil.rmtree(tmpdir, ignore_errors=True)      # buckets of a crashed build
+        os.makedirs(tmpdir)
+        files = [os.path.join(tmpdir, f"bucket_{b:05d}") for b in range(int(bucket[-1])+1)]
+        for start in range(0, n, step):
+            positions = np.arange(start, min(start+step, n), dtype=np.int64)
+            write_buckets(files, bucket[packed(text, positions, bucket_prefix)], positions.astype(dtype))
+
+        # BWT padded for the in-block counts
+        bwt = np.lib.format.open_memmap(self.prefix+'.tmp.bwt.npy', mode='w+', dtype=np.uint8, shape=(n+block,))
+        done = 0
+        for file in files:
+            if not os.path.exists(file):
+                continue
+            sa = sort_suffixes(text, np.fromfile(file, dtype=dtype).astype(np.int64))
+            bwt[done:done+len(sa)] = text[sa - 1]       # sa - 1 = -1 wraps to the padding, a terminal too
+            done += len(sa)
+            os.remove(file)
+        os.rmdir(tmpdir)
+        del text
+
+        # occurrences before every checkpoint, chunk at a time
+        occ = np.zeros((n//block + 1, 6), dtype=np.uint32 if n < 1<<32 else np.uint64)
+        counts = np.zeros(6, dtype=np.int64)
+        for start in range(0, n, step):
+            chunk = np.asarray(bwt[start:min(start+step, n)])
+            for c in range(1, 6):
+                total = np.concatenate([[0], np.cumsum(chunk == c)])[::block]
+                occ[start//block:start//block + len(total), c] = counts[c] + total
+            counts += np.bincount(chunk, minlength=6)
+        C = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        bwt.flush()
+        self.bwt, self.occ, self.C, self.size = bwt, occ, C, n
+
+        # interval of every seed-mer (2-bit packed, first base in the high bits),
+        # seed-mers about as many as the reference positions
+        seed = int(min(max_seed, max(1, np.log(self.size)/np.log(4))))
+        kmers = np.zeros((4**seed, 2), dtype=np.int64)
+        for start in range(0, len(kmers), 1<<16):      # the ranks gather block characters per seed-mer
+            kmer = np.arange(start, min(start + (1<<16), len(kmers)), dtype=np.int64)
+            lo, hi = np.zeros(len(kmer), dtype=np.int64), np.full(len(kmer), self.size, dtype=np.int64)
+            for j in range(seed):
+                lo, hi = self.extend((((kmer >> 2*j) & 3) + 1).astype(np.uint8), lo, hi)
+            kmers[kmer, 0], kmers[kmer, 1] = lo, hi
+
+        for ext, array in [('.occ.npy', occ), ('.C.npy', C), ('.kmers.npy', kmers)]:
+            np.save(self.prefix+'.tmp.npy', array)
+            os.replace(self.prefix+'.tmp.npy', self.prefix+ext)
+        del self.bwt, bwt
+        os.replace(self.prefix+'.tmp.bwt.npy', self.prefix+'.bwt.npy')
+
+    def rank(self, c:np.ndarray, i:np.ndarray)->np.ndarray:
+        # occurrences of c in bwt[:i]
+        base = i - i % block
+        window = np.asarray(self.bwt)[base[:, None] + np.arange(block)]
+        inblock = ((window == c[:, None]) & (np.arange(block) < (i % block)[:, None])).sum(axis=1)
+        return self.occ[i//block, c].astype(np.int64) + inblock
+
+    def extend(self, c:np.ndarray, lo:np.ndarray, hi:np.ndarray)->tuple[np.ndarray,np.ndarray]:
+        # backward search step: interval of c + pattern from the interval of pattern
+        return self.C[c] + self.rank(c, lo), self.C[c] + self.rank(c, hi)
+
+
+def longest_block(reference:os.PathLike, queries:np.ndarray)->np.ndarray:
+    index = FMIndex(reference, mmap=True)
+    nq, length = queries.shape
+
+    # on-target occurrence: skipped when the full oligo is in the reference
+    lo, hi = np.zeros(nq, dtype=np.int64), np.full(nq, index.size, dtype=np.int64)
+    for j in range(length-1, -1, -1):
+        lo, hi = index.extend(queries[:, j], lo, hi)
+    skip = (hi > lo).astype(np.int64)
+
+    # one backward search per end position, all in lockstep
+    query = np.repeat(np.arange(nq), length)
+    pos = np.tile(np.arange(length), nq)          # next character to add
+    lo, hi = np.zeros(len(query), dtype=np.int64), np.full(len(query), index.size, dtype=np.int64)
+    match = np.zeros(len(query), dtype=np.int64)
+
+    # the seed-mer ending at each position, from the table when it occurs off-target
+    seed = index.seed
+    if length >= seed:
+        kmer = np.zeros((nq, length-seed+1), dtype=np.int64)
+        valid = np.ones((nq, length-seed+1), dtype=bool)
+        for j in range(seed):
+            part = queries[:, j:j+length-seed+1]
+            kmer = (kmer << 2) | ((part.astype(np.int64) - 1) & 3)
+            valid &= (part >= 1) & (part <= 4)
+        ends = (query*length + pos).reshape(nq, length)[:, seed-1:].ravel()
+        interval = index.kmers[kmer.ravel()]
+        jump = valid.ravel() & (interval[:, 1] - interval[:, 0] > np.repeat(skip, length-seed+1))
+        ends = ends[jump]
+        lo[ends], hi[ends] = interval[jump, 0], interval[jump, 1]
+        match[ends] = seed
+        pos[ends] -= seed
+    active = np.flatnonzero(pos >= 0)
+    while len(active) > 0:
+        nlo, nhi = index.extend(queries[query[active], pos[active]], lo[active], hi[active])
+        ok = nhi - nlo > skip[query[active]]
+        active = active[ok]
+        lo[active], hi[active] = nlo[ok], nhi[ok]
+        match[active] += 1
+        pos[active] -= 1
+        active = active[pos[active] >= 0]
+
+    longest = np.zeros(nq, dtype=np.int64)
+    np.maximum.at(longest, query, match)
+    return longest
+
+
+def longest_offtarget(sequences:list[str], reference:os.PathLike, threads:int=1,
+                      batch:int=1024, memory:float=4)->np.ndarray:
+    # length of the longest exact off-target match of each sequence (both strands)
+    FMIndex(reference, mmap=True, memory=memory)      # build once before the workers load it
+    results = []
+    for length in sorted(set(len(seq) for seq in sequences)):
+        subset = [k for k, seq in enumerate(sequences) if len(seq) == length]
+        queries = encode(''.join(sequences[k] for k in subset)).reshape(len(subset), length)
+        parts = Parallel(n_jobs=threads)(delayed(longest_block)(reference, queries[i:i+batch])
+                                         for i in tqdm(range(0, len(queries), batch), desc="Searching the FM-index"))
+        results.append((subset, np.concatenate(parts)))
+    longest = np.zeros(len(sequences), dtype=np.int64)
+    for subset, part in results:
+        longest[subset] = part
+    return longest
+
+
+def fm_index(reference:os.PathLike, query:os.PathLike|None=None, threads:int=1, memory:float=4)->None:
+    # build the index, and write "name, longest off-target match" for the query oligos
+    if query is None:
+        FMIndex(reference, memory=memory)
+        return
+    names, seqs = read_fasta(query)
+    longest = longest_offtarget([seq.upper() for seq in seqs], reference, threads, memory=memory)
+    with open(query+".longest.out", 'w') as f:
+        f.writelines(f"{name}, {value}\n" for name, value in zip(names, longest))
+
+
+@click.command(
+    name="fm_index",
+    help="Build the FM-index of a reference and compute the longest off-target exact match of query oligos."
+)
+@click.option('-r', '--reference', type=click.Path(exists=True), help="Reference genome (FASTA).")
+@click.option('-q', '--query', type=click.Path(exists=True), help="Query FASTA file (optional: only build the index).")
+@click.option('-t', '--threads', type=click.INT, default=1)
+@click.option('-M', '--memory', type=click.FLOAT, default=4, show_default=True,
+              help="Memory for building the index in GB, on top of about 3 bytes per reference base (both strands of the reference).")
+def main(reference:str, query:str|None, threads:int, memory:float)->None:
+    fm_index(reference, query, threads, memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ def get_oligos(nt_type:str='DNA',
                gcfilter:bool = 1, 
                extfolder:os.PathLike = './data/',
                reffile:os.PathLike|None= None,
+               rois:list|None = None,     # window_ids to process, all by default
                )->None:
 
     if nt_type=='DNA':
@@ -32,6 +33,8 @@ def get_oligos(nt_type:str='DNA',
             
         f = open(roifile)
         rd = pd.read_csv(f,sep="\t",header=0)
+        if rois is not None:
+            rd = rd[rd.window_id.isin(rois)].reset_index(drop=True)
 
         for k in tqdm(range(len(rd)),desc='Retrieving sequences for all ROIs'):
             if not pd.isnull(rd.ref[k]):
@@ -76,6 +79,8 @@ def get_oligos(nt_type:str='DNA',
 
         f = open(roifile)
         rd = pd.read_csv(f,sep="\t",header=0)              
+        if rois is not None:
+            rd = rd[rd.window_id.isin(rois)].reset_index(drop=True)
                         
         # Divide into k-mers
         outcan = os.path.join(extfolder,'candidates/')
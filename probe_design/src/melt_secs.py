@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+
+# Scheduler for the melt/secs stage, in place of shell/melt_secs_parallel.sh, which starts
+# two processes per ROI at once. The candidate files are split into chunks of at most
+# `chunk` oligos (data/melt_secs/<candidates>/c0000.fa, ...), and at most `jobs` chunks are
+# processed at the same time (melting temperature, then secondary structures), so that a
+# large ROI is spread over several cores and many ROIs do not run all at once.
+# A chunk is done when its marker (c0000.done) is written; the chunks of a candidate file are
+# merged in order into melt/<candidates>.tsv and secs/<candidates>.fa.ct once all are done.
+# An interrupted run resumes with the chunks that are not done yet. The markers of the split and of
+# the candidate files hold the settings (engine) and, for the split, the oligos left to compute:
+# the candidates are split again when those changed (e.g. other entries in the shared cache since).
+# With a thermodynamics cache (thermo_cache), the oligos found in it are left out of the chunks,
+# and the results of the others are added to it.
+
+import os
+import glob
+import json
+import hashlib
+import shutil
+import subprocess
+import click
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta
+    from .tm_engine import tm_engine
+    from .thermo_cache import ThermoCache, default_path
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta
+    from tm_engine import tm_engine
+    from thermo_cache import ThermoCache, default_path
+
+# conditions of melt_secs_parallel.sh
+oligo_conc = 0.05e-6
+na_conc = 1.04
+fa_conc = 50
+
+
+def up_to_date(marker:os.PathLike, source:os.PathLike, key:str='')->bool:
+    if not os.path.exists(marker) or os.path.getmtime(marker) < os.path.getmtime(source):
+        return False
+    with open(marker) as f:
+        return f.read() == key
+
+
+def touch(marker:os.PathLike, key:str='')->None:
+    with open(marker, 'w') as f:
+        f.write(key)
+
+
+def settings_key(engine:str, names:list[str]|None=None, seqs:list[str]|None=None, chunk:int|None=None)->str:
+    # settings of a marker, with the oligos to compute for the split
+    content = json.dumps({'engine': engine, 'chunk': chunk, 'names': names or [], 'seqs': seqs or []})
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def split_candidates(fasta:os.PathLike, workdir:os.PathLike, chunk:int,
+                     names:list[str], seqs:list[str], key:str='')->list[str]:
+    # chunk files of the candidates to compute, split once for the same oligos and settings (key)
+    marker = os.path.join(workdir, "split.done")
+    if not up_to_date(marker, fasta, key):
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        for k, start in enumerate(range(0, len(seqs), chunk)):
+            with open(os.path.join(workdir, f"c{k:04d}.fa"), 'w') as f:
+                f.writelines(f">{name}\n{seq}\n" for name, seq in zip(names[start:start+chunk], seqs[start:start+chunk]))
+        touch(marker, key)
+    return sorted(glob.glob(os.path.join(workdir, "c*.fa")))
+
+
+def process_chunk(chunkfile:os.PathLike, engine:str='melt_duplex')->None:
+    # melting temperatures (<chunk>.tsv) and secondary structures (<chunk>.fa.ct) of a chunk
+    workdir, name = os.path.split(chunkfile)
+    melt = chunkfile[:-3]+'.tsv'
+    if engine == 'python':
+        tm_engine(chunkfile, melt, 'DNA:DNA', oligo_conc, na_conc, fa_conc=fa_conc, celsius=True)
+    else:
+        with open(melt, 'w') as f:
+            subprocess.run(["melt_duplex", "-C", "-t", "DNA:DNA", "-o", str(oligo_conc), "-n", str(na_conc),
+                            "-f", str(fa_conc), name], cwd=workdir, stdout=f, stderr=subprocess.DEVNULL, check=True)
+    subprocess.run(["hybrid-ss-min", "-n", "DNA", "-N", str(na_conc), name], cwd=workdir,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    touch(chunkfile[:-3]+'.done')
+
+
+def unfolded_record(name:str, seq:str, dg:float=0)->str:
+    # hybrid-ss-min .ct record of the open chain (with the dG of a cached structure)
+    n = len(seq)
+    lines = [f"{n}\tdG = {dg:g}\t{name}\n"]
+    lines.extend(f"{i}\t{base}\t{i-1}\t{i+1 if i < n else 0}\t0\t{i}\t0\t0\n" for i, base in enumerate(seq, start=1))
+    return ''.join(lines)
+
+
+def read_ct(path:os.PathLike)->list[str]:
+    # records of a .ct file, in order
+    records = []
+    with open(path) as f:
+        lines = f.readlines()
+    k = 0
+    while k < len(lines):
+        if "dG = " not in lines[k]:
+            k += 1
+            continue
+        n = int(lines[k].split("\t")[0])
+        records.append(''.join(lines[k:k+n+1]))
+        k += n + 1
+    return records
+
+
+def merge_chunks(chunks:list[str], names:list[str], seqs:list[str], meltout:os.PathLike, secsout:os.PathLike,
+                 cached_melt:dict|None=None, cached_secs:dict|None=None)->tuple[dict,dict]:
+    # melt table and .ct file of all oligos, in order, from the cache or the chunks.
+    # Returns the values computed in the chunks: sequence -> (dG, dH, dS, Tm) and sequence -> (ss_dG,)
+    # melt_duplex skips the invalid oligos (rows by name), hybrid-ss-min folds all of them (records in order)
+    cached_melt = {} if cached_melt is None else cached_melt
+    cached_secs = {} if cached_secs is None else cached_secs
+    melt_rows, ct_records = {}, []
+    for chunkfile in chunks:
+        with open(chunkfile[:-3]+'.tsv') as f:
+            next(f, None)
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 6:
+                    melt_rows[fields[0]] = line
+        ct_records.extend(read_ct(chunkfile+'.ct'))
+    computed = [seq not in cached_melt or seq not in cached_secs for seq in seqs]
+    if len(ct_records) != sum(computed):
+        raise RuntimeError(f"Found {len(ct_records)} secondary structures for {sum(computed)} oligos in {os.path.basename(secsout)}.")
+    ct_records = iter(ct_records)
+
+    computed_melt, computed_secs = {}, {}
+    with open(meltout+'.tmp', 'w') as melt, open(secsout+'.tmp', 'w') as secs:
+        melt.write("oligo_name\tdG\tdH\tdS\tTm\tSeq\n")
+        for name, seq, chunked in zip(names, seqs, computed):
+            record = next(ct_records) if chunked else None
+            if seq in cached_melt:
+                melt.write("%s\t%f\t%f\t%f\t%f\t%s\n" % (name, *cached_melt[seq], seq))
+            elif name in melt_rows:
+                melt.write(melt_rows[name])
+                computed_melt[seq] = tuple(float(x) for x in melt_rows[name].split('\t')[1:5])
+            if seq in cached_secs:
+                secs.write(unfolded_record(name, seq, cached_secs[seq][0]))
+            else:
+                secs.write(record)
+                computed_secs[seq] = (float(record.split('\n', 1)[0].split('\t')[1][5:]),)
+    os.replace(meltout+'.tmp', meltout)
+    os.replace(secsout+'.tmp', secsout)
+    return computed_melt, computed_secs
+
+
+def melt_secs(nt_type:str='DNA', jobs:int=1, chunk:int=20000, engine:str='melt_duplex',
+              datafolder:os.PathLike='./data',
+              cache:os.PathLike|None=None, cache_size:float=4, rois:list|None=None)->None:
+    # rois: window_ids of the candidate files to process, all by default
+    suffix = "RevCompl" if nt_type == 'RNA' else "Reference"
+    meltfolder, secsfolder = os.path.join(datafolder, "melt"), os.path.join(datafolder, "secs")
+    os.makedirs(meltfolder, exist_ok=True)
+    os.makedirs(secsfolder, exist_ok=True)
+
+    melt_conditions = f"DNA:DNA oligo={oligo_conc} Na={na_conc} FA={fa_conc}"
+    secs_conditions = f"DNA Na={na_conc}"
+    thermo = ThermoCache(cache, cache_size) if cache is not None else None
+
+    # chunks still to process, over all candidate files
+    files, pending = {}, []
+    for fasta in sorted(glob.glob(os.path.join(datafolder, "candidates", f"*{suffix}.fa"))):
+        stem = os.path.basename(fasta)[:-3]
+        if rois is not None and stem.split('.')[0] not in [f"roi_{roi}" for roi in rois]:
+            continue
+        workdir = os.path.join(datafolder, "melt_secs", stem)
+        if up_to_date(os.path.join(datafolder, "melt_secs", stem+".done"), fasta, settings_key(engine)):
+            continue
+        names, seqs = read_fasta(fasta)
+        seqs = [seq.upper() for seq in seqs]
+        cached_melt, cached_secs = {}, {}
+        if thermo is not None:
+            cached_melt = thermo.get('melt', melt_conditions, seqs)
+            cached_secs = thermo.get('secs', secs_conditions, seqs)
+        miss = [k for k, seq in enumerate(seqs) if seq not in cached_melt or seq not in cached_secs]
+        names_miss, seqs_miss = [names[k] for k in miss], [seqs[k] for k in miss]
+        chunks = split_candidates(fasta, workdir, chunk, names_miss, seqs_miss,
+                                  settings_key(engine, names_miss, seqs_miss, chunk))
+        files[stem] = (chunks, names, seqs, cached_melt, cached_secs)
+        pending.extend(c for c in chunks if not up_to_date(c[:-3]+'.done', c))
+        if thermo is not None:
+            print(f"{stem}: {len(seqs) - len(miss)} of {len(seqs)} oligos found in the thermodynamics cache.")
+    print(f"{len(pending)} chunks of {len(files)} candidate files to process.")
+
+    Parallel(n_jobs=jobs)(delayed(process_chunk)(chunkfile, engine)
+                          for chunkfile in tqdm(pending, desc="Calculating melting temperatures and secondary structures"))
+
+    for stem, (chunks, names, seqs, cached_melt, cached_secs) in files.items():
+        computed_melt, computed_secs = merge_chunks(chunks, names, seqs, os.path.join(meltfolder, stem+'.tsv'),
+                                                    os.path.join(secsfolder, stem+'.fa.ct'), cached_melt, cached_secs)
+        if thermo is not None:
+            thermo.put('melt', melt_conditions, computed_melt)
+            thermo.put('secs', secs_conditions, computed_secs)
+        touch(os.path.join(datafolder, "melt_secs", stem+".done"), settings_key(engine))
+        shutil.rmtree(os.path.join(datafolder, "melt_secs", stem))
+    if thermo is not None:
+        thermo.close()
+
+
+@click.command(
+    name="melt_secs",
+    help="Melting temperatures and secondary structures of the candidate oligos, in chunks processed by at most -j jobs. "
+         "Resumes an interrupted run."
+)
+@click.argument('nt_type', type=click.Choice(['DNA', 'RNA']), default='DNA')
+@click.option('-j', '--jobs', type=click.INT, default=1, help="Max number of chunks processed at the same time.")
+@click.option('-c', '--chunk', type=click.INT, default=20000, help="Max number of oligos per chunk.")
+@click.option('-E', '--engine', type=click.Choice(['melt_duplex', 'python']), default='melt_duplex',
+              help="Melting temperature engine: melt_duplex, or the in-package tm_engine.")
+@click.option('--cache', type=click.Path(), default=None, is_flag=False, flag_value=default_path,
+              help=f"Thermodynamics cache, shared by all projects when given without path ({default_path}).")
+@click.option('--cache-size', type=click.FLOAT, default=4, help="Size limit of the cache [GB], least recently used entries evicted first.")
+def main(nt_type:str, jobs:int, chunk:int, engine:str, cache:str|None, cache_size:float)->None:
+    melt_secs(nt_type, jobs, chunk, engine, cache=cache, cache_size=cache_size)
+
+
+if __name__ == "__main__":
+    main()
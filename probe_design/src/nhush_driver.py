@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+
+# Resumable nHUSH driver, in place of shell/run_nHUSH.sh (run_nHUSH_excl.sh) and unfinished_HUSH.sh.
+# Per candidate file (ROI): split in sublength oligos, optional abundance prefilter (abundance_filter),
+# nhush --sfp (or the in-package seed index), then the fix of the candidate headers
+# (pos=chrom:start-end) as soon as this ROI is done. A completion marker <candidates>.nhush.json,
+# with the checksum of the candidate file after the fix and the parameters, is then written
+# atomically; on restart, the ROIs whose marker matches are skipped.
+# The ROIs run concurrently, largest first. Each starts with a share of the free threads
+# proportional to its size among the ROIs left, so that a small ROI does not take the whole
+# thread budget and several small ROIs run side by side.
+
+import os
+import sys
+import glob
+import json
+import hashlib
+import subprocess
+import concurrent.futures
+import click
+import numpy as np
+from joblib.externals.loky import get_reusable_executor
+
+try:
+    from .seed_hush import read_fasta, fasplit, search
+    from .abundance_filter import abundant_lmers, filter_lmers
+    from .blacklist_filter import roi_blacklist
+    from .prefilter import oligo_position
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta, fasplit, search
+    from abundance_filter import abundant_lmers, filter_lmers
+    from blacklist_filter import roi_blacklist
+    from prefilter import oligo_position
+
+
+def fix_headers(fasta:os.PathLike)->None:
+    # ROI_1 pos=chr1:1000-5000|1:41 -> ROI_1 pos=chr1:1000-1040 (headers already fixed are kept)
+    names, seqs = read_fasta(fasta)
+    with open(fasta+'.tmp', 'w') as f:
+        for name, seq in zip(names, seqs):
+            if '|' in name:
+                chrom, start, end = oligo_position(name)
+                name = f"{name.split()[0]} pos={chrom}:{start}-{end}"
+            f.write(f">{name}\n{seq}\n")
+    os.replace(fasta+'.tmp', fasta)
+
+
+def checksum(path:os.PathLike)->str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1<<20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def completed(fasta:os.PathLike, params:dict)->bool:
+    # marker of a finished ROI, for the same candidates and parameters
+    if not os.path.exists(fasta+'.nhush.json'):
+        return False
+    with open(fasta+'.nhush.json') as f:
+        marker = json.load(f)
+    return (marker['params'] == params and os.path.exists(marker['mindist'])
+            and marker['checksum'] == checksum(fasta))
+
+
+def genome(datafolder:os.PathLike, fasta:os.PathLike, excl:bool=False)->str:
+    # reference of the search: masked for the ROI in exclusion mode (as run_nHUSH_excl.sh)
+    if excl:
+        masked = os.path.join(datafolder, "ref", "genome_"+os.path.basename(fasta).split('.')[0]+".fa")
+        if os.path.exists(masked):
+            return masked
+    return os.path.join(datafolder, "ref", "genome.fa")
+
+
+def nhush_roi(fasta:os.PathLike, reference:os.PathLike, length:int, sublength:int|None, mismatch:int,
+              threads:int=1, inhash:int=14, engine:str='nhush', abundance:int|None=None, maxconsec:int=32,
+              excl:bool=False, blfolder:os.PathLike='./data/blacklist', hushdir:os.PathLike='./HUSH/nhush')->str:
+    # min distances of the (sublength) oligos of one candidate file; returns the .mindist.uint8 file
+    query = fasta
+    if sublength is not None:
+        if engine == 'python':
+            query = fasplit(fasta, length, sublength)
+        else:
+            subprocess.run(["nhush", "fasplit", "--length", str(length), "--sub-length", str(sublength), "--file", fasta], check=True)
+            query = f"{fasta}.{sublength}mers"
+        if abundance is None:
+            # prefilter of an earlier run, for another query
+            if os.path.exists(query+'.abundant.npz'):
+                os.remove(query+'.abundant.npz')
+        else:
+            if excl:
+                blacklist = roi_blacklist(query, blfolder, length, abundance)
+            else:
+                blacklist = os.path.join(blfolder, f"genome.fa.abundant_L{length}_T{abundance}.fa")
+            filter_lmers(query, abundant_lmers(blacklist, length, sublength), length, sublength, maxconsec)
+
+    size = sublength if sublength is not None else length
+    mindist = f"{query}.nh.L{size}.mindist.uint8"
+    if os.path.getsize(query) == 0:
+        open(mindist, 'wb').close()
+    elif engine == 'python':
+        _, seqs = read_fasta(query)
+        _, closest = search([seq.upper() for seq in seqs], reference, mismatch, threads)
+        closest.astype(np.uint8).tofile(mindist+'.tmp')
+        os.replace(mindist+'.tmp', mindist)
+    else:
+        # as run_nHUSH.sh, from a HUSH folder with a link to the reference
+        os.makedirs(hushdir, exist_ok=True)
+        try:
+            os.symlink(os.path.abspath(reference), os.path.join(hushdir, os.path.basename(reference)))
+        except FileExistsError:
+            pass
+        subprocess.run(["nhush", "--hash", str(inhash), "--length", str(size), "--until", str(mismatch),
+                        "--threads", str(threads), "--external", os.path.abspath(query),
+                        "--file", os.path.basename(reference), "--sfp"], cwd=hushdir, check=True)
+    return mindist
+
+
+def finish_roi(fasta:os.PathLike, mindist:os.PathLike, params:dict)->None:
+    # header fix of this ROI, then its completion marker
+    fix_headers(fasta)
+    with open(fasta+'.nhush.json.tmp', 'w') as f:
+        json.dump({'checksum': checksum(fasta), 'mindist': mindist, 'params': params}, f)
+    os.replace(fasta+'.nhush.json.tmp', fasta+'.nhush.json')
+
+
+def run_roi(fasta:os.PathLike, params:dict, threads:int, inhash:int, datafolder:os.PathLike)->None:
+    mindist = nhush_roi(fasta, genome(datafolder, fasta, params['excl']), params['length'], params['sublength'],
+                        params['mismatch'], threads, inhash, params['engine'], params['abundance'],
+                        params['maxconsec'], params['excl'], os.path.join(datafolder, "blacklist"),
+                        os.path.join(os.path.dirname(os.path.abspath(datafolder)), "HUSH", "nhush"))
+    finish_roi(fasta, mindist, params)
+    # joblib workers sized for this ROI, not for the next one of the process
+    get_reusable_executor().shutdown(wait=True)
+
+
+def nhush_driver(suffix:str='Reference', length:int=40, sublength:int|None=21, mismatch:int=3, threads:int=1,
+                 inhash:int=14, engine:str='nhush', abundance:int|None=None, maxconsec:int=32, excl:bool=False,
+                 datafolder:os.PathLike='./data')->tuple[int,int,int]:
+    # returns the number of ROIs run, already done and failed (inhash does not change the distances)
+    params = {'length': length, 'sublength': sublength, 'mismatch': mismatch, 'engine': engine,
+              'abundance': abundance, 'maxconsec': maxconsec, 'excl': excl}
+    files = sorted(glob.glob(os.path.join(datafolder, "candidates", f"*{suffix}.fa")))
+    pending = [fasta for fasta in files if not completed(fasta, params)]
+    sizes = {fasta: os.path.getsize(fasta) for fasta in pending}
+    pending.sort(key=lambda fasta: -sizes[fasta])
+    print(f"{len(pending)} of {len(files)} candidate files to run, {len(files)-len(pending)} already done.")
+
+    running, failed = {}, []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=threads) as pool:
+        while pending or running:
+            free = threads - sum(share for _, share in running.values())
+            while pending and free > 0:
+                fasta = pending.pop(0)
+                left = sizes[fasta] + sum(sizes[other] for other in pending)
+                share = max(1, min(free, round(free*sizes[fasta]/max(left, 1))))
+                running[pool.submit(run_roi, fasta, params, share, inhash, datafolder)] = (fasta, share)
+                free -= share
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                fasta, share = running.pop(future)
+                try:
+                    future.result()
+                    print(f"{os.path.basename(fasta)} done ({share} threads).")
+                except Exception as error:
+                    failed.append(fasta)
+                    print(f"{os.path.basename(fasta)} failed: {error}")
+    return len(sizes) - len(failed), len(files) - len(sizes), len(failed)
+
+
+@click.command(
+    name="nhush_driver",
+    help="Run nHUSH on the candidate files, several ROIs at the same time sharing -t threads, "
+         "skipping the ROIs already done (resumable run_nHUSH)."
+)
+@click.option('-d', '--fishtype', type=click.Choice(['DNA', 'RNA']), default='DNA', help="FISH type.")
+@click.option('-s', '--strand', type=click.Choice(['p', 'n']), default='p', help="RNA: strand containing the sequence of interest.")
+@click.option('-L', '--length', type=click.INT, default=40, help="Oligo length.")
+@click.option('-l', '--sublength', type=click.INT, default=None, help="Sublength used for faster nHUSH.")
+@click.option('-m', '--mismatch', type=click.INT, default=3, help="Max number of mismatches being investigated.")
+@click.option('-t', '--threads', type=click.INT, default=1, help="Threads shared by all ROIs.")
+@click.option('-i', '--inhash', type=click.INT, default=14, help="Initial hash length.")
+@click.option('-E', '--engine', type=click.Choice(['nhush', 'python']), default='nhush',
+              help="nhush, or the in-package seed index.")
+@click.option('-a', '--abundance', type=click.INT, default=None,
+              help="Abundance of the blacklist (generate_blacklist -c): sublength oligos found in it are not searched.")
+@click.option('-x', '--maxconsec', type=click.INT, default=32, help="Max consecutive match of the scoring function, with -a.")
+@click.option('--excl', is_flag=True, help="Exclusion mode: masked genome ref/genome_roi_N.fa of each ROI (as run_nHUSH_excl).")
+def main(fishtype:str, strand:str, length:int, sublength:int|None, mismatch:int, threads:int, inhash:int,
+         engine:str, abundance:int|None, maxconsec:int, excl:bool)->None:
+    suffix = "RevCompl" if fishtype == 'RNA' and strand == 'p' else "Reference"
+    ran, done, failed = nhush_driver(suffix, length, sublength, mismatch, threads, inhash, engine, abundance, maxconsec, excl)
+    print(f"{ran} ROIs run, {done} already done, {failed} failed.")
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+# Hard filters on the candidate oligos, right after get_oligos, so that the oligos that would
+# get a prohibitive cost (1e10) in the scoring functions are not sent to melt/secs and nHUSH:
+#   homopolymer: run of at least maxid identical bases (as the -i filter of escafish_score)
+#   N:           any base other than A, C, G, T
+#   repeat:      dinucleotide repeated at least `repeats` times in a row (low complexity)
+#   blacklist:   oligo found as such in the abundant-oligo blacklist (bl_dist = 0, optional)
+# The candidate files are filtered in place. The dropped oligos are written to
+# data/dropped/<candidates>.tsv (name, chromosome, start, end, sequence, reason), anew for
+# each filtered candidate file (a file with nothing to drop, e.g. already filtered, keeps it).
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import glob
+import click
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta
+    from .blacklist_filter import roi_blacklist
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta
+    from blacklist_filter import roi_blacklist
+
+
+def sliding_all(condition:np.ndarray, width:int)->np.ndarray:
+    # True where condition holds at width consecutive positions, starting there
+    if width <= 0:
+        return np.ones((condition.shape[0], condition.shape[1]+1), dtype=bool)
+    count = np.concatenate([np.zeros((len(condition), 1), dtype=np.int64), np.cumsum(condition, axis=1)], axis=1)
+    return count[:, width:] - count[:, :-width] == width
+
+
+def hard_filters(sequences:list[str], maxid:int=6, repeats:int=5,
+                 blacklist:set|None=None)->np.ndarray:
+    # reason for dropping each oligo ('' if kept), the first failing filter
+    reasons = np.full(len(sequences), '', dtype=object)
+    lengths = np.array([len(seq) for seq in sequences])
+    for length in np.unique(lengths):
+        subset = np.flatnonzero(lengths == length)
+        raw = np.frombuffer(''.join(sequences[k] for k in subset).encode(), dtype=np.uint8).reshape(len(subset), length)
+        upper = np.frombuffer(''.join(sequences[k] for k in subset).upper().encode(), dtype=np.uint8).reshape(len(subset), length)
+
+        failed = {}
+        if maxid > 0 and length >= maxid:
+            failed['homopolymer'] = sliding_all(raw[:, 1:] == raw[:, :-1], maxid-1).any(axis=1)
+        failed['N'] = ~np.isin(upper, np.frombuffer(b'ACGT', dtype=np.uint8)).all(axis=1)
+        if repeats > 1 and length >= 2*repeats:
+            period = sliding_all(upper[:, 2:] == upper[:, :-2], 2*repeats-2)[:, :length-2*repeats+1]
+            failed['repeat'] = (period & (upper[:, :length-2*repeats+1] != upper[:, 1:length-2*repeats+2])).any(axis=1)
+        if blacklist is not None:
+            failed['blacklist'] = np.array([sequences[k].upper() in blacklist for k in subset], dtype=bool)
+
+        # reported in the order above
+        for reason, mask in reversed(failed.items()):
+            reasons[subset[mask]] = reason
+    return reasons
+
+
+def oligo_position(name:str)->tuple[str,int,int]:
+    # chromosome, start and end of a candidate from its header:
+    # "ROI_1 pos=chr1:1000-5000|1:41" (get_oligos) or "ROI_1 pos=chr1:1000-1040" (after run_nHUSH)
+    match = re.search(r'pos=([0-9A-Za-z_]+):([0-9]+)-([0-9]+)(?:\|([0-9]+):([0-9]+))?', name)
+    if match is None:
+        return '', -1, -1
+    chrom, start, end, first, last = match.groups()
+    if first is None:
+        return chrom, int(start), int(end)
+    return chrom, int(start)+int(first)-1, int(start)+int(last)-1
+
+
+def prefilter(maxid:int=6, repeats:int=5, cutoff:int|None=None, candfolder:os.PathLike='./data/candidates',
+              blfolder:os.PathLike='./data/blacklist', droppedfolder:os.PathLike='./data/dropped')->tuple[int,int]:
+    # filters all candidate files in place; returns the number of oligos dropped and the number of oligos
+    os.makedirs(droppedfolder, exist_ok=True)
+    dropped, total = 0, 0
+    blacklists = {}
+    for fasta in tqdm(sorted(glob.glob(os.path.join(candfolder, "*.fa"))), desc="Filtering the candidates"):
+        names, seqs = read_fasta(fasta)
+        if len(seqs) == 0:
+            continue
+        blacklist = None
+        if cutoff is not None:
+            path = roi_blacklist(fasta, blfolder, len(seqs[0]), cutoff)
+            if path not in blacklists:
+                blacklists[path] = set(seq.upper() for seq in read_fasta(path)[1])
+            blacklist = blacklists[path]
+        reasons = hard_filters(seqs, maxid, repeats, blacklist)
+        drop = reasons != ''
+        dropped, total = dropped + drop.sum(), total + len(seqs)
+        if not drop.any():
+            continue
+
+        positions = [oligo_position(names[k]) for k in np.flatnonzero(drop)]
+        table = pd.DataFrame({'name': [names[k] for k in np.flatnonzero(drop)],
+                              'chromosome': [p[0] for p in positions], 'start': [p[1] for p in positions],
+                              'end': [p[2] for p in positions], 'sequence': [seqs[k] for k in np.flatnonzero(drop)],
+                              'reason': reasons[drop]})
+        sidecar = os.path.join(droppedfolder, os.path.basename(fasta)[:-3]+'.tsv')
+        table.to_csv(sidecar, sep="\t", index=False)
+        with open(fasta+'.tmp', 'w') as f:
+            f.writelines(f">{names[k]}\n{seqs[k]}\n" for k in np.flatnonzero(~drop))
+        os.replace(fasta+'.tmp', fasta)
+    return int(dropped), int(total)
+
+
+@click.command(
+    name="prefilter",
+    help="Drop the candidate oligos failing the hard filters (homopolymers, N, dinucleotide repeats, "
+         "optionally the blacklist) before melt/secs and nHUSH."
+)
+@click.option('-i', '--maxid', type=click.INT, default=6, help="Min length of a homopolymer run to drop the oligo (as build-db -i). 0: off.")
+@click.option('-r', '--repeats', type=click.INT, default=5, help="Min number of dinucleotide repeats to drop the oligo. 0: off.")
+@click.option('-c', '--cutoff', type=click.INT, default=None,
+              help="Also drop the oligos found in the blacklist of this abundance (generate_blacklist -c).")
+@click.option('--candfolder', type=click.Path(exists=True), default='./data/candidates')
+@click.option('--blfolder', type=click.Path(), default='./data/blacklist')
+def main(maxid:int, repeats:int, cutoff:int|None, candfolder:str, blfolder:str)->None:
+    dropped, total = prefilter(maxid, repeats, cutoff, candfolder, blfolder)
+    print(f"{dropped} of {total} oligos dropped, see ./data/dropped/.")
+
+
+if __name__ == "__main__":
+    main()
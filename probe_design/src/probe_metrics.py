@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+# Probe metrics shared by cycling_query.selectprobes, select_probe and summarize_probes*.
+# All probe files are read into a single oligo table (probe_id = position in the file list),
+# the metrics are computed with one groupby and the ROI coordinates are joined by window_id.
+
+import numpy as np
+import pandas as pd
+import os
+import io
+from joblib import Parallel, delayed
+
+try:
+    from .probe_query import pw_from_filename
+except ImportError:     # run as a script through prb
+    from probe_query import pw_from_filename
+
+metric_columns = ['fullpath', 'folder', 'probe_set', 'roi', 'chr', 'probe_start', 'probe_end', \
+            'nOligos', 'pw', 'probe_size', 'region_size', 'coverage', \
+            'centrality', 'd_max_pcregion', 'd_max_pcprobe',\
+            'd_mean', 'd_min', 'd_max', 'd_std', \
+            'tm_range', 'tm_mean', 'tm_std', \
+            'gc_range', 'gc_mean', 'gc_std', \
+            'mean_closestMM', 'min_closestMM', 'max_closestMM', 'std_closestMM', \
+            'mean_cumulMM', 'min_cumulMM', 'max_cumulMM', 'std_cumulMM', \
+            'mean_oligo_cost', 'min_oligo_cost', 'max_oligo_cost', 'std_oligo_cost' ,\
+            'sum_inv_cost']
+oligo_columns = ['name', 'chromosome', 'start', 'end', 'Tm', 'gc_content',
+                 'off_target_no', 'off_target_sum', 'oligo_cost']       # columns the metrics are computed from
+
+
+def read_batch(filenames:list[str], first:int)->list[pd.DataFrame]:
+    # concatenate a batch of probe files and parse them at once (one parse per distinct header)
+    groups = {}
+    for k, file in enumerate(filenames):
+        with open(file) as f:
+            header, _, body = f.read().partition('\n')
+        body = body.rstrip('\n')
+        if body == '':
+            continue
+        texts, ids, counts = groups.setdefault(header, ([], [], []))
+        texts.append(body)
+        ids.append(first+k)
+        counts.append(body.count('\n')+1)
+
+    frames = []
+    for header, (texts, ids, counts) in groups.items():
+        frame = pd.read_csv(io.StringIO(header+'\n'+'\n'.join(texts)), sep="\t", usecols=oligo_columns)
+        frame['probe_id'] = np.repeat(ids, counts)
+        frames.append(frame)
+    return frames
+
+
+def read_probes(filenames:list[str], threads:int=1, batch:int=1000)->pd.DataFrame:
+    # all oligos of all probe files, in file order, with the probe_id of their file
+    batches = Parallel(n_jobs=threads, prefer="threads")(delayed(read_batch)(filenames[k:k+batch], k)
+                                                         for k in range(0, len(filenames), batch))
+    frames = [frame for frames in batches for frame in frames]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=oligo_columns+['probe_id'])
+    return pd.concat(frames, ignore_index=True).sort_values('probe_id', kind='stable').reset_index(drop=True)
+
+
+def probe_metrics(filenames:list[str], rdroi:pd.DataFrame, threads:int=1)->pd.DataFrame:
+    # one row per probe file (index: probe_id), columns: metric_columns
+    oligos = read_probes(filenames, threads)
+    if len(oligos) == 0:
+        return pd.DataFrame(columns=metric_columns)
+
+    # distance to the previous oligo of the same probe
+    oligos['d'] = oligos.start - oligos.groupby('probe_id').end.shift()
+    oligos['inv_cost'] = 1/oligos.oligo_cost
+
+    table = oligos.groupby('probe_id').agg(
+        roi_name=('name', 'first'), chr=('chromosome', 'first'),
+        probe_start=('start', 'min'), probe_end=('end', 'max'), nOligos=('start', 'size'),
+        d_mean=('d', 'mean'), d_min=('d', 'min'), d_max=('d', 'max'), d_std=('d', 'std'),
+        tm_min=('Tm', 'min'), tm_max=('Tm', 'max'), tm_mean=('Tm', 'mean'), tm_std=('Tm', 'std'),
+        gc_min=('gc_content', 'min'), gc_max=('gc_content', 'max'), gc_mean=('gc_content', 'mean'), gc_std=('gc_content', 'std'),
+        mean_closestMM=('off_target_no', 'mean'), min_closestMM=('off_target_no', 'min'),
+        max_closestMM=('off_target_no', 'max'), std_closestMM=('off_target_no', 'std'),
+        mean_cumulMM=('off_target_sum', 'mean'), min_cumulMM=('off_target_sum', 'min'),
+        max_cumulMM=('off_target_sum', 'max'), std_cumulMM=('off_target_sum', 'std'),
+        mean_oligo_cost=('oligo_cost', 'mean'), min_oligo_cost=('oligo_cost', 'min'),
+        max_oligo_cost=('oligo_cost', 'max'), std_oligo_cost=('oligo_cost', 'std'),
+        sum_inv_cost=('inv_cost', 'sum'))
+    table['tm_range'] = table.tm_max - table.tm_min
+    table['gc_range'] = table.gc_max - table.gc_min
+
+    # file information
+    paths = pd.Series(filenames, dtype=str)[table.index]
+    table['fullpath'] = paths.to_numpy()
+    table['folder'] = [os.path.basename(os.path.dirname(path)) for path in paths]
+    table['probe_set'] = [os.path.basename(path) for path in paths]
+    table['pw'] = [pw_from_filename(path) for path in paths]
+
+    # ROI coordinates
+    table['roi'] = table.roi_name.str[4:].astype(int)
+    rois = rdroi.set_index('window_id')[['Window_start','Window_end']]
+    table = table.join(rois, on='roi')
+    table['probe_size'] = table.probe_end - table.probe_start + 1
+    table['region_size'] = table.Window_end - table.Window_start + 1
+    table['coverage'] = table.probe_size/table.region_size
+    roi_center = (table.Window_start + table.Window_end)/2 - table.Window_start         # adjusted roi center
+    probe_center = (table.probe_start + table.probe_end)/2 - table.Window_start         # adjusted probe center
+    table['centrality'] = np.minimum(probe_center/roi_center, 2 - probe_center/roi_center)
+    table['d_max_pcregion'] = 100*table.d_max/table.region_size
+    table['d_max_pcprobe'] = 100*table.d_max/table.probe_size
+
+    return table[metric_columns]
@@ -0,0 +1,661 @@
+#!/usr/bin/python3
+
+# In-package probe query, alternative to shell/probe-query.sh (escafish).
+# Each ROI oligo database is parsed and indexed once, and all pair weights
+# are then solved against the same in-memory arrays.
+#
+# Probe cost for n oligos i_1 < ... < i_n (sorted by position):
+#   sum_k oligo_cost(i_k) + pw * sum_k |gap_k - ideal_gap|
+# with gap_k = start(i_k+1) - end(i_k) >= 0 (oligos may not overlap) and
+# ideal_gap the spacing that spreads n oligos evenly over the database span.
+# Low pair weights favour good oligos, high pair weights favour even spacing.
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import sys
+import click
+import logging
+import subprocess
+import time
+from datetime import datetime
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+types = {'DNA' : 'Reference', 'RNA' : 'RevCompl'}
+pair_weights = [1e-1, 1e-2, 1e-3, 1e-4, 1e-5, 1e-6, 1e-7]    # same scan as probe-query.sh
+
+
+class OligoDB:
+    # ROI oligo database (db_tsv/*.tsv.filt) loaded once and indexed for repeated queries
+
+    def __init__(self, path:os.PathLike, dmax:int|None=None, frame:pd.DataFrame|None=None):
+        self.path = path
+        if frame is None:
+            frame = pd.read_csv(path, sep="\t", header=0)
+        # predecessor look-ups are done on oligo ends
+        self.frame = frame.sort_values(['end','start'], kind='stable').reset_index(drop=True)
+        self.start = self.frame.start.to_numpy(dtype=np.float64)
+        self.end = self.frame.end.to_numpy(dtype=np.float64)
+        self.cost = self.frame.oligo_cost.to_numpy(dtype=np.float64)
+        self.length = float(np.mean(self.end - self.start)) if len(self.frame) > 0 else 0
+        self.dmax = dmax            # optional hard limit on the gap between consecutive oligos
+        self.index = np.arange(len(self.frame))     # positions in the parent database (for subsets)
+        self._bounds = {}           # predecessor ranges, cached per ideal gap
+
+    def __len__(self):
+        return len(self.frame)
+
+    def span(self)->float:
+        return self.end[-1] - self.start.min() if len(self) > 0 else 0
+
+    def ideal_gap(self, n:int)->float:
+        # spacing that spreads n oligos evenly over the database span
+        if n < 2:
+            return 0
+        return max(0, (self.span() - n*self.length)/(n-1))
+
+    def bounds(self, ideal:float):
+        # for every oligo i, predecessors j (sorted by end) are split into
+        # [loA, hiA): gap >= ideal and [loB, hiB): 0 <= gap < ideal
+        if ideal not in self._bounds:
+            hiB = np.searchsorted(self.end, self.start, side='right')
+            hiA = np.minimum(np.searchsorted(self.end, self.start - ideal, side='right'), hiB)
+            if self.dmax is None:
+                loA = np.zeros(len(self), dtype=np.int64)
+            else:
+                loA = np.searchsorted(self.end, self.start - self.dmax, side='left')
+            loB = np.maximum(hiA, loA)
+            self._bounds[ideal] = (loA, hiA, loB, hiB)
+        return self._bounds[ideal]
+
+    def subset(self, left:float|None=None, right:float|None=None)->'OligoDB':
+        # oligos lying entirely between two anchors (end of the left oligo, start of the right oligo)
+        keep = np.ones(len(self), dtype=bool)
+        if left is not None:
+            keep &= self.start >= left
+        if right is not None:
+            keep &= self.end <= right
+        return self.take(keep)
+
+    def take(self, keep:np.ndarray)->'OligoDB':
+        # oligos of a boolean mask, with their positions in the parent database
+        sub = OligoDB(self.path, self.dmax, self.frame[keep])
+        sub.index = self.index[keep]
+        return sub
+
+    def write(self, selection:np.ndarray, out:os.PathLike)->None:
+        # export the selected oligos with the database columns, like escafish
+        probe = self.frame.iloc[np.sort(selection)]
+        probe.to_csv(out, index=False, sep="\t")
+
+
+def probe_cost(db:OligoDB, selection:np.ndarray, pw:float, ideal:float)->float:
+    selection = np.sort(selection)
+    gaps = db.start[selection[1:]] - db.end[selection[:-1]]
+    if np.any(gaps < 0) or (db.dmax is not None and np.any(gaps > db.dmax)):
+        return np.inf
+    return db.cost[selection].sum() + pw*np.abs(gaps - ideal).sum()
+
+
+def _sparse_argmin(values:np.ndarray)->list:
+    # sparse table: levels[k][i] = argmin of values[i:i+2**k]
+    levels = [np.arange(len(values))]
+    width = 1
+    while 2*width <= len(values):
+        prev = levels[-1]
+        a = prev[:len(values)-2*width+1]
+        b = prev[width:len(values)-width+1]
+        levels.append(np.where(values[b] < values[a], b, a))
+        width *= 2
+    return levels
+
+
+def _range_argmin(values:np.ndarray, levels:list, lo:np.ndarray, hi:np.ndarray)->np.ndarray:
+    # argmin of values[lo:hi] for every query, -1 for empty ranges
+    out = np.full(len(lo), -1, dtype=np.int64)
+    width = hi - lo
+    level = np.zeros(len(lo), dtype=np.int64)
+    level[width > 0] = np.floor(np.log2(width[width > 0])).astype(np.int64)
+    for k in np.unique(level[width > 0]):
+        q = np.flatnonzero((width > 0) & (level == k))
+        a = levels[k][lo[q]]
+        b = levels[k][hi[q] - 2**k]
+        out[q] = np.where(values[b] < values[a], b, a)
+    return out
+
+
+def solve_exact(db:OligoDB, n:int, pw:float, ideal:float|None=None,
+                left:float|None=None, right:float|None=None,
+                deadline:float|None=None)->np.ndarray|None:
+    # exact dynamic programming over the number of selected oligos.
+    # For each layer, min_j F(j) + pw*|s_i - e_j - ideal| is split into the
+    # gap >= ideal and gap < ideal ranges, each a range-minimum query.
+    # Optional anchors (fixed oligos ending at left / starting at right) add
+    # their gap terms to the first and last oligo, for local repairs.
+    # Raises TimeoutError if the deadline (time.monotonic()) passes before the last layer.
+    N = len(db)
+    if n < 1 or N < n:
+        return None
+    if ideal is None:
+        ideal = db.ideal_gap(n)
+    loA, hiA, loB, hiB = db.bounds(ideal)
+
+    F = db.cost.copy()
+    if left is not None:
+        F += pw*np.abs(db.start - left - ideal)
+        if db.dmax is not None:
+            F[db.start - left > db.dmax] = np.inf
+    preds = np.empty((n-1, N), dtype=np.int32)
+    for k in range(1, n):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"exact probe query cut off after {k} of {n} oligos")
+        U = F - pw*db.end         # gap >= ideal: pw*(s_i - ideal) + F(j) - pw*e_j
+        V = F + pw*db.end         # gap < ideal:  pw*(ideal - s_i) + F(j) + pw*e_j
+        argA = _range_argmin(U, _sparse_argmin(U), loA, hiA)
+        argB = _range_argmin(V, _sparse_argmin(V), loB, hiB)
+        candA = np.where(argA >= 0, pw*(db.start - ideal) + U[argA], np.inf)
+        candB = np.where(argB >= 0, pw*(ideal - db.start) + V[argB], np.inf)
+        useA = candA <= candB
+        preds[k-1] = np.where(useA, argA, argB)
+        F = db.cost + np.where(useA, candA, candB)
+
+    if right is not None:
+        F = F + pw*np.abs(right - db.end - ideal)
+        if db.dmax is not None:
+            F[right - db.end > db.dmax] = np.inf
+    if not np.isfinite(F.min()):
+        return None
+    selection = [int(np.argmin(F))]
+    for k in range(n-2, -1, -1):
+        selection.append(int(preds[k, selection[-1]]))
+    return np.array(selection[::-1])
+
+
+def solve_greedy(db:OligoDB, n:int, pw:float, deadline:float|None=None)->np.ndarray|None:
+    # place the oligos one by one around evenly spaced anchors
+    N = len(db)
+    if n < 1 or N < n:
+        return None
+    ideal = db.ideal_gap(n)
+    pitch = db.length + ideal
+    order = np.argsort(db.start, kind='stable')
+    starts = db.start[order]
+    anchor0 = starts[0]
+
+    selection = []
+    prev_end = -np.inf
+    for k in range(n):
+        first = np.searchsorted(starts, prev_end, side='left')
+        if first >= N:
+            return None
+        anchor = anchor0 + k*pitch
+        last = max(np.searchsorted(starts, anchor + pitch/2, side='left'), first+1)
+        window = order[first:last]
+        score = db.cost[window]
+        if k > 0:
+            score = score + pw*np.abs(db.start[window] - prev_end - ideal)
+        best = window[np.argmin(score)]
+        selection.append(best)
+        prev_end = db.end[best]
+    return refine(db, np.array(selection), pw, deadline=deadline)
+
+
+def refine(db:OligoDB, selection:np.ndarray, pw:float, sweeps:int=50,
+           deadline:float|None=None)->np.ndarray:
+    # coordinate descent: move each oligo to its best position between its neighbours
+    ideal = db.ideal_gap(len(selection))
+    selection = selection[np.argsort(db.start[selection])].copy()
+    n = len(selection)
+    for sweep in range(sweeps):
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        improved = False
+        for k in range(n):
+            left = db.end[selection[k-1]] if k > 0 else -np.inf
+            right = db.start[selection[k+1]] if k < n-1 else np.inf
+            first = np.searchsorted(db.end, left, side='left')
+            last = np.searchsorted(db.end, right, side='right')
+            window = np.arange(first, last)
+            window = window[db.start[window] >= left]
+            if db.dmax is not None and k > 0:
+                window = window[db.start[window] - left <= db.dmax]
+            if db.dmax is not None and k < n-1:
+                window = window[right - db.end[window] <= db.dmax]
+            if len(window) == 0:
+                continue
+            score = db.cost[window].copy()
+            if k > 0:
+                score += pw*np.abs(db.start[window] - left - ideal)
+            if k < n-1:
+                score += pw*np.abs(right - db.end[window] - ideal)
+            best = window[np.argmin(score)]
+            current = np.flatnonzero(window == selection[k])
+            if best != selection[k] and (len(current) == 0 or score.min() < score[current[0]]):
+                selection[k] = best
+                improved = True
+        if not improved:
+            break
+    return selection
+
+
+def solve(db:OligoDB, n:int, pw:float, greedy:bool=False,
+          init:np.ndarray|None=None, deadline:float|None=None)->np.ndarray|None:
+    if not greedy:
+        return solve_exact(db, n, pw)       # exact: init cannot improve on it
+    selection = solve_greedy(db, n, pw, deadline=deadline)
+    # warm start: the previous pair weight's probe is often a better starting point
+    if init is not None and len(init) == n:
+        ideal = db.ideal_gap(n)
+        warm = refine(db, init, pw, deadline=deadline)
+        if selection is None or probe_cost(db, warm, pw, ideal) < probe_cost(db, selection, pw, ideal):
+            selection = warm
+    return selection
+
+
+def solve_anytime(db:OligoDB, n:int, pw:float, deadline:float,
+                  init:np.ndarray|None=None)->tuple[np.ndarray|None,str]:
+    # greedy probe first, refined until the deadline, then replaced by the exact
+    # solution if it completes in time. Status: 'optimal' or 'deadline'.
+    selection = solve(db, n, pw, greedy=True, init=init, deadline=deadline)
+    if time.monotonic() > deadline:
+        return selection, 'deadline'
+    try:
+        return solve_exact(db, n, pw, deadline=deadline), 'optimal'
+    except TimeoutError:
+        return selection, 'deadline'
+
+
+def solve_region(db:OligoDB, n:int, pw:float, greedy:bool=False,
+                 deadline:float|None=None)->tuple[np.ndarray|None,str]:
+    # whole region at once (small ROI, or split failed), within the deadline
+    if deadline is None or greedy:
+        return solve(db, n, pw, greedy=greedy, deadline=deadline), 'greedy' if greedy else 'optimal'
+    return solve_anytime(db, n, pw, deadline)
+
+
+def solve_window(db:OligoDB, n:int, pw:float, ideal:float, deadline:float|None=None)->tuple[np.ndarray|None,bool]:
+    # exact solution of a sub-window, greedy if the deadline passes first.
+    # Returns the selection and whether the deadline cut the exact query off
+    try:
+        return solve_exact(db, n, pw, ideal, deadline=deadline), False
+    except TimeoutError:
+        return solve(db, n, pw, greedy=True, deadline=deadline), True
+
+
+def solve_split(db:OligoDB, n:int, pw:float, split:int, overlap:int=4,
+                greedy:bool=False, threads:int=1, deadline:float|None=None)->tuple[np.ndarray|None,str]:
+    # divide and conquer for large ROIs: the database is cut into sub-windows of about
+    # split oligos each, solved independently with the ROI-wide ideal gap. The probe is
+    # then stitched by re-solving the overlap oligos on either side of every boundary
+    # exactly, between the neighbouring oligos of both windows.
+    # With a deadline, the sub-windows not solved exactly in time are solved greedily and the
+    # stitching stops, except where the two windows' oligos overlap.
+    # Status: 'split', or 'deadline' if the deadline cut any of it off.
+    k = int(np.ceil(n/split))
+    if k < 2:
+        return solve_region(db, n, pw, greedy, deadline)
+    ideal = db.ideal_gap(n)
+    # windows with the same number of candidate oligos (by start, so every oligo is in one
+    # window), each getting a share of the probe proportional to its span
+    starts = np.sort(db.start)
+    edges = np.concatenate([starts[np.arange(k)*len(db)//k], [np.inf]])
+    spans = np.diff(np.append(edges[:-1], db.end[-1]))
+    quota = n*spans/spans.sum() if spans.sum() > 0 else np.full(k, n/k)
+    shares = np.floor(quota).astype(int)
+    shares[np.argsort(shares - quota, kind='stable')[:n - shares.sum()]] += 1
+    windows = [db.take((db.start >= edges[i]) & (db.start < edges[i+1])) for i in range(k)]
+    if greedy:
+        parts = Parallel(n_jobs=threads, prefer="threads")(delayed(solve)(w, m, pw, True, deadline=deadline) for w, m in zip(windows, shares))
+        cut = False
+    else:
+        solved = Parallel(n_jobs=threads, prefer="threads")(delayed(solve_window)(w, m, pw, ideal, deadline) for w, m in zip(windows, shares))
+        parts, cut = [part for part, _ in solved], any(timeout for _, timeout in solved)
+    if any(part is None for part in parts):
+        logging.info(f"Split query: a sub-window cannot hold its share of {n} oligos, solving the full region.")
+        return solve_region(db, n, pw, greedy, deadline)
+    selection = np.concatenate([np.sort(w.index[part]) for w, part in zip(windows, parts)])
+
+    # stitch the boundaries. An oligo starting in one window can overlap the first oligo of
+    # the next one: such boundaries are always stitched (a small exact query)
+    for boundary in np.cumsum(shares)[:-1]:
+        overlapping = db.start[selection[boundary]] < db.end[selection[boundary-1]]
+        if not overlapping and deadline is not None and time.monotonic() > deadline:
+            cut = True
+            continue
+        lo = max(boundary - overlap, 0)
+        hi = min(boundary + overlap, n)
+        left = db.end[selection[lo-1]] if lo > 0 else None
+        right = db.start[selection[hi]] if hi < n else None
+        local = db.subset(left, right)
+        try:
+            stitch = solve_exact(local, hi-lo, pw, ideal=ideal, left=left, right=right,
+                                 deadline=None if overlapping else deadline)
+        except TimeoutError:
+            cut = True
+            continue
+        if stitch is not None:
+            selection[lo:hi] = np.sort(local.index[stitch])
+        elif overlapping:
+            logging.info(f"Split query: cannot stitch overlapping sub-windows, solving the full region.")
+            return solve_region(db, n, pw, greedy, deadline)
+    return selection, 'deadline' if cut else 'split'
+
+
+def repair_probe(db:OligoDB, probe:pd.DataFrame, rejected:np.ndarray, pw:float)->pd.DataFrame|None:
+    # keep the accepted oligos and re-solve only the gaps left by the rejected ones,
+    # each run of rejected oligos is refilled with as many oligos between its kept neighbours.
+    # The repaired probe is made of database rows only: the kept oligos are found by start and end
+    order = np.argsort(probe.start.to_numpy(), kind='stable')
+    probe = probe.iloc[order].reset_index(drop=True)
+    rejected = np.asarray(rejected, dtype=bool)[order]
+    if rejected.all():
+        return None
+    positions = pd.Series(np.arange(len(db)), index=pd.MultiIndex.from_arrays([db.start, db.end]))
+    positions = positions[~positions.index.duplicated()]
+    kept = positions.reindex(pd.MultiIndex.from_arrays([probe.start[~rejected].to_numpy(dtype=np.float64),
+                                                        probe.end[~rejected].to_numpy(dtype=np.float64)]))
+    if kept.isna().any():
+        return None         # kept oligos no longer in the database
+    ideal = db.ideal_gap(len(probe))
+    selection = [kept.to_numpy(dtype=np.int64)]
+    k = 0
+    while k < len(probe):
+        if not rejected[k]:
+            k += 1
+            continue
+        first = k
+        while k < len(probe) and rejected[k]:
+            k += 1
+        left = probe.end[first-1] if first > 0 else None
+        right = probe.start[k] if k < len(probe) else None
+        local = db.subset(left, right)
+        refill = solve_exact(local, k-first, pw, ideal=ideal, left=left, right=right)
+        if refill is None:
+            return None
+        selection.append(local.index[refill])
+    return db.frame.iloc[np.sort(np.concatenate(selection))].reset_index(drop=True)
+
+
+def pw_label(pw:float)->str:
+    # same notation as probe-query.sh: 1E-4
+    label = f"{pw:.1E}".replace(".0E", "E")
+    return re.sub(r'E([+-])0*(\d)', r'E\1\2', label)
+
+
+def pw_from_filename(path:os.PathLike)->float:
+    # pair weight encoded in the probe file name: probe_roi_1.50oligos.pw1E-4.tsv
+    return float(re.search(r'\.pw([^/]+)\.tsv$', str(path)).group(1))
+
+
+def probe_acceptable(probe:pd.DataFrame, cutoff_cost:float, cutoff_d:float|None, cutoff_d_pc:float)->bool:
+    # same acceptance criteria as cycling_query.selectprobes
+    probe = probe.sort_values('start')
+    d = probe.start - probe.end.shift()
+    d_max_pcprobe = 100*d.max()/(probe.end.max()-probe.start.min()+1)
+    accepted = (probe.oligo_cost.max() < cutoff_cost) and (d_max_pcprobe < cutoff_d_pc)
+    if cutoff_d is not None:
+        accepted = accepted and (d.max() < cutoff_d)
+    return bool(accepted)
+
+
+def escafish_solve(db:os.PathLike, n:int, pw:float, out:os.PathLike, greedy:bool=False,
+                   timeout:float|None=None)->pd.DataFrame|None:
+    # single escafish run, as in probe-query.sh
+    command = ["escafish","--db",str(db),"--noligos",str(n),"--out",str(out),"--pw",pw_label(pw)]
+    if greedy:
+        command.append("--greedy")
+    try:
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        if os.path.isfile(out):
+            os.remove(out)      # incomplete output
+        return None
+    if not os.path.isfile(out):
+        return None
+    return pd.read_csv(out, sep="\t", header=0)
+
+
+def escafish_anytime(db:os.PathLike, n:int, pw:float, out:os.PathLike,
+                     deadline:float)->tuple[pd.DataFrame|None,str]:
+    # greedy escafish first, replaced by the full query if it finishes before the deadline.
+    # The greedy run is fast and has no timeout, so every ROI gets a probe even past the deadline
+    probe = escafish_solve(db, n, pw, out, greedy=True)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return probe, 'deadline'
+    full = escafish_solve(db, n, pw, str(out)+".full", timeout=remaining)
+    if full is None:
+        return probe, 'deadline' if time.monotonic() > deadline else 'greedy'
+    os.replace(str(out)+".full", out)
+    return full, 'optimal'
+
+
+def solve_probe(db:OligoDB|os.PathLike, n:int, pw:float, out:os.PathLike,
+                greedy:bool=False, engine:str='python',
+                init:np.ndarray|None=None,
+                deadline:float|None=None,
+                split:int|None=None,
+                threads:int=1)->tuple[pd.DataFrame|None,np.ndarray|None,str]:
+    # one probe written to out, with the in-package solver (db: OligoDB) or escafish (db: path).
+    # Returns the probe, the selection (in-package solver only) and the status:
+    # 'optimal', 'greedy', 'deadline' (best probe found before the deadline)
+    # or 'split' (sub-window solve of a large ROI)
+    status = 'greedy' if greedy else 'optimal'
+    if engine == 'escafish':
+        if deadline is None or greedy:
+            probe = escafish_solve(db, n, pw, out, greedy)
+        else:
+            probe, status = escafish_anytime(db, n, pw, out, deadline)
+        return probe, None, status
+    if split is not None and n > split:
+        selection, status = solve_split(db, n, pw, split, greedy=greedy, threads=threads, deadline=deadline)
+    elif deadline is None or greedy:
+        selection = solve(db, n, pw, greedy=greedy, init=init, deadline=deadline)
+    else:
+        selection, status = solve_anytime(db, n, pw, deadline, init=init)
+    if selection is None:
+        return None, None, status
+    db.write(selection, out)
+    return db.frame.iloc[np.sort(selection)], selection, status
+
+
+def adaptive_pw_search(solve_at, accept, lo:float=-7, hi:float=-1, tol:float=1)->tuple[float|None,int]:
+    # bracket-and-refine over log10(pw) for the smallest accepted pair weight.
+    # Larger pair weights space the oligos more evenly, so acceptance is assumed
+    # to be monotone in pw: stop as soon as the boundary is bracketed within tol.
+    solves = 0
+    def accepted(x:float)->bool:
+        nonlocal solves
+        solves += 1
+        probe = solve_at(10**x)
+        return probe is not None and accept(probe)
+
+    if not accepted(hi):
+        return None, solves
+    if accepted(lo):
+        return 10**lo, solves
+    while hi - lo > tol:
+        mid = (lo+hi)/2
+        if accepted(mid):
+            hi = mid
+        else:
+            lo = mid
+    return 10**hi, solves
+
+
+def roi_db_path(currentfolder:os.PathLike, strand:str, roi:int)->str:
+    # filtered ROI database, as read by probe-query.sh
+    return os.path.join(currentfolder, f"db_tsv/db.roi_{roi}.GC35to85_{types[strand]}.tsv.filt")
+
+
+def roi_deadline(timeout:float|None, deadline:float|None)->float|None:
+    # per-ROI time budget (seconds from now), capped by the global deadline
+    if timeout is not None:
+        deadline = min(time.monotonic()+timeout, deadline if deadline is not None else np.inf)
+    return deadline
+
+
+def query_roi(db:OligoDB|os.PathLike, roi:int, oligos:list[int], outfolder:os.PathLike,
+              pws:list[float] = pair_weights,
+              greedy:bool = False,
+              engine:str = 'python',
+              timeout:float|None = None,
+              deadline:float|None = None,
+              split:int|None = None,
+              threads:int = 1)->int:
+    # solve all oligo counts and pair weights for one ROI from a single database load.
+    # Pair weights are solved in order so each greedy query warm-starts from the previous probe.
+    # With a time budget, every probe is answered greedily first and the exact
+    # query only runs while the ROI (timeout, seconds) and global deadline allow.
+    # Probes with more than split oligos are solved in sub-windows (threads in parallel).
+    if engine == 'python' and not isinstance(db, OligoDB):
+        db = OligoDB(db)
+    deadline = roi_deadline(timeout, deadline)
+    os.makedirs(outfolder, exist_ok=True)
+    found = 0
+    for n in oligos:
+        previous = None
+        for pw in pws:
+            out = os.path.join(outfolder, f"probe_roi_{roi}.{n}oligos.pw{pw_label(pw)}.tsv")
+            probe, selection, status = solve_probe(db, n, pw, out, greedy, engine, previous, deadline, split, threads)
+            if probe is None:
+                logging.info(f"No probe with {n} oligos for region {roi}, pair weight: {pw_label(pw)}.")
+                continue
+            if deadline is not None or status == 'split':
+                logging.info(f"Region {roi}, {n} oligos, pair weight {pw_label(pw)}: {status}.")
+            previous = selection
+            found += 1
+    return found
+
+
+def adaptive_query_roi(db:os.PathLike, roi:int, oligos:list[int], outfolder:os.PathLike,
+                       cutoff_cost:float, cutoff_d:float|None, cutoff_d_pc:float,
+                       greedy:bool = False,
+                       engine:str = 'python',
+                       tol:float = 1,
+                       timeout:float|None = None,
+                       deadline:float|None = None,
+                       split:int|None = None,
+                       threads:int = 1)->int:
+    # adaptive pair weight search instead of the fixed 7-point scan,
+    # driven by the selectprobes acceptance criteria
+    if engine == 'python':
+        db = OligoDB(db)
+    deadline = roi_deadline(timeout, deadline)
+    os.makedirs(outfolder, exist_ok=True)
+    accept = lambda probe: probe_acceptable(probe, cutoff_cost, cutoff_d, cutoff_d_pc)
+    total = 0
+    for n in oligos:
+        previous = None
+        def solve_at(pw:float)->pd.DataFrame|None:
+            nonlocal previous
+            pw = float(pw_label(pw))    # solve the pair weight written in the file name
+            out = os.path.join(outfolder, f"probe_roi_{roi}.{n}oligos.pw{pw_label(pw)}.tsv")
+            probe, selection, status = solve_probe(db, n, pw, out, greedy, engine, previous, deadline, split, threads)
+            if probe is not None and (deadline is not None or status == 'split'):
+                logging.info(f"Region {roi}, {n} oligos, pair weight {pw_label(pw)}: {status}.")
+            if selection is not None:
+                previous = selection
+            return probe
+
+        best, solves = adaptive_pw_search(solve_at, accept, tol=tol)
+        total += solves
+        if best is None:
+            logging.info(f"Region {roi}, {n} oligos: no accepted pair weight after {solves} solves.")
+        else:
+            logging.info(f"Region {roi}, {n} oligos: pair weight {pw_label(best)} accepted after {solves} solves.")
+    return total
+
+
+def repair_roi(db:os.PathLike, roi:int, probe:pd.DataFrame, rejected:np.ndarray, pw:float,
+               outfolder:os.PathLike, cutoff_cost:float, cutoff_d:float|None, cutoff_d_pc:float)->bool:
+    # local repair of a probe rejected by HUSH against the updated (filtered) database.
+    # Returns False if the repair breaks the count or gap constraints: the ROI needs a full query.
+    db = OligoDB(db, dmax=None if cutoff_d is None else cutoff_d-1)
+    repaired = repair_probe(db, probe, rejected, pw)
+    if repaired is None or not probe_acceptable(repaired, cutoff_cost, cutoff_d, cutoff_d_pc):
+        logging.info(f"Region {roi}: local repair failed, the probe will be queried again.")
+        return False
+    os.makedirs(outfolder, exist_ok=True)
+    out = os.path.join(outfolder, f"probe_roi_{roi}.{len(repaired)}oligos.pw{pw_label(pw)}.tsv")
+    repaired.to_csv(out, index=False, sep="\t")
+    replaced = int(np.sum(rejected))
+    logging.info(f"Region {roi}: {replaced} rejected oligos replaced, {len(repaired)-replaced} kept.")
+    return True
+
+
+def probe_query(strand:str='DNA',
+                oligos:int|None=None,
+                probe:int|None=None,
+                pw:float|None=None,
+                greedy:bool=False,
+                threads:int=1,
+                adaptive:bool=False,
+                gap:int|None=None,
+                gappercent:float=10,
+                cutoff_cost:float=1e6,
+                roitime:float|None=None,
+                budget:float|None=None,
+                split:int|None=None,
+                currentfolder:os.PathLike='./data/')->None:
+    deadline = None if budget is None else time.monotonic()+budget
+    rdroi = pd.read_csv(os.path.join(currentfolder,'rois/all_regions.tsv'), sep="\t", header=0)
+    if probe is not None:
+        rdroi = rdroi[rdroi.window_id == probe]
+
+    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if oligos is None:
+        outfolder = os.path.join(currentfolder, f"probe_candidates/query_output_t_{ts}")
+    else:
+        outfolder = os.path.join(currentfolder, f"probe_candidates/query_output_o_{oligos}_t_{ts}")
+    pws = pair_weights if pw is None else [pw]
+
+    jobs = []
+    for roi, roioligos in zip(rdroi.window_id, rdroi.window):
+        jobs.append((roi_db_path(currentfolder, strand, roi), roi, [oligos if oligos is not None else int(roioligos)]))
+
+    # numpy releases the GIL for the heavy work, threads avoid copying the databases.
+    # Threads left over by the ROIs go to the sub-windows of split queries.
+    subthreads = max(1, threads//max(1, len(jobs)))
+    if adaptive:
+        Parallel(n_jobs=threads, prefer="threads")(delayed(adaptive_query_roi)(db, roi, n, outfolder, cutoff_cost, gap, gappercent, greedy,
+                                                                               timeout=roitime, deadline=deadline,
+                                                                               split=split, threads=subthreads)
+                                                   for db, roi, n in tqdm(jobs, "Constructing probes"))
+    else:
+        Parallel(n_jobs=threads, prefer="threads")(delayed(query_roi)(db, roi, n, outfolder, pws, greedy,
+                                                                      timeout=roitime, deadline=deadline,
+                                                                      split=split, threads=subthreads)
+                                                   for db, roi, n in tqdm(jobs, "Constructing probes"))
+    print("Done!")
+    return
+
+
+@click.command(
+    name="probe_query",
+    help="Construct optimized probes from pre-formed oligo databases, loading each database once for all pair weights."
+)
+@click.option('-s', '--strand', type=click.STRING, default='DNA')
+@click.option('-o', '--oligos', type=click.INT, help="Oligos per probe. If not provided, read from the ROI list.")
+@click.option('-e', '--probe', type=click.INT, help="Specific ROI to query.")
+@click.option('-p', '--pw', type=click.FLOAT, help="Pair weight. If not provided, scanning 1e-1 to 1e-7.")
+@click.option('-g', '--greedy', is_flag=True, help="Greedy probe query, speed > quality.")
+@click.option('-t', '--threads', type=click.INT, default=1)
+@click.option('-a', '--adaptive', is_flag=True, help="Search for the smallest accepted pair weight instead of scanning.")
+@click.option('-d', '--gap', type=click.INT, help="Max distance between 2 consecutive oligos (nt), for -a.")
+@click.option('-gpercent', '--gappercent', type=click.FLOAT, default=10, help="Max distance between 2 consecutive oligos (% probe length), for -a.")
+@click.option('-r', '--roitime', type=click.FLOAT, help="Time budget per ROI (s), the best probe found so far is kept.")
+@click.option('-b', '--budget', type=click.FLOAT, help="Time budget for all ROIs (s).")
+@click.option('-x', '--split', type=click.INT, help="Solve probes with more oligos in sub-windows of this many oligos.")
+def main(strand:str, oligos:int|None, probe:int|None, pw:float|None, greedy:bool, threads:int,
+         adaptive:bool, gap:int|None, gappercent:float, roitime:float|None, budget:float|None,
+         split:int|None)->None:
+    probe_query(strand=strand, oligos=oligos, probe=probe, pw=pw, greedy=greedy, threads=threads,
+                adaptive=adaptive, gap=gap, gappercent=gappercent, roitime=roitime, budget=budget,
+                split=split)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,17 @@ import joblib
 import time
 from tqdm import tqdm
 
+try:
+    from .fm_index import longest_offtarget
+    from .seed_hush import search
+    from .abundance_filter import expand_mindist
+    from .nhush_driver import genome
+except ImportError:     # run as a script through prb
+    from fm_index import longest_offtarget
+    from seed_hush import search
+    from abundance_filter import expand_mindist
+    from nhush_driver import genome
+
 types = {'DNA' : 'Reference', 'RNA' : 'RevCompl', '-RNA' : 'Reference'}
 
 @contextlib.contextmanager
@@ -65,11 +76,22 @@ def reform_hush_combined(nt_type:str='DNA',
                          L:int=40,
                          l:int=22,
                          currentfolder:os.PathLike = './data',
-                         until:int=3)->None:
+                         until:int=3,
+                         backend:str='nhush',
+                         threads:int=40,
+                         rois:list|None=None,
+                         excl:bool=False,
+                         memory:float=4)->None:
+    # backend 'fmindex': the longest off-target match is computed exactly with the FM-index
+    # of the reference instead of from consecutive zero-distance sublength oligos.
+    # memory: GB for building the FM-index and seed indexes (on top of about 3 bytes per reference base).
+    # excl: exclusion mode, reference masked for each ROI (ref/genome_roi_N.fa) as in run_nHUSH_excl.
     
     suffix = types[nt_type]
     roilist = currentfolder+'/rois/all_regions.tsv'
     rd = pd.read_csv(roilist,sep="\t",header=0)
+    if rois is not None:    # only these window_ids
+        rd = rd[rd.window_id.isin(rois)].reset_index(drop=True)
     ROIcount = len(rd)
 
     infolder = currentfolder+'/candidates/'
@@ -90,7 +112,17 @@ def reform_hush_combined(nt_type:str='DNA',
         filename = 'roi_'+str(rd.window_id[roi])+'.GC35to85_'+suffix+'.fa'
         fasta = infolder+filename
         hush = fasta+'.'+str(l)+'mers.nh.L'+str(l)+'.mindist.uint8'
-        hdist = np.fromfile(hush,'uint8')
+        reference = genome(currentfolder, fasta, excl)
+
+        if backend == 'fmindex':
+            with open(fasta,'r') as f:
+                sequences = [seq.upper() for seq in f.read().splitlines()[1::2]]
+        if backend == 'fmindex' and not os.path.exists(hush):
+            # no sublength nHUSH run: sublength min distances from the in-package seed index
+            _, hdist = search([seq[i:i+l] for seq in sequences for i in range(L-l+1)], reference, until, threads, memory=memory)
+        else:
+            # with the abundance prefilter, only part of the sublength oligos were searched
+            hdist = expand_mindist(hush, fasta+'.'+str(l)+'mers')
 
         # correct for aberrant values after nHUSH.
         hdist[hdist>until] = until+1
@@ -99,8 +131,11 @@ def reform_hush_combined(nt_type:str='DNA',
         hdist_grouped = hdist.reshape([n//(L-l+1), (L-l+1)])
         hdist_grouped_sum = hdist.reshape([n//(L-l+1), (L-l+1)]).sum(axis=1)            
 
-        with tqdm_joblib(tqdm(desc="Processing all oligos in region "+str(rd.window_id[roi]), total=len(hdist_grouped))) as progress_bar:
-            results = Parallel(n_jobs=40)(delayed(consecblock)(oligo,L,l,hdist_grouped) for oligo in range(len(hdist_grouped)))
+        if backend == 'fmindex':
+            results = longest_offtarget(sequences, reference, threads, memory=memory)
+        else:
+            with tqdm_joblib(tqdm(desc="Processing all oligos in region "+str(rd.window_id[roi]), total=len(hdist_grouped))) as progress_bar:
+                results = Parallel(n_jobs=threads)(delayed(consecblock)(oligo,L,l,hdist_grouped) for oligo in range(len(hdist_grouped)))
 
         # write results into fasta file  
         f = open(fasta,'r')
@@ -119,16 +154,18 @@ def reform_hush_combined(nt_type:str='DNA',
         o.close()
         f.close()
 
-        return
+    return
 
 if __name__ == "__main__":
-    #syntax: ./reform_hush_combined.py DNA/RNA/-RNA 40 22 3 
+    #syntax: ./reform_hush_combined.py DNA/RNA/-RNA 40 22 3 [nhush/fmindex] [excl]
 
     print(f'Number of arguments: '+str(len(sys.argv)))
     if(len(sys.argv) < 5):
         print(f'The combined scoring approach requires nHUSH to be run using sublength oligos.\n')
         print(f'Required arguments: [DNA/RNA/-RNA] [length] [sublength] [until].\n')
         print(f'With "until" the same parameter as used when running nHUSH.\n')
+        print(f'Optional: [nhush/fmindex] to compute the longest off-target match exactly with an FM-index of the reference.\n')
+        print(f'Optional: [excl] in exclusion mode, with the reference masked for each ROI.\n')
         print(f'Incorrect number of arguments. Exiting...')
         exit(-1)
 
@@ -141,5 +178,8 @@ if __name__ == "__main__":
     print(f'Sublength: '+str(l))
     until = int(sys.argv[4])
     print(f'HUSH was run until '+str(until)+' mismatches.')
+    backend = sys.argv[5] if len(sys.argv) > 5 else 'nhush'
+    print(f'Longest off-target match from: '+backend)
+    excl = len(sys.argv) > 6 and sys.argv[6] == 'excl'
     # call the function here
-    reform_hush_combined(nt_type=sys.argv[1],L=L,l=l,until=until)  
+    reform_hush_combined(nt_type=sys.argv[1],L=L,l=l,until=until,backend=backend,excl=excl)  
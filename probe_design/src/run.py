@@ -0,0 +1,437 @@
+#!/usr/bin/python3
+
+# Make-style runner of the whole pipeline (prb run), in place of calling the steps of
+# shell/pipeline.sh one by one. The stages form a DAG, most of them per ROI:
+#   get_oligos(roi) -> run_nHUSH(roi) -> reform_hush_combined(roi) -> build-db(roi) -> cycling_query -> summarize
+#   get_oligos(roi) -> melt_secs(roi) -----------------------------> build-db(roi)
+#   generate_blacklist --------------------------------------------> build-db(roi)
+#   generate_blacklist -> run_nHUSH(roi) (abundance prefilter, -a)
+# Each (stage, ROI) piece has a fingerprint of its parameters, of its source files (size and
+# modification time) and of the fingerprints of the pieces it depends on. It is recorded in
+# data/run/<stage>/<roi>.json once the piece succeeded, and the piece is only run again when
+# its fingerprint changed or one of its outputs is missing. Independent pieces (e.g. nHUSH and
+# melt/secs of the same ROI, or of different ROIs) run concurrently, at most -j at a time;
+# the output of each piece goes to data/run/logs/<stage>.<roi>.log.
+# In streaming mode (--stream), the probe query is a per-ROI piece too (cycling_query -probe),
+# so that each ROI goes through all stages as soon as its own inputs are ready, and the pieces
+# share a budget of cores: the pieces closest to a finished probe start first, and the free
+# cores are divided among the pieces ready to start (at most what each stage can use).
+# Each of these queries has its own run folder (cycling_query -rundir, data/run/cycling_query/roi_N),
+# so that they run side by side; their final probes are then moved to data/final_probes.
+# The candidate headers are fixed (pos=chrom:start-end, as at the end of run_nHUSH.sh) right
+# after get_oligos, so that nHUSH and melt/secs can read the same candidate files.
+
+import os
+import re
+import sys
+import glob
+import json
+import shlex
+import shutil
+import hashlib
+import subprocess
+import concurrent.futures
+import click
+import pandas as pd
+from joblib.externals.loky import get_reusable_executor
+
+try:
+    from .get_oligos import get_oligos
+    from .nhush_driver import nhush_roi, fix_headers
+    from .reform_hush_combined import reform_hush_combined
+    from .melt_secs import melt_secs
+    from .blacklist_filter import Blacklist, apply_blacklist, roi_blacklist
+    from .summarize_probes_final import summarize_probes_final
+except ImportError:     # run as a script through prb
+    from get_oligos import get_oligos
+    from nhush_driver import nhush_roi, fix_headers
+    from reform_hush_combined import reform_hush_combined
+    from melt_secs import melt_secs
+    from blacklist_filter import Blacklist, apply_blacklist, roi_blacklist
+    from summarize_probes_final import summarize_probes_final
+
+PATHSRC = os.path.dirname(os.path.abspath(__file__))
+PATHSHELL = os.path.join(os.path.dirname(PATHSRC), "shell")
+
+# stage: stages it depends on, whether it runs per ROI, parameters it depends on,
+# max number of cores it can use (None: any)
+stages = {
+    'get_oligos':           {'deps': [], 'per_roi': True, 'params': ['nt_type', 'gcfilter'], 'cores': 1},
+    'generate_blacklist':   {'deps': [], 'per_roi': False, 'params': ['length', 'cutoff', 'engine'], 'cores': None},
+    # the blacklist is the abundance prefilter of nHUSH (-a)
+    'run_nHUSH':            {'deps': ['get_oligos', 'generate_blacklist'], 'per_roi': True,
+                             'params': ['nt_type', 'length', 'sublength', 'mismatch', 'engine', 'excl', 'abundance', 'cutoff', 'maxconsec'],
+                             'cores': None},
+    'reform_hush_combined': {'deps': ['run_nHUSH'], 'per_roi': True, 'params': ['nt_type', 'length', 'sublength', 'mismatch', 'excl'],
+                             'cores': None},
+    'melt_secs':            {'deps': ['get_oligos'], 'per_roi': True, 'params': ['nt_type', 'engine'], 'cores': None},
+    'build-db':             {'deps': ['reform_hush_combined', 'melt_secs', 'generate_blacklist'], 'per_roi': True,
+                             'params': ['nt_type', 'length', 'cutoff', 'hamdist', 'scoref', 'maxconsec', 'maxid', 'temperature', 'engine'],
+                             'cores': 1},
+    'cycling_query':        {'deps': ['build-db'], 'per_roi': False,
+                             'params': ['nt_type', 'length', 'mismatch', 'cutoff', 'gap', 'excl', 'query'],
+                             'cores': None},
+    'summarize':            {'deps': ['cycling_query'], 'per_roi': False, 'params': [], 'cores': 1},
+}
+
+
+def suffix(params:dict)->str:
+    return "RevCompl" if params['nt_type'] == 'RNA' else "Reference"
+
+
+def stem(roi:int, params:dict)->str:
+    return f"roi_{roi}.GC35to85_{suffix(params)}"
+
+
+def genome(datafolder:os.PathLike, roi:int|None, params:dict)->str:
+    # reference of the homology search: masked for the ROI in exclusion mode
+    if params['excl'] and roi is not None and os.path.exists(os.path.join(datafolder, "ref", f"genome_roi_{roi}.fa")):
+        return os.path.join(datafolder, "ref", f"genome_roi_{roi}.fa")
+    return os.path.join(datafolder, "ref", "genome.fa")
+
+
+def outputs(stage:str, roi:int|None, params:dict, datafolder:os.PathLike)->list[str]:
+    # files that must exist for the piece to be up to date
+    if stage == 'get_oligos':
+        files = [f"candidates/{stem(roi, params)}.fa"]
+    elif stage == 'generate_blacklist':
+        files = [f"blacklist/genome.fa.abundant_L{params['length']}_T{params['cutoff']}.fa"]
+    elif stage == 'run_nHUSH':
+        l = params['sublength']
+        files = [f"candidates/{stem(roi, params)}.fa.{l}mers.nh.L{l}.mindist.uint8"]
+    elif stage == 'reform_hush_combined':
+        files = [f"HUSH_candidates/{stem(roi, params)}.fa"]
+    elif stage == 'melt_secs':
+        files = [f"melt/{stem(roi, params)}.tsv", f"secs/{stem(roi, params)}.fa.ct"]
+    elif stage == 'build-db':
+        files = [f"db_tsv/db.{stem(roi, params)}.tsv"]
+    elif stage == 'cycling_query':
+        files = ["final_probes"]
+    else:
+        files = ["final_probes_summary.tsv"]
+    return [os.path.join(datafolder, file) for file in files]
+
+
+def sources(stage:str, roi:int|None, params:dict, datafolder:os.PathLike, regions:pd.DataFrame)->list:
+    # inputs of the piece from outside the pipeline
+    if stage == 'get_oligos':
+        rows = regions[regions.window_id == roi].astype(str).to_dict('records')
+        return rows + [file_stat(os.path.join(datafolder, "ref", f"{row['ref']}.chromosome.{row['chrom'][3:]}.fa")) for row in rows]
+    if stage == 'generate_blacklist':
+        files = sorted(f for f in os.listdir(os.path.join(datafolder, "ref")) if re.match(r'genome.*\.fa$', f))
+        beds = sorted(os.listdir(os.path.join(datafolder, "exclude"))) if os.path.isdir(os.path.join(datafolder, "exclude")) else []
+        return [file_stat(os.path.join(datafolder, "ref", f)) for f in files] + [file_stat(os.path.join(datafolder, "exclude", f)) for f in beds]
+    if stage == 'run_nHUSH':
+        return [file_stat(genome(datafolder, roi, params))]
+    return []
+
+
+def file_stat(path:os.PathLike)->list:
+    if not os.path.exists(path):
+        return [path, None]
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint(stage:str, roi:int|None, params:dict, datafolder:os.PathLike,
+                regions:pd.DataFrame, depkeys:list[str])->str:
+    content = {'stage': stage, 'roi': roi, 'params': {key: params[key] for key in stages[stage]['params']},
+               'sources': sources(stage, roi, params, datafolder, regions), 'deps': depkeys}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def record_path(stage:str, roi:int|None, datafolder:os.PathLike)->str:
+    return os.path.join(datafolder, "run", stage, f"roi_{roi}.json" if roi is not None else "all.json")
+
+
+def up_to_date(stage:str, roi:int|None, key:str, params:dict, datafolder:os.PathLike)->bool:
+    record = record_path(stage, roi, datafolder)
+    if not os.path.exists(record):
+        return False
+    with open(record) as f:
+        if json.load(f).get('fingerprint') != key:
+            return False
+    return all(os.path.exists(path) for path in outputs(stage, roi, params, datafolder))
+
+
+def write_record(stage:str, roi:int|None, key:str, datafolder:os.PathLike)->None:
+    record = record_path(stage, roi, datafolder)
+    os.makedirs(os.path.dirname(record), exist_ok=True)
+    with open(record+'.tmp', 'w') as f:
+        json.dump({'stage': stage, 'roi': roi, 'fingerprint': key}, f)
+    os.replace(record+'.tmp', record)
+
+
+def per_roi(stage:str, stream:bool=False)->bool:
+    return stages[stage]['per_roi'] or (stream and stage == 'cycling_query')
+
+
+def pieces(rois:list[int], stream:bool=False)->dict:
+    # (stage, roi) -> pieces it depends on; roi is None for the stages over all ROIs
+    graph = {}
+    for stage in stages:
+        for roi in (rois if per_roi(stage, stream) else [None]):
+            deps = []
+            for dep in stages[stage]['deps']:
+                if not per_roi(dep, stream):
+                    deps.append((dep, None))
+                elif roi is not None:
+                    deps.append((dep, roi))
+                else:
+                    deps.extend((dep, r) for r in rois)
+            graph[(stage, roi)] = deps
+    return graph
+
+
+def stage_get_oligos(roi:int, params:dict, datafolder:os.PathLike)->None:
+    get_oligos(params['nt_type'], params['gcfilter'], datafolder, rois=[roi])
+    for direction in ['Reference', 'RevCompl']:
+        fix_headers(os.path.join(datafolder, "candidates", f"roi_{roi}.GC35to85_{direction}.fa"))
+
+
+def stage_generate_blacklist(roi:None, params:dict, datafolder:os.PathLike)->None:
+    engine = 'python' if params['engine'] == 'python' else 'nhush'
+    subprocess.run(["bash", os.path.join(PATHSHELL, "generate_blacklist.sh"), "-L", str(params['length']),
+                    "-c", str(params['cutoff']), "-E", engine, "-t", str(params['threads'])],
+                   cwd=os.path.dirname(os.path.abspath(datafolder)), check=True)
+
+
+def stage_run_nHUSH(roi:int, params:dict, datafolder:os.PathLike)->None:
+    # sublength min distances of the candidates (nhush_driver, one ROI)
+    fasta = os.path.join(datafolder, "candidates", stem(roi, params)+".fa")
+    nhush_roi(fasta, genome(datafolder, roi, params), params['length'], params['sublength'], params['mismatch'],
+              params['threads'], params['inhash'], 'python' if params['engine'] == 'python' else 'nhush',
+              params['cutoff'] if params['abundance'] else None, params['maxconsec'], params['excl'],
+              os.path.join(datafolder, "blacklist"), os.path.join(os.path.dirname(os.path.abspath(datafolder)), "HUSH", "run"))
+
+
+def stage_reform_hush_combined(roi:int, params:dict, datafolder:os.PathLike)->None:
+    reform_hush_combined(params['nt_type'], params['length'], params['sublength'], datafolder,
+                         until=params['mismatch'], threads=params['threads'], rois=[roi], excl=params['excl'])
+
+
+def stage_melt_secs(roi:int, params:dict, datafolder:os.PathLike)->None:
+    engine = 'python' if params['engine'] == 'python' else 'melt_duplex'
+    melt_secs(params['nt_type'], params['threads'], engine=engine, datafolder=datafolder, rois=[roi])
+
+
+def stage_build_db(roi:int, params:dict, datafolder:os.PathLike)->None:
+    # oligo database of one ROI (build-db_BL.sh)
+    name = stem(roi, params)
+    workdir = os.path.join(datafolder, "run", "build-db", f"roi_{roi}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    os.symlink(os.path.abspath(os.path.join(datafolder, "HUSH_candidates", name+".fa")), os.path.join(workdir, name+".hush.out"))
+    db = os.path.join(workdir, f"db.{name}")
+    subprocess.run(["ifpd2", "db", "make", "-O", os.path.join(workdir, name+".hush.out"),
+                    "-T", os.path.join(datafolder, "melt", name+".tsv"), "-S", os.path.join(datafolder, "secs", name+".fa.ct"), db],
+                   check=True)
+    dump = subprocess.run(["ifpd2", "db", "dump", db], check=True, capture_output=True, text=True).stdout
+
+    # split the combined nHUSH scores (111<longest>987<sum>) in two columns
+    lines = dump.splitlines(keepends=True)
+    if len(lines) > 0:
+        lines[0] = lines[0].replace("off_target_no\t", "off_target_no\toff_target_sum\t", 1)
+    table = os.path.join(workdir, f"db.{name}.tsv")
+    with open(table, 'w') as f:
+        f.writelines(re.sub(r'\t111([0-9]+)987([0-9]+)\t', r'\t\1\t\2\t', line, count=1) for line in lines)
+
+    blfolder = os.path.join(datafolder, "blacklist")
+    blacklist = roi_blacklist(table, blfolder, params['length'], params['cutoff'])
+    if params['engine'] == 'python':
+        apply_blacklist(table, Blacklist(blacklist, params['length'], params['hamdist']), table+".bl_filtered.fa")
+    else:
+        subprocess.run(["escafish", "apply_blacklist", "--db", table, "--bl", blacklist], check=True)
+
+    out = os.path.join(datafolder, "db_tsv", f"db.{name}.tsv")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(table+".bl_filtered.fa") as f, open(out+'.tmp', 'w') as o:
+        subprocess.run([sys.executable, os.path.join(PATHSRC, "escafish_score.py"), params['scoref'], str(params['maxconsec']),
+                        str(params['maxid']), str(params['temperature']), str(params['hamdist'])], stdin=f, stdout=o, check=True)
+    os.replace(out+'.tmp', out)
+    shutil.rmtree(workdir)
+
+
+def stage_cycling_query(roi:int|None, params:dict, datafolder:os.PathLike)->None:
+    # the probes of an earlier query are replaced (cycling_query does not overwrite them)
+    final = os.path.join(datafolder, "final_probes")
+    for path in glob.glob(os.path.join(final, f"*probe_roi_{roi}.*" if roi is not None else "*")):
+        os.remove(path)
+    command = [sys.executable, os.path.join(PATHSRC, "cycling_query.py"), "-s", params['nt_type'], "-L", str(params['length']),
+               "-m", str(params['mismatch']), "-c", str(params['cutoff']), "-t", str(params['threads']), "-g", str(params['gap'])]
+    if params['excl']:
+        command.append("-excl")
+    if roi is not None:
+        # own run folder, started afresh unless the query is resumed
+        rundir = os.path.abspath(os.path.join(datafolder, "run", "cycling_query", f"roi_{roi}"))
+        if "-resume" not in shlex.split(params['query']):
+            shutil.rmtree(rundir, ignore_errors=True)
+        command.extend(["-probe", str(roi), "-rundir", rundir])
+    subprocess.run(command + shlex.split(params['query']), cwd=os.path.dirname(os.path.abspath(datafolder)), check=True)
+    if roi is not None:
+        os.makedirs(final, exist_ok=True)
+        for path in glob.glob(os.path.join(rundir, "final_probes", "*")):
+            shutil.move(path, os.path.join(final, os.path.basename(path)))
+
+
+def stage_summarize(roi:None, params:dict, datafolder:os.PathLike)->None:
+    summarize_probes_final(os.path.join(datafolder, ""), params['threads'])
+
+
+stage_functions = {'get_oligos': stage_get_oligos, 'generate_blacklist': stage_generate_blacklist,
+                   'run_nHUSH': stage_run_nHUSH, 'reform_hush_combined': stage_reform_hush_combined,
+                   'melt_secs': stage_melt_secs, 'build-db': stage_build_db,
+                   'cycling_query': stage_cycling_query, 'summarize': stage_summarize}
+
+
+def run_piece(stage:str, roi:int|None, params:dict, datafolder:os.PathLike)->None:
+    # in a worker process, with its output (python and external tools) in the log file of the piece
+    logfile = os.path.join(datafolder, "run", "logs", f"{stage}.{'roi_'+str(roi) if roi is not None else 'all'}.log")
+    os.makedirs(os.path.dirname(logfile), exist_ok=True)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(logfile, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            stage_functions[stage](roi, params, datafolder)
+        finally:
+            # joblib workers of the piece keep its log open until they time out
+            get_reusable_executor().shutdown(wait=True)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def run(params:dict, jobs:int=1, datafolder:os.PathLike='./data', rois:list|None=None,
+        until:str|None=None, dry_run:bool=False, stream:bool=False, cores:int|None=None)->tuple[int,int,int]:
+    # runs the stale pieces; returns the number of pieces run, up to date and failed.
+    # stream: per-ROI queries, and the pieces share `cores` cores instead of -j pieces of -t threads
+    regions = pd.read_csv(os.path.join(datafolder, "rois", "all_regions.tsv"), sep="\t", header=0)
+    if rois is None:
+        rois = sorted(set(int(roi) for roi in regions.window_id))
+    if cores is None:
+        cores = os.cpu_count()
+    graph = pieces(rois, stream)
+    if until is not None:
+        # only the stages needed for this one
+        needed, todo = set(), [piece for piece in graph if piece[0] == until]
+        while todo:
+            piece = todo.pop()
+            if piece not in needed:
+                needed.add(piece)
+                todo.extend(graph[piece])
+        graph = {piece: deps for piece, deps in graph.items() if piece in needed}
+
+    # fingerprints in dependency order (the stages are declared in that order)
+    keys = {}
+    for piece, deps in graph.items():
+        keys[piece] = fingerprint(*piece, params, datafolder, regions, [keys[dep] for dep in deps])
+    stale = {piece for piece in graph if not up_to_date(*piece, keys[piece], params, datafolder)}
+    # a piece whose inputs are recomputed is recomputed too
+    for piece, deps in graph.items():
+        if any(dep in stale for dep in deps):
+            stale.add(piece)
+    print(f"{len(stale)} of {len(graph)} pieces to run.")
+    if dry_run:
+        for stage, roi in sorted(stale, key=lambda piece: (list(stages).index(piece[0]), piece[1] or 0)):
+            print(f"  {stage}" + (f" roi_{roi}" if roi is not None else ""))
+        return 0, len(graph)-len(stale), 0
+
+    done, failed, running, allotted = set(piece for piece in graph if piece not in stale), set(), {}, {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=cores if stream else jobs) as pool:
+        while True:
+            ready = []
+            for piece in graph:
+                if piece in done or piece in failed or piece in running.values():
+                    continue
+                if any(dep in failed for dep in graph[piece]):
+                    failed.add(piece)
+                elif all(dep in done for dep in graph[piece]):
+                    ready.append(piece)
+            if stream:
+                # closest to a finished probe first
+                ready.sort(key=lambda piece: -list(stages).index(piece[0]))
+            for k, piece in enumerate(ready):
+                threads = params['threads']
+                if stream:
+                    free = cores - sum(allotted.values())
+                    if free <= 0:
+                        break
+                    threads = max(1, free // (len(ready) - k))
+                    if stages[piece[0]]['cores'] is not None:
+                        threads = min(threads, stages[piece[0]]['cores'])
+                future = pool.submit(run_piece, *piece, {**params, 'threads': threads}, datafolder)
+                running[future], allotted[future] = piece, threads
+            if len(running) == 0:
+                break
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                allotted.pop(future)
+                stage, roi = piece = running.pop(future)
+                label = stage + (f" roi_{roi}" if roi is not None else "")
+                try:
+                    future.result()
+                except Exception as error:
+                    failed.add(piece)
+                    print(f"{label} failed: {error}")
+                    continue
+                write_record(stage, roi, keys[piece], datafolder)
+                done.add(piece)
+                print(f"{label} done.")
+    return len(stale) - len(failed), len(graph) - len(stale), len(failed)
+
+
+@click.command(
+    name="run",
+    help="Run the stages of the pipeline that are out of date, per ROI where possible, independent stages concurrently. "
+         "Fingerprints in ./data/run/, logs in ./data/run/logs/."
+)
+@click.option('-d', '--nt-type', type=click.Choice(['DNA', 'RNA']), default='DNA', help="FISH type.")
+@click.option('-L', '--length', type=click.INT, default=40, help="Oligo length.")
+@click.option('-l', '--sublength', type=click.INT, default=21, help="Sublength used for nHUSH.")
+@click.option('-m', '--mismatch', type=click.INT, default=3, help="Max number of mismatches investigated by nHUSH.")
+@click.option('-t', '--threads', type=click.INT, default=1, help="Threads of each stage.")
+@click.option('-j', '--jobs', type=click.INT, default=1, help="Max number of stages running at the same time.")
+@click.option('-i', '--inhash', type=click.INT, default=14, help="Initial hash length of nHUSH.")
+@click.option('-E', '--engine', type=click.Choice(['external', 'python']), default='external',
+              help="nhush, melt_duplex, hybrid-ss-min and escafish, or the in-package engines.")
+@click.option('-c', '--cutoff', type=click.INT, default=100, help="Min abundance of an oligo to be included in the blacklist.")
+@click.option('-a', '--abundance', is_flag=True, help="Skip the sublength oligos found in the blacklist in nHUSH (abundance_filter).")
+@click.option('-f', '--scoref', type=click.STRING, default='q_bl', help="Escafish cost function.")
+@click.option('--maxconsec', type=click.INT, default=32, help="Longest consecutive match allowed.")
+@click.option('--maxid', type=click.INT, default=6, help="Longest homopolymer allowed.")
+@click.option('-T', '--temperature', type=click.INT, default=72, help="Target melting temperature.")
+@click.option('--hamdist', type=click.INT, default=8, help="Min Hamming distance to any oligo in the blacklist.")
+@click.option('-g', '--gap', type=click.INT, default=2000, help="Max distance between 2 consecutive oligos (cycling_query -g).")
+@click.option('-q', '--query', type=click.STRING, default='', help="Other cycling_query arguments, e.g. \"-greedy -stepdown 10\".")
+@click.option('--excl', is_flag=True, help="Exclusion mode: masked genome (ref/genome_roi_N.fa) of each ROI.")
+@click.option('--nogc', is_flag=True, help="No filter on the GC content in get_oligos.")
+@click.option('-r', '--roi', 'rois', type=click.INT, multiple=True, help="Only this ROI (window_id), repeatable.")
+@click.option('-u', '--until', type=click.Choice(list(stages)), default=None, help="Stop after this stage.")
+@click.option('-n', '--dry-run', is_flag=True, help="Only list the stages out of date.")
+@click.option('-s', '--stream', is_flag=True, help="Query each ROI as soon as its database is built, "
+              "the stages sharing the cores of -C instead of -j stages of -t threads.")
+@click.option('-C', '--cores', type=click.INT, default=None, help="Cores shared by the stages in streaming mode. Default: all.")
+def main(nt_type:str, length:int, sublength:int, mismatch:int, threads:int, jobs:int, inhash:int, engine:str,
+         cutoff:int, abundance:bool, scoref:str, maxconsec:int, maxid:int, temperature:int, hamdist:int,
+         gap:int, query:str, excl:bool, nogc:bool, rois:tuple, until:str|None, dry_run:bool,
+         stream:bool, cores:int|None)->None:
+    params = {'nt_type': nt_type, 'length': length, 'sublength': sublength, 'mismatch': mismatch, 'threads': threads,
+              'inhash': inhash, 'engine': engine, 'cutoff': cutoff, 'abundance': abundance, 'scoref': scoref,
+              'maxconsec': maxconsec, 'maxid': maxid, 'temperature': temperature, 'hamdist': hamdist, 'gap': gap,
+              'query': query, 'excl': excl, 'gcfilter': not nogc}
+    ran, current, failed = run(params, jobs, rois=list(rois) if rois else None, until=until, dry_run=dry_run,
+                               stream=stream, cores=cores)
+    if not dry_run:
+        print(f"{ran} pieces run, {current} up to date, {failed} failed or skipped.")
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+
+# In-package stand-in for nhush / hushp, so that the homology checks can run without the
+# private binaries. The reference is indexed once with 2-bit encoded seeds in sorted NumPy
+# arrays, stored next to it: <reference>.codes.npy (the encoded reference) and
+# <reference>.<seed>.{keys,positions}.npy for every seed shape (k<k> for contiguous k-mers,
+# s<mask> for spaced seeds). The seeds are sorted in on-disk buckets of a bounded size: building
+# an index takes 1 byte per reference base (the encoded reference) plus the memory limit.
+# Pigeonhole search: a query with at most m mismatches against a site matches one of its
+# m+1 segments exactly, and two of its m+2 segments. The seeds are the m+1 segments, or the
+# pairs of the m+2 segments (spaced seeds) when these are longer, so that fewer sites are
+# candidates. Every candidate site is verified by its Hamming distance, in batches of a
+# bounded number of sites. Both strands of the reference are searched.
+#
+# Outputs, in the formats the pipeline reads:
+#   nhush --sfp  -> <query>.nh.L<length>.mindist.uint8   (min distance, first perfect match skipped)
+#   hushp -C     -> <query>.out, lines "name, count"     (sites within m mismatches, on-target included)
+
+import numpy as np
+import os
+import shutil
+import glob
+import itertools
+import click
+from joblib import Parallel, delayed
+from tqdm import tqdm
+
+max_seed = 16       # seeds are packed in uint32
+bytes_per_seed = 32     # peak memory per seed while sorting a bucket of the index
+
+codes = np.full(256, 4, dtype=np.uint8)        # A C G T -> 0 1 2 3, anything else (N) -> 4
+for base, code in zip(b'ACGTacgt', [0, 1, 2, 3]*2):
+    codes[base] = code
+complement = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+
+
+def encode(seq:str|bytes)->np.ndarray:
+    if isinstance(seq, str):
+        seq = seq.encode()
+    return codes[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def read_fasta(path:os.PathLike)->tuple[list[str],list[str]]:
+    # names (header without '>') and sequences
+    names, seqs, current = [], [], []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith('>'):
+                if len(names) > 0:
+                    seqs.append(''.join(current))
+                names.append(line[1:])
+                current = []
+            elif line != '':
+                current.append(line)
+    if len(names) > 0:
+        seqs.append(''.join(current))
+    return names, seqs
+
+
+def read_queries(path:os.PathLike)->tuple[list[str],list[str]]:
+    # hushp query file: FASTA, or name and sequence line pairs without '>' (validation_oldHUSH_BLAST.sh)
+    with open(path) as f:
+        first = f.readline()
+    if first.startswith('>') or first == '':
+        return read_fasta(path)
+    with open(path) as f:
+        lines = [line.rstrip() for line in f if line.strip() != '']
+    return lines[0::2], lines[1::2]
+
+
+def pack_seeds(sequence:np.ndarray, shape:tuple[int,...])->tuple[np.ndarray,np.ndarray]:
+    # 2-bit packed seeds (the bases at the shape offsets) starting at every position,
+    # and whether they contain an N
+    n = len(sequence) - shape[-1]
+    values = np.zeros(max(n, 0), dtype=np.uint32)
+    invalid = np.zeros(max(n, 0), dtype=bool)
+    for j in shape:
+        part = sequence[j:j+n]
+        values <<= 2
+        values |= part & 3
+        invalid |= part > 3
+    return values, invalid
+
+
+def shape_name(shape:tuple[int,...])->str:
+    if shape == tuple(range(len(shape))):
+        return f"k{len(shape)}"
+    return "s" + ''.join('1' if j in shape else '0' for j in range(shape[-1]+1))
+
+
+def bucket_of(histogram:np.ndarray, limit:int)->np.ndarray:
+    # bucket of every histogram bin: consecutive bins grouped by about limit entries (a bin is never split)
+    return (np.cumsum(histogram) - histogram)//max(limit, 1)
+
+
+def write_buckets(files:list[str], bucket:np.ndarray, values:np.ndarray)->None:
+    # append the values to the files of their bucket, in order
+    order = np.argsort(bucket, kind='stable')
+    bounds = np.searchsorted(bucket[order], np.arange(len(files)+1))
+    for b in np.flatnonzero(np.diff(bounds)):
+        with open(files[b], 'ab') as f:
+            values[order[bounds[b]:bounds[b+1]]].tofile(f)
+
+
+class SeedIndex:
+    # encoded reference (records separated by N) and its seeds of one shape sorted by value
+
+    def __init__(self, reference:os.PathLike, shape:tuple[int,...], mmap:bool=False, memory:float=4):
+        # memory: GB for building the index, on top of the encoded reference
+        self.reference = os.path.realpath(reference)
+        self.shape = tuple(shape)
+        self.prefix = f"{self.reference}.{shape_name(self.shape)}"
+        if not self.cached():
+            self.build(memory)
+        mode = 'r' if mmap else None
+        self.codes = np.load(self.reference+'.codes.npy', mmap_mode=mode)
+        self.keys = np.load(self.prefix+'.keys.npy', mmap_mode=mode)
+        self.positions = np.load(self.prefix+'.positions.npy', mmap_mode=mode)
+
+    def fresh(self, file:os.PathLike)->bool:
+        return os.path.exists(file) and os.path.getmtime(file) >= os.path.getmtime(self.reference)
+
+    def cached(self)->bool:
+        # index files newer than the reference
+        return all(self.fresh(file) for file in [self.reference+'.codes.npy', self.prefix+'.keys.npy', self.prefix+'.positions.npy'])
+
+    def build(self, memory:float=4)->None:
+        print(f"Indexing {self.reference} with {shape_name(self.shape)} seeds.")
+        if self.fresh(self.reference+'.codes.npy'):
+            sequence = np.load(self.reference+'.codes.npy', mmap_mode='r')
+        else:
+            chunks = []
+            with open(self.reference, 'rb') as f:
+                for line in f:
+                    if line.startswith(b'>'):
+                        chunks.append(b'N')     # no seed spans two records
+                    else:
+                        chunks.append(line.rstrip())
+            sequence = encode(b''.join(chunks) + b'N')
+            del chunks
+            np.save(self.reference+'.codes.tmp.npy', sequence)
+            os.replace(self.reference+'.codes.tmp.npy', self.reference+'.codes.npy')     # a crashed build is never taken for an index
+
+        # seed positions partitioned by the top 16 bits of their seed, buckets sorted one at a time
+        limit = max(1, int(memory*1e9/bytes_per_seed))
+        step = max(limit, 1<<20)        # seeds per pass over the reference (a pass takes less per seed than a sort)
+        span = self.shape[-1] + 1
+        n = len(sequence) - span + 1
+        shift = np.uint32(max(2*len(self.shape) - 16, 0))
+        dtype = np.uint32 if len(sequence) < 2**32 else np.int64
+        histogram = np.zeros(1<<16, dtype=np.int64)
+        for start in range(0, n, step):
+            values, invalid = pack_seeds(np.asarray(sequence[start:start+step+span-1]), self.shape)
+            histogram += np.bincount(values[~invalid] >> shift, minlength=1<<16)
+        bucket = bucket_of(histogram, limit)
+        tmpdir = self.prefix+'.tmp'
+        shutil.rmtree(tmpdir, ignore_errors=True)      # buckets of a crashed build
+        os.makedirs(tmpdir)
+        files = [os.path.join(tmpdir, f"bucket_{b:05d}") for b in range(int(bucket[-1])+1)]
+        for start in range(0, n, step):
+            values, invalid = pack_seeds(np.asarray(sequence[start:start+step+span-1]), self.shape)
+            valid = np.flatnonzero(~invalid)
+            write_buckets(files, bucket[values[valid] >> shift], (valid + start).astype(dtype))
+
+        keys = np.lib.format.open_memmap(self.prefix+'.tmp.keys.npy', mode='w+', dtype=np.uint32, shape=(int(histogram.sum()),))
+        positions = np.lib.format.open_memmap(self.prefix+'.tmp.positions.npy', mode='w+', dtype=dtype, shape=(len(keys),))
+        done = 0
+        for file in files:
+            if not os.path.exists(file):
+                continue
+            where = np.fromfile(file, dtype=dtype)
+            values = np.zeros(len(where), dtype=np.uint32)
+            for j in self.shape:
+                values = (values << np.uint32(2)) | (np.asarray(sequence[where + j]) & 3)
+            order = np.argsort(values, kind='stable')
+            keys[done:done+len(where)] = values[order]
+            positions[done:done+len(where)] = where[order]
+            done += len(where)
+            os.remove(file)
+        os.rmdir(tmpdir)
+        keys.flush()
+        positions.flush()
+        del keys, positions
+        for ext in ['.keys.npy', '.positions.npy']:
+            os.replace(self.prefix+'.tmp'+ext, self.prefix+ext)
+
+
+def seed_scheme(length:int, mismatch:int)->list[tuple[int,tuple[int,...]]]:
+    # seeds (offset in the oligo, shape) such that every site within mismatch matches one of them exactly:
+    # the m+1 segments, or the pairs of the m+2 segments if this gives longer seeds
+    segment = length//(mismatch+1)
+    k = min(segment, max_seed)
+    if k < 1:
+        raise ValueError(f"Cannot search {length}-mers with up to {mismatch} mismatches: the seeds would be empty.")
+    segment2 = length//(mismatch+2)
+    h = min(segment2, max_seed//2)
+    if mismatch > 0 and 2*h > k:
+        return [(i*segment2, tuple(range(h)) + tuple(range((j-i)*segment2, (j-i)*segment2 + h)))
+                for i, j in itertools.combinations(range(mismatch+2), 2)]
+    return [(i*segment, tuple(range(k))) for i in range(mismatch+1)]
+
+
+def search_block(reference:os.PathLike, scheme:list[tuple[int,tuple[int,...]]], queries:np.ndarray, mismatch:int,
+                 batch:int=1<<20)->tuple[np.ndarray,np.ndarray,np.ndarray]:
+    # for each query (rows of 2-bit codes): number of sites within mismatch, number of
+    # perfect sites and min distance of the imperfect sites (mismatch+1 if none)
+    indexes = {shape: SeedIndex(reference, shape, mmap=True) for shape in dict.fromkeys(shape for _, shape in scheme)}
+    genome = np.asarray(next(iter(indexes.values())).codes)
+    nq, length = queries.shape
+    columns = [offset + np.array(shape) for offset, shape in scheme]
+
+    # seed ranges in the indexes, seed-major: (seed, query) -> seed*nq + query
+    lo, hi = [], []
+    for (offset, shape), column in zip(scheme, columns):
+        index = indexes[shape]
+        segments = queries[:, column]
+        seeds = ((segments & 3).astype(np.uint32) << (2*np.arange(len(shape)-1, -1, -1, dtype=np.uint32))).sum(axis=1, dtype=np.uint32)
+        first = np.searchsorted(index.keys, seeds, 'left')
+        last = np.searchsorted(index.keys, seeds, 'right')
+        last[(segments > 3).any(axis=1)] = first[(segments > 3).any(axis=1)]
+        lo.append(first)
+        hi.append(last)
+    lo, hits = np.concatenate(lo).astype(np.int64), (np.concatenate(hi) - np.concatenate(lo)).astype(np.int64)
+    ends = np.cumsum(hits)
+
+    # candidate sites, batch at a time to bound the memory. A site found by several seeds is
+    # counted at the first seed matching it exactly. A site with an N (record break included)
+    # is not a match, as it has no seed itself
+    count = np.zeros(nq, dtype=np.int64)
+    perfect = np.zeros(nq, dtype=np.int64)
+    closest = np.full(nq, mismatch+1)
+    window = np.arange(length)
+    total = int(ends[-1]) if len(ends) > 0 else 0
+    for rank in range(0, total, batch):
+        rank = np.arange(rank, min(rank+batch, total))
+        pair = np.searchsorted(ends, rank, 'right')
+        seed, query = pair//nq, pair % nq
+        start = np.empty(len(rank), dtype=np.int64)
+        for s, (offset, shape) in enumerate(scheme):
+            found = seed == s
+            within = rank[found] - ends[pair[found]] + hits[pair[found]]      # rank among the hits of the seed
+            start[found] = indexes[shape].positions[lo[pair[found]] + within] - offset
+        inside = (start >= 0) & (start + length <= len(genome))
+        seed, query, start = seed[inside], query[inside], start[inside]
+
+        sites = genome[start[:, None] + window]
+        equal = sites == queries[query]
+        exact = np.stack([equal[:, column].all(axis=1) for column in columns], axis=1)
+        keep = np.argmax(exact, axis=1) == seed
+        sites, equal, query = sites[keep], equal[keep], query[keep]
+        distance = np.where((sites > 3).any(axis=1), mismatch+1, length - equal.sum(axis=1))
+
+        close = distance <= mismatch
+        count += np.bincount(query[close], minlength=nq)
+        perfect += np.bincount(query[distance == 0], minlength=nq)
+        imperfect = close & (distance > 0)
+        np.minimum.at(closest, query[imperfect], distance[imperfect])
+    return count, perfect, closest
+
+
+def search(sequences:list[str], reference:os.PathLike, mismatch:int, threads:int=1,
+           block:int=256, memory:float=4)->tuple[np.ndarray,np.ndarray]:
+    # returns, for each sequence, the number of sites within mismatch on both strands
+    # (on-target included, as hushp -C) and the min distance once the first perfect
+    # match is skipped (as nhush --sfp, mismatch+1 if no other site)
+    lengths = set(len(seq) for seq in sequences)
+    if len(lengths) != 1:
+        raise ValueError(f"All query oligos must have the same length, found lengths {sorted(lengths)}.")
+    length = lengths.pop()
+    scheme = seed_scheme(length, mismatch)
+    for shape in dict.fromkeys(shape for _, shape in scheme):
+        SeedIndex(reference, shape, mmap=True, memory=memory)       # build once before the workers load them
+
+    forward = encode(''.join(sequences)).reshape(len(sequences), length)
+    reverse = complement[forward[:, ::-1]]
+    queries = np.concatenate([forward, reverse])
+    results = Parallel(n_jobs=threads)(delayed(search_block)(reference, scheme, queries[i:i+block], mismatch)
+                                       for i in tqdm(range(0, len(queries), block), desc="Searching the seed index"))
+    count, perfect, closest = [np.concatenate(part) for part in zip(*results)]
+
+    n = len(sequences)
+    count = count[:n] + count[n:]
+    perfect = perfect[:n] + perfect[n:]
+    closest = np.minimum(closest[:n], closest[n:])
+    mindist = np.where(perfect > 1, 0, closest)
+    return count, mindist
+
+
+def fasplit(fasta:os.PathLike, length:int, sublength:int)->str:
+    # all sublength-mers of every oligo, in order (as nhush fasplit)
+    out = f"{fasta}.{sublength}mers"
+    names, seqs = read_fasta(fasta)
+    with open(out, 'w') as f:
+        for name, seq in zip(names, seqs):
+            f.writelines(f">{name.split()[0]}|{i}\n{seq[i:i+sublength]}\n" for i in range(length-sublength+1))
+    return out
+
+
+def seed_hush(reference:os.PathLike, query:os.PathLike, length:int, mismatch:int, threads:int=1,
+              mindist:bool=False, sublength:int|None=None, splitonly:bool=False, memory:float=4)->None:
+    # query: FASTA or hushp query file, or folder of them (as hushp -q)
+    if os.path.isdir(query):
+        files = sorted(file for file in glob.glob(os.path.join(query, "*")) if not file.endswith(".out"))
+    else:
+        files = [query]
+
+    for file in files:
+        if sublength is not None:
+            file = fasplit(file, length, sublength)
+            if splitonly:
+                continue
+        size = sublength if sublength is not None else length
+        names, seqs = read_queries(file)
+        if len(seqs) == 0:
+            continue
+        count, closest = search([seq.upper() for seq in seqs], reference, mismatch, threads, memory=memory)
+        if mindist:
+            closest.astype(np.uint8).tofile(f"{file}.nh.L{size}.mindist.uint8")
+        else:
+            with open(file+".out", 'w') as f:
+                f.writelines(f"{name}, {c}\n" for name, c in zip(names, count))
+
+
+@click.command(
+    name="seed_hush",
+    help="Off-target search with the in-package seed index, in place of nhush (--mindist) or hushp."
+)
+@click.option('-r', '--reference', type=click.Path(exists=True), help="Reference genome (FASTA).")
+@click.option('-q', '--query', type=click.Path(exists=True), help="Query FASTA (or hushp name/sequence) file, or folder of them.")
+@click.option('-L', '--length', type=click.INT, help="Oligo length.")
+@click.option('-m', '--mismatch', type=click.INT, help="Max number of mismatches being investigated.")
+@click.option('-t', '--threads', type=click.INT, default=1)
+@click.option('--mindist', is_flag=True, help="Write the nhush min distances (.mindist.uint8) instead of the hushp counts (.out).")
+@click.option('-l', '--sublength', type=click.INT, help="Split the oligos in sublength-mers first (as nhush fasplit).")
+@click.option('--fasplit', is_flag=True, help="Only split the oligos in sublength-mers, without searching.")
+@click.option('-M', '--memory', type=click.FLOAT, default=4, show_default=True,
+              help="Memory for building the seed indexes in GB, on top of 1 byte per reference base (the encoded reference).")
+def main(reference:str, query:str, length:int, mismatch:int, threads:int, mindist:bool, sublength:int|None,
+         fasplit:bool, memory:float)->None:
+    seed_hush(reference, query, length, mismatch, threads, mindist, sublength, fasplit, memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+# Persistent cache of the melt/secs results, keyed by (thermodynamic conditions, sequence),
+# so that the same oligos are not computed again by melt_duplex and hybrid-ss-min across
+# overlapping windows, re-runs or projects. One sqlite file (default ~/.cache/probe_design/
+# thermo.sqlite, shared by all projects) with two tables:
+#   melt: dG, dH, dS, Tm (the melt_duplex row)     secs: ss_dG (the .ct dG)
+# Every lookup refreshes the last use of the entries; when the file grows above its size
+# limit, the least recently used entries are evicted.
+
+import os
+import time
+import sqlite3
+import click
+
+default_path = os.path.join(os.path.expanduser("~"), ".cache", "probe_design", "thermo.sqlite")
+
+
+class ThermoCache:
+    # (conditions, sequence) -> melt_duplex values / secondary structure dG, with LRU eviction
+
+    def __init__(self, path:os.PathLike=default_path, max_size:float=4):
+        # max_size in GB
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_size = max_size*1e9
+        self.connection = sqlite3.connect(path, timeout=600)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS melt (conditions TEXT, sequence TEXT, dG REAL, dH REAL, dS REAL, "
+                                "Tm REAL, used INTEGER, PRIMARY KEY (conditions, sequence)) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS secs (conditions TEXT, sequence TEXT, ss_dG REAL, "
+                                "used INTEGER, PRIMARY KEY (conditions, sequence)) WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS melt_used ON melt (used)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS secs_used ON secs (used)")
+        self.connection.commit()
+
+    def get(self, table:str, conditions:str, sequences:list[str])->dict:
+        # sequence -> tuple of values, for the sequences in the cache
+        columns = "dG, dH, dS, Tm" if table == 'melt' else "ss_dG"
+        found = {}
+        sequences = list(set(sequences))
+        for k in range(0, len(sequences), 500):
+            batch = sequences[k:k+500]
+            marks = ','.join('?'*len(batch))
+            rows = self.connection.execute(f"SELECT sequence, {columns} FROM {table} WHERE conditions=? AND sequence IN ({marks})",
+                                           (conditions, *batch)).fetchall()
+            found.update((row[0], row[1:]) for row in rows)
+            self.connection.execute(f"UPDATE {table} SET used=? WHERE conditions=? AND sequence IN ({marks})",
+                                    (int(time.time()), conditions, *batch))
+        self.connection.commit()
+        return found
+
+    def put(self, table:str, conditions:str, values:dict)->None:
+        marks = "?,?,?,?,?,?,?" if table == 'melt' else "?,?,?,?"
+        now = int(time.time())
+        self.connection.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({marks})",
+                                    [(conditions, seq, *value, now) for seq, value in values.items()])
+        self.connection.commit()
+        self.evict()
+
+    def size(self)->int:
+        # bytes used by the entries (free pages excluded)
+        pages = self.connection.execute("PRAGMA page_count").fetchone()[0] - self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages*self.connection.execute("PRAGMA page_size").fetchone()[0]
+
+    def evict(self)->None:
+        # least recently used entries first, down to 90% of the limit
+        size = self.size()
+        if size <= self.max_size:
+            return
+        for table in ['melt', 'secs']:
+            rows = self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            excess = int(rows*(1 - 0.9*self.max_size/size)) + 1
+            self.connection.execute(f"DELETE FROM {table} WHERE (conditions, sequence) IN "
+                                    f"(SELECT conditions, sequence FROM {table} ORDER BY used LIMIT ?)", (excess,))
+        self.connection.commit()
+
+    def close(self)->None:
+        self.connection.close()
+
+
+def thermo_cache(path:os.PathLike=default_path, max_size:float=4, clear:bool=False)->dict:
+    # number of entries per table, after trimming the cache to max_size (or clearing it)
+    cache = ThermoCache(path, max_size)
+    if clear:
+        cache.connection.execute("DELETE FROM melt")
+        cache.connection.execute("DELETE FROM secs")
+        cache.connection.commit()
+        cache.connection.execute("VACUUM")
+    cache.evict()
+    counts = {table: cache.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ['melt', 'secs']}
+    cache.close()
+    return counts
+
+
+@click.command(
+    name="thermo_cache",
+    help="Show the number of melting temperatures and secondary structures in the thermodynamics cache, "
+         "after trimming it to its size limit."
+)
+@click.option('--cache', type=click.Path(), default=default_path, help="Cache file, shared by all projects by default.")
+@click.option('-S', '--max-size', type=click.FLOAT, default=4, help="Size limit of the cache [GB].")
+@click.option('--clear', is_flag=True, help="Remove all entries.")
+def main(cache:str, max_size:float, clear:bool)->None:
+    counts = thermo_cache(cache, max_size, clear)
+    print(f"{cache}: {counts['melt']} melting temperatures, {counts['secs']} secondary structures.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+
+# In-package replacement for melt_duplex (oligo-melting): nearest-neighbour melting
+# temperature of all candidate oligos at once. The oligos are encoded as dinucleotide
+# indices in NumPy arrays, and the stacking sums (dH, dS at 1 M NaCl, SantaLucia 1998)
+# are cached next to the FASTA file (<fasta>.<type>.nn.npz), so that re-evaluating them
+# at other oligo, salt or formamide concentrations only applies the corrections:
+#   formamide: Wright 2014 (m-value, default) or McConaughy 1969 (-0.72 degC per %)
+#   Na+: Owczarzy 2004, Mg2+: Owczarzy 2008 (overwrites the Na+ correction)
+# Output: same table as melt_duplex, "oligo_name dG dH dS Tm Seq".
+
+import numpy as np
+import os
+import re
+import math
+import click
+from tqdm import tqdm
+
+try:
+    from .seed_hush import read_fasta
+except ImportError:     # run as a script through prb
+    from seed_hush import read_fasta
+
+R = 1.987/1000      # kcal / (K mol)
+
+codes = np.full(256, 4, dtype=np.uint8)        # A C G T/U -> 0 1 2 3, anything else -> 4
+for base, code in zip(b'ACGTUacgtu', [0, 1, 2, 3, 3]*2):
+    codes[base] = code
+
+# dH0 (kcal/mol), dS0 (cal/(K mol)) of the stacks, and end / initiation / symmetry terms
+# Allawi & SantaLucia 1997 [DNA:DNA], Freier 1986 [RNA:RNA], Sugimoto 1995 [DNA:RNA, RNA:DNA]
+stacks = {
+    'DNA:DNA': {'AA': (-7.9, -22.2), 'TT': (-7.9, -22.2), 'AT': (-7.2, -20.4), 'TA': (-7.2, -21.3),
+                'CA': (-8.5, -22.7), 'TG': (-8.5, -22.7), 'GT': (-8.4, -22.4), 'AC': (-8.4, -22.4),
+                'CT': (-7.8, -21.0), 'AG': (-7.8, -21.0), 'GA': (-8.2, -22.2), 'TC': (-8.2, -22.2),
+                'CG': (-10.6, -27.2), 'GC': (-9.8, -24.4), 'GG': (-8.0, -19.9), 'CC': (-8.0, -19.9)},
+    'RNA:RNA': {'AA': (-6.6, -18.4), 'TT': (-6.6, -18.4), 'AT': (-5.7, -15.5), 'TA': (-8.1, -22.6),
+                'CA': (-10.5, -27.8), 'TG': (-10.5, -27.8), 'CT': (-7.6, -19.2), 'AG': (-7.6, -19.2),
+                'GA': (-13.3, -35.5), 'TC': (-13.3, -35.5), 'GT': (-10.2, -26.2), 'AC': (-10.2, -26.2),
+                'CG': (-8.0, -19.4), 'GC': (-14.2, -34.9), 'GG': (-12.2, -29.7), 'CC': (-12.2, -29.7)},
+    'DNA:RNA': {'TT': (-7.8, -21.9), 'GT': (-5.9, -12.3), 'CT': (-9.1, -23.5), 'AT': (-8.3, -23.9),
+                'TG': (-9.0, -26.1), 'GG': (-9.3, -23.2), 'CG': (-16.3, -47.1), 'AG': (-7.0, -19.7),
+                'TC': (-5.5, -13.5), 'GC': (-8.0, -17.1), 'CC': (-12.8, -31.9), 'AC': (-7.8, -21.6),
+                'TA': (-7.8, -23.2), 'GA': (-8.6, -22.9), 'CA': (-10.4, -28.4), 'AA': (-11.5, -36.4)},
+    'RNA:DNA': {'AA': (-7.8, -21.9), 'AC': (-5.9, -12.3), 'AG': (-9.1, -23.5), 'AT': (-8.3, -23.9),
+                'CA': (-9.0, -26.1), 'CC': (-9.3, -23.2), 'CG': (-16.3, -47.1), 'CT': (-7.0, -19.7),
+                'GA': (-5.5, -13.5), 'GC': (-8.0, -17.1), 'GG': (-12.8, -31.9), 'GT': (-7.8, -21.6),
+                'TA': (-7.8, -23.2), 'TC': (-8.6, -22.9), 'TG': (-10.4, -28.4), 'TT': (-11.5, -36.4)},
+}
+ends = {'DNA:DNA': [(2.3, 4.1), (0.1, -2.8), (0.1, -2.8), (2.3, 4.1)],     # terminal A C G T
+        'RNA:RNA': [(0, -10.8)]*4}
+init = {'DNA:RNA': (1.9, -3.9), 'RNA:DNA': (1.9, -3.9)}
+symmetry = {'DNA:DNA': (2.3, 4.1), 'RNA:RNA': (0, -1.4)}
+hybrid = ['DNA:RNA', 'RNA:DNA']         # oligo concentration / 4
+
+
+def stack_table(duplex:str)->np.ndarray:
+    # (16, 2) dH, dS of the stacks, indexed by 4*first + second base
+    table = np.zeros((16, 2))
+    for pair, values in stacks[duplex].items():
+        table[4*codes[ord(pair[0])] + codes[ord(pair[1])]] = values
+    return table
+
+
+def nn_sums(sequences:list[str], duplex:str='DNA:DNA')->dict:
+    # dH (kcal/mol), dS (kcal/(K mol)) at 1 M NaCl, GC fraction and length of each sequence.
+    # valid: only A C G T (DNA template) or A C G U (RNA template) as melt_duplex.
+    # The stacks are added in sequence order, so that the sums are those of melt_duplex.
+    n = len(sequences)
+    sums = {'h': np.zeros(n), 's': np.zeros(n), 'fgc': np.zeros(n),
+            'length': np.array([len(seq) for seq in sequences], dtype=np.int64), 'valid': np.zeros(n, dtype=bool)}
+    table = stack_table(duplex)
+    wrong = 'U' if duplex.startswith('DNA') else 'T'
+    for length in np.unique(sums['length']):
+        subset = np.flatnonzero(sums['length'] == length)
+        if length == 0:
+            continue
+        raw = np.frombuffer(''.join(sequences[k] for k in subset).upper().encode(), dtype=np.uint8).reshape(len(subset), length)
+        seq = codes[raw]
+        valid = (seq < 4).all(axis=1) & ~(raw == ord(wrong)).any(axis=1)
+        seq = np.where(seq < 4, seq, 0)
+
+        dimers = 4*seq[:, :-1] + seq[:, 1:]
+        h, s = np.zeros(len(subset)), np.zeros(len(subset))
+        for j in range(length-1):
+            h += table[dimers[:, j], 0]
+            s += table[dimers[:, j], 1]
+        if duplex in ends:
+            terminal = np.array(ends[duplex])
+            h += terminal[seq[:, 0], 0]
+            h += terminal[seq[:, -1], 0]
+            s += terminal[seq[:, 0], 1]
+            s += terminal[seq[:, -1], 1]
+        if duplex in init:
+            h += init[duplex][0]
+            s += init[duplex][1]
+        if duplex in symmetry:
+            # self-complementary DNA sequences (melt_duplex compares with the DNA reverse complement)
+            palindrome = (seq == 3 - seq[:, ::-1]).all(axis=1) & ~(raw == ord('U')).any(axis=1)
+            h[palindrome] += symmetry[duplex][0]
+            s[palindrome] += symmetry[duplex][1]
+
+        sums['h'][subset], sums['s'][subset] = h, s/1e3
+        sums['fgc'][subset] = ((seq == 1) | (seq == 2)).sum(axis=1)/float(length)
+        sums['valid'][subset] = valid
+    return sums
+
+
+def parse_mvalue(mvalue:str)->tuple[float,float]:
+    # formamide m-value "x" or "xL+y" (L: oligo length) -> slope, intercept
+    match = re.fullmatch(r'([+-]?[0-9.]*)L([+-][0-9.]*)', mvalue)
+    if match is not None:
+        return float(match.group(1)), float(match.group(2))
+    if re.fullmatch(r'[+-]?[0-9.]*', mvalue) is not None:
+        return 0.0, float(mvalue)
+    raise ValueError(f"Unexpected formamide m-value format: {mvalue}.")
+
+
+def melting(sums:dict, duplex:str='DNA:DNA', oligo_conc:float=0.25e-6, na_conc:float=0.05, mg_conc:float=0,
+            fa_conc:float=0, fa_mode:str='wright', fa_mvalue:str='0.1734')->tuple[np.ndarray,np.ndarray]:
+    # dG at 37 degC (kcal/mol) and corrected Tm (K) from the cached sums
+    h, s, fgc, length = sums['h'], sums['s'], sums['fgc'], sums['length']
+    conc = oligo_conc/4 if duplex in hybrid else oligo_conc
+    tm = h / (s + R * math.log(conc))
+
+    # formamide
+    if fa_conc != 0:
+        if fa_mode == 'mcconaughy':
+            tm = tm - 0.72 * fa_conc
+        else:
+            slope, intercept = parse_mvalue(fa_mvalue)
+            m = slope * length + intercept if slope != 0 else intercept
+            tm = (h + m * fa_conc) / (R * math.log(conc) + s)
+
+    # ions
+    if mg_conc > 0:
+        log = math.log(mg_conc)
+        inverse = 1.0 / tm + 3.92e-5 + -9.11e-6 * log + fgc * (6.26e-5 + 1.42e-5 * log)
+        inverse += (-4.82e-4 + 5.25e-4 * log + 8.31e-5 * log ** 2) * (1.0 / (2 * (length - 1)))
+        tm = 1.0 / inverse
+    elif na_conc != 1.0 and na_conc > 0:
+        log = math.log(na_conc / 1.0)
+        inverse = 1.0 / tm
+        inverse += (4.29e-5 * fgc - 3.95e-5) * log
+        inverse += 9.4e-6 * (log ** 2)
+        tm = 1.0 / inverse
+
+    dg = h - (37 + 273.15) * s
+    return dg, tm
+
+
+def cached_sums(fasta:os.PathLike, duplex:str='DNA:DNA')->tuple[list[str],list[str],dict]:
+    # names, sequences and stacking sums, computed once per FASTA file
+    path = f"{fasta}.{duplex.replace(':', '')}.nn.npz"
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(fasta):
+        cache = np.load(path)
+        return cache['names'].tolist(), cache['sequences'].tolist(), {key: cache[key] for key in ['h', 's', 'fgc', 'length', 'valid']}
+    names, seqs = read_fasta(fasta)
+    seqs = [seq.upper() for seq in seqs]
+    sums = nn_sums(seqs, duplex)
+    np.savez(path+'.tmp.npz', names=np.array(names, dtype=str), sequences=np.array(seqs, dtype=str), **sums)
+    os.replace(path+'.tmp.npz', path)
+    return names, seqs, sums
+
+
+def tm_engine(fasta:os.PathLike, out:os.PathLike, duplex:str='DNA:DNA', oligo_conc:float=0.25e-6,
+              na_conc:float=0.05, mg_conc:float=0, fa_conc:float=0, fa_mode:str='wright',
+              fa_mvalue:str='0.1734', celsius:bool=False)->None:
+    # melt_duplex table of all oligos of a FASTA file
+    names, seqs, sums = cached_sums(fasta, duplex)
+    dg, tm = melting(sums, duplex, oligo_conc, na_conc, mg_conc, fa_conc, fa_mode, fa_mvalue)
+    if celsius:
+        tm = tm - 273.15
+    valid = sums['valid']
+    if not valid.all():
+        print(f"{(~valid).sum()} oligos of {os.path.basename(fasta)} contain non-nucleic acid characters and are skipped.")
+    with open(out, 'w') as f:
+        f.write("oligo_name\tdG\tdH\tdS\tTm\tSeq\n")
+        f.writelines("%s\t%f\t%f\t%f\t%f\t%s\n" % row for row, ok
+                     in zip(zip(names, dg.tolist(), sums['h'].tolist(), sums['s'].tolist(), tm.tolist(), seqs), valid) if ok)
+
+
+@click.command(
+    name="tm_engine",
+    help="Nearest-neighbour melting temperature of the oligos of FASTA files, in place of melt_duplex."
+)
+@click.option('-t', '--type', 'duplex', type=click.Choice(list(stacks.keys())), default='DNA:DNA',
+              help="Duplex type, the first nucleic acid being the given sequence.")
+@click.option('-o', '--oconc', type=click.FLOAT, default=0.25e-6, help="Oligonucleotide concentration [M].")
+@click.option('-n', '--naconc', type=click.FLOAT, default=0.05, help="Na+ concentration [M].")
+@click.option('-m', '--mgconc', type=click.FLOAT, default=0, help="Mg2+ concentration [M], overwrites the Na+ correction.")
+@click.option('-f', '--faconc', type=click.FLOAT, default=0, help="Formamide concentration [% v,v].")
+@click.option('--fa-mode', type=click.Choice(['wright', 'mcconaughy']), default='wright', help="Formamide correction.")
+@click.option('--fa-mvalue', type=click.STRING, default='0.1734', help="Formamide m-value of the wright correction, x or xL+y.")
+@click.option('-C', '--celsius', is_flag=True, help="Tm in Celsius degrees instead of Kelvin.")
+@click.option('--outfolder', type=click.Path(), default='./data/melt', help="One table per FASTA file, with the same name.")
+@click.argument('fastas', nargs=-1, type=click.Path(exists=True))
+def main(duplex:str, oconc:float, naconc:float, mgconc:float, faconc:float, fa_mode:str, fa_mvalue:str,
+         celsius:bool, outfolder:str, fastas:tuple[str])->None:
+    os.makedirs(outfolder, exist_ok=True)
+    for fasta in tqdm(fastas, desc="Calculating melting temperatures"):
+        tm_engine(fasta, os.path.join(outfolder, os.path.basename(fasta)), duplex, oconc, naconc, mgconc,
+                  faconc, fa_mode, fa_mvalue, celsius)
+
+
+if __name__ == "__main__":
+    main()
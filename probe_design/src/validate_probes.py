@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+# HUSH validation of the selected probes of a cycling_query round, in place of
+# shell/validation_oldHUSH_BLAST.sh. All selected oligos of the round are pooled into
+# one query set per reference (genome.fa, or genome_roi_N.fa in exclusion mode) so that
+# hushp loads every reference once, and the results are mapped back to the probes in memory.
+# Outputs are the same as the shell script: selected_probes/query_<probe>.fa_<mm>_mm.out
+# HUSH scores are cached across rounds (data/validation_cache.sqlite), keyed by
+# (reference checksum, length, mismatches, sequence): only unseen oligos go to hushp.
+# The cache is shared by the runs of the project; the selected probes and the HUSH folder
+# are those of the run folder (cycling_query -rundir), the data folder by default.
+# With engine='python', the in-package seed index (seed_hush) replaces hushp.
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import glob
+import click
+import subprocess
+import sqlite3
+import hashlib
+from datetime import datetime
+
+try:
+    from .seed_hush import search
+except ImportError:     # run as a script through prb
+    from seed_hush import search
+
+
+class ValidationCache:
+    # persistent HUSH scores: (reference checksum, length, mismatches, sequence) -> score
+
+    def __init__(self, path:os.PathLike):
+        self.connection = sqlite3.connect(path, timeout=600)     # other runs may be writing
+        self.connection.execute("CREATE TABLE IF NOT EXISTS refs (path TEXT, size INTEGER, mtime REAL, checksum TEXT, "
+                                "PRIMARY KEY (path, size, mtime))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS scores (reference TEXT, length INTEGER, mismatch INTEGER, "
+                                "sequence TEXT, score INTEGER, PRIMARY KEY (reference, length, mismatch, sequence)) WITHOUT ROWID")
+        self.connection.commit()
+
+    def checksum(self, reference:os.PathLike)->str:
+        # md5 of the reference, only recomputed when the file changes
+        path = os.path.abspath(reference)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT checksum FROM refs WHERE path=? AND size=? AND mtime=?",
+                                      (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row is not None:
+            return row[0]
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 24), b''):
+                md5.update(block)
+        self.connection.execute("INSERT OR REPLACE INTO refs VALUES (?,?,?,?)", (path, stat.st_size, stat.st_mtime, md5.hexdigest()))
+        self.connection.commit()
+        return md5.hexdigest()
+
+    def get(self, reference:str, length:int, mismatch:int, sequences:list[str])->dict:
+        scores = {}
+        sequences = list(set(sequences))
+        for k in range(0, len(sequences), 500):
+            batch = sequences[k:k+500]
+            rows = self.connection.execute("SELECT sequence, score FROM scores WHERE reference=? AND length=? AND mismatch=? "
+                                           f"AND sequence IN ({','.join('?'*len(batch))})", (reference, length, mismatch, *batch))
+            scores.update(rows.fetchall())
+        return scores
+
+    def put(self, reference:str, length:int, mismatch:int, scores:dict)->None:
+        self.connection.executemany("INSERT OR REPLACE INTO scores VALUES (?,?,?,?,?)",
+                                    [(reference, length, mismatch, seq, score) for seq, score in scores.items()])
+        self.connection.commit()
+
+    def close(self)->None:
+        self.connection.close()
+
+
+def probe_reference(probefile:os.PathLike, excl:bool=False)->str:
+    # reference genome the probe is validated against
+    if not excl:
+        return "genome.fa"
+    roi = re.search(r'roi_(\d+)', os.path.basename(probefile)).group(1)
+    return f"genome_roi_{roi}.fa"
+
+
+def query_names(probe:pd.DataFrame)->list[str]:
+    # HUSH query names, as converted by sed in validation_oldHUSH_BLAST.sh
+    return [f"{name}:{chrom}:{start}-{end}" for name, chrom, start, end
+            in zip(probe.name, probe.chromosome, probe.start, probe.end)]
+
+
+def run_hushp(records:list[str], reference:os.PathLike, workdir:os.PathLike,
+              length:int, mismatch:int, threads:int, log=None)->dict:
+    # single hushp run over all queries (name\nsequence\n records), one input file per thread.
+    # Returns the score of each query, by name (the output files are not in query order).
+    os.makedirs(workdir, exist_ok=True)
+    for k, chunk in enumerate(np.array_split(np.arange(len(records)), threads)):
+        if len(chunk) > 0:
+            with open(os.path.join(workdir, f"x{k:04d}"), 'w') as f:
+                f.write(''.join(records[i] for i in chunk))
+
+    subprocess.run(["hushp", "-l", str(length), "-t", str(threads), "-r", str(reference), "-q", str(workdir),
+                    "-m", str(mismatch), "-f", "0", "-C", "--verbose", "1"],
+                   stdout=log, stderr=subprocess.STDOUT if log is not None else None, check=True)
+
+    results = {}
+    for out in glob.glob(os.path.join(workdir, "*.out")):
+        with open(out) as f:
+            for line in f:
+                fields = line.rstrip('\n').split(sep=", ")
+                if len(fields) > 1:
+                    results[fields[0]] = int(fields[1])
+    missing = [record.split('\n', 1)[0] for record in records if record.split('\n', 1)[0] not in results]
+    if len(missing) > 0:
+        raise RuntimeError(f"hushp returned no result for {len(missing)} of {len(records)} oligos against {reference}.")
+    return results
+
+
+def validate_probes(length:int, mismatch:int, threads:int=1, excl:bool=False,
+                    currentfolder:os.PathLike='./data/', log=None,
+                    cache:bool=True, engine:str='hushp', rundir:os.PathLike|None=None)->tuple[int,int]:
+    # returns the number of oligos found in the cache and the number of oligos validated
+    if rundir is None:
+        rundir = currentfolder
+    selectedfolder = os.path.join(rundir, "selected_probes")
+    probefiles = sorted(glob.glob(os.path.join(selectedfolder, "*.tsv")))
+    if len(probefiles) == 0:
+        return 0, 0
+
+    # unique HUSH folder next to the data folder, as in the shell script (in the run folder of a run)
+    ts = "oldHUSH_"+datetime.now().strftime("%Y%m%d-%H%M%S")
+    if os.path.abspath(rundir) == os.path.abspath(currentfolder):
+        hushfolder = os.path.join(os.path.dirname(os.path.abspath(os.path.normpath(currentfolder))), "HUSH", ts)
+    else:
+        hushfolder = os.path.join(rundir, "HUSH", ts)
+
+    # pool the queries of all probes per reference
+    groups = {}
+    for file in probefiles:
+        probe = pd.read_csv(file, sep="\t", header=0)
+        groups.setdefault(probe_reference(file, excl), []).append((file, query_names(probe), probe.sequence.str.upper().to_list()))
+
+    validation = ValidationCache(os.path.join(currentfolder, "validation_cache.sqlite")) if cache else None
+    hits, total = 0, 0
+    for reference, probes in groups.items():
+        refpath = os.path.join(currentfolder, "ref", reference)
+        checksum = validation.checksum(refpath) if cache else None
+        sequences = [seq for _, _, probe in probes for seq in probe]
+        scores = validation.get(checksum, length, mismatch, sequences) if cache else {}
+
+        # only unseen sequences are sent to hushp (once each)
+        fresh = [seq for seq in dict.fromkeys(sequences) if seq not in scores]
+        hits += sum(seq in scores for seq in sequences)
+        total += len(sequences)
+        if len(fresh) > 0:
+            print(f"Running HUSH on {len(fresh)} of {len(sequences)} oligos from {len(probes)} probes against {reference}.")
+            if engine == 'python':
+                counts, _ = search(fresh, refpath, mismatch, threads)
+                new = dict(zip(fresh, counts.tolist()))
+            else:
+                workdir = os.path.join(hushfolder, f"{reference[:-3]}_mm_{mismatch}")
+                records = [f"oligo_{k}\n{seq}\n" for k, seq in enumerate(fresh)]
+                results = run_hushp(records, refpath, workdir, length, mismatch, threads, log)
+                new = {seq: results[f"oligo_{k}"] for k, seq in enumerate(fresh)}
+            if cache:
+                validation.put(checksum, length, mismatch, new)
+            scores.update(new)
+
+        # map cached and fresh scores back to the probes
+        for file, names, probe in probes:
+            out = os.path.join(selectedfolder, f"query_{os.path.basename(file)[:-4]}.fa_{mismatch}_mm.out")
+            with open(out, 'w') as f:
+                f.writelines(f"{name}, {scores[seq]}\n" for name, seq in zip(names, probe))
+
+    if cache:
+        validation.close()
+    return hits, total
+
+
+@click.command(
+    name="validate_probes",
+    help="Check the selected probes for off-target homology with HUSH, one hushp run per reference."
+)
+@click.option('-L', '--length', type=click.INT, help="Oligo length.")
+@click.option('-m', '--mismatch', type=click.INT, help="Max number of mismatches being investigated.")
+@click.option('-t', '--threads', type=click.INT, default=1)
+@click.option('-e', '--excl', is_flag=True, help="Exclusion mode: validate each ROI against data/ref/genome_roi_N.fa.")
+@click.option('--nocache', is_flag=True, help="Validate every oligo again instead of reusing cached HUSH scores.")
+@click.option('--engine', type=click.Choice(['hushp', 'python']), default='hushp',
+              help="Off-target counter: hushp, or the in-package seed index (no external binary).")
+@click.option('--run-dir', 'rundir', type=click.Path(exists=True, file_okay=False), default=None,
+              help="Run folder of cycling_query -rundir holding the selected_probes. Default: data/")
+def main(length:int, mismatch:int, threads:int, excl:bool, nocache:bool, engine:str, rundir:str|None)->None:
+    hits, total = validate_probes(length, mismatch, threads, excl, cache=not nocache, engine=engine, rundir=rundir)
+    print(f"{hits} of {total} oligos found in the validation cache.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Small random references and queries for the homology tests, with naive scans to compare against.
+
+import random
+
+
+def revcomp(seq:str)->str:
+    return seq[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+
+
+def mutate(rng:random.Random, seq:str, count:int)->str:
+    seq = list(seq)
+    for i in rng.sample(range(len(seq)), count):
+        seq[i] = rng.choice([base for base in 'ACGT' if base != seq[i]])
+    return ''.join(seq)
+
+
+def make_reference(path, seed:int)->list[str]:
+    # random records, with mutated copies of a piece of the first one on both strands
+    rng = random.Random(seed)
+    records = [''.join(rng.choice('ACGT') for _ in range(rng.randint(200, 400))) for _ in range(3)]
+    piece = records[0][50:90]
+    records[1] = records[1][:100] + mutate(rng, piece, 1) + records[1][100:]
+    records[2] = records[2][:150] + revcomp(mutate(rng, piece, 2)) + records[2][150:]
+    records[2] = records[2][:20] + piece[5:30] + records[2][20:]
+    with open(path, 'w') as f:
+        for k, record in enumerate(records):
+            f.write(f">chr{k}\n")
+            f.writelines(record[i:i+60]+"\n" for i in range(0, len(record), 60))
+    return records
+
+
+def make_queries(records:list[str], seed:int, length:int, count:int=40)->list[str]:
+    # on-target oligos, mutated and reverse complemented ones, and random ones
+    rng = random.Random(seed)
+    queries = []
+    for k in range(count):
+        record = rng.choice(records)
+        start = rng.randrange(len(record) - length + 1)
+        if k < 5:
+            start = rng.randrange(45, 55)       # in the copied piece
+            record = records[0]
+        query = record[start:start+length]
+        if k % 4 == 1:
+            query = mutate(rng, query, rng.randint(1, 3))
+        elif k % 4 == 2:
+            query = revcomp(query)
+        elif k % 4 == 3 and k > 5:
+            query = ''.join(rng.choice('ACGT') for _ in range(length))
+        queries.append(query)
+    return queries
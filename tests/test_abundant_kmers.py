@@ -0,0 +1,49 @@
+# Abundant L-mer counter (abundant_kmers): counts against collections.Counter on a small random
+# genome with planted repeats, and over-full buckets split within the memory limit.
+
+import collections
+import random
+import numpy as np
+import pytest
+
+from probe_design.src.abundant_kmers import abundant_kmers, count_bucket, decode
+from tests.reference import revcomp
+
+
+def naive_counts(records:list[str], length:int, threshold:int)->dict:
+    counts = collections.Counter()
+    for record in records:
+        for i in range(len(record) - length + 1):
+            kmer = record[i:i+length]
+            if 'N' not in kmer:
+                counts[min(kmer, revcomp(kmer))] += 1
+    return {kmer: count for kmer, count in counts.items() if count >= threshold}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_abundant_kmers_counter(tmp_path, seed:int):
+    rng = random.Random(seed)
+    repeat = ''.join(rng.choice('ACGT') for _ in range(30))
+    records = []
+    for _ in range(4):
+        pieces = [''.join(rng.choice('ACGT') for _ in range(rng.randint(0, 50))) for _ in range(10)]
+        records.append(''.join(piece + rng.choice([repeat, revcomp(repeat), 'NN']) for piece in pieces))
+    genome = tmp_path / "genome.fa"
+    genome.write_text(''.join(f">chr{k}\n{record}\n" for k, record in enumerate(records)))
+    out = abundant_kmers(str(genome), 20, 3, outfolder=str(tmp_path))
+    table = np.load(out[:-3]+'.counts.npz')
+    assert dict(zip(decode(table['kmers'], 20), table['counts'].tolist())) == naive_counts(records, 20, 3)
+
+
+@pytest.mark.parametrize('limit', [7, 50, 1000])
+def test_count_bucket_split(tmp_path, limit:int):
+    # a bucket dominated by a few L-mers, counted within limit L-mers at a time
+    rng = np.random.default_rng(0)
+    kmers = rng.integers(0, 1<<62, (300, 2), dtype=np.uint64)
+    kmers = kmers[rng.choice(300, 2000, p=np.linspace(1, 20, 300)/np.linspace(1, 20, 300).sum())]
+    bucket = tmp_path / "bucket.u64"
+    kmers.tofile(bucket)
+    found, counts = count_bucket(str(bucket), 8, limit)
+    distinct, expected = np.unique(kmers, axis=0, return_counts=True)
+    assert sorted(zip(map(tuple, found.tolist()), counts.tolist())) == \
+        sorted((tuple(kmer), count) for kmer, count in zip(distinct.tolist(), expected.tolist()) if count >= 8)
@@ -0,0 +1,39 @@
+# Checkpoint of the cycling_query loop (save_state / load_state): the state read back
+# rebuilds the ROIs left, the counters and the probes to repair as the resume does.
+
+import os
+import numpy as np
+import pandas as pd
+
+from probe_design.src.cycling_query import save_state, load_state
+
+
+def test_state_roundtrip(tmp_path):
+    statepath = str(tmp_path / "cycling_query.state.json")
+    assert load_state(statepath) is None
+
+    rdroi = pd.DataFrame({'window_id': np.arange(1, 6), 'chrom': ['chr1']*5, 'window': np.arange(5)*2})
+    toprocess = rdroi.loc[[1, 3, 4]].copy()
+    toprocess['window'] = np.array([7, 8, 9], dtype=np.int64)
+    probedata = pd.DataFrame({'name': ['a', 'b', 'c'], 'start': np.array([10, 60, 110]), 'ov_ids': [1.0, np.nan, 3.5]})
+    repairs = {np.int64(4): (probedata, np.array([True, False, True]), np.float64(1e-4))}
+    parameters = {'strand': 'DNA', 'length': 40, 'mismatch': 3, 'cutoff': 100, 'probe': None,
+                  'start': 0, 'end': 10, 'step': 1, 'stepdown': 50}
+    save_state(statepath, parameters, np.int64(3), 2, toprocess, [np.int64(2)], [5], repairs)
+    assert os.listdir(tmp_path) == ["cycling_query.state.json"]
+
+    state = load_state(statepath)
+    assert state['parameters'] == parameters
+    assert (state['count'], state['sweep'], state['complete']) == (3, 2, False)
+    assert (state['completelyfailed'], state['finished']) == ([2], [5])
+    resumed = rdroi.loc[state['toprocess']['index']]
+    resumed['window'] = state['toprocess']['window']
+    pd.testing.assert_frame_equal(resumed, toprocess)
+    restored = {int(roi): (pd.DataFrame(data), np.array(rejected), pw) for roi, (data, rejected, pw) in state['repairs'].items()}
+    assert list(restored) == [4]
+    pd.testing.assert_frame_equal(restored[4][0], probedata)
+    assert restored[4][1].tolist() == [True, False, True] and restored[4][2] == 1e-4
+
+    save_state(statepath, parameters, 4, 2, toprocess.iloc[:0], [], [5, 2, 3], {}, complete=True)
+    state = load_state(statepath)
+    assert state['complete'] and state['toprocess'] == {'index': [], 'window': []} and state['repairs'] == {}
@@ -0,0 +1,54 @@
+# FM-index longest off-target match (fm_index.longest_offtarget) against a naive scan of
+# a small random reference.
+
+import numpy as np
+import os
+import pytest
+
+from probe_design.src.fm_index import FMIndex, longest_offtarget, encode
+from tests.reference import revcomp, make_reference, make_queries
+
+
+def occurrences(texts:list[str], sub:str)->int:
+    count = 0
+    for text in texts:
+        i = text.find(sub)
+        while i >= 0:
+            count += 1
+            i = text.find(sub, i+1)
+    return count
+
+
+def naive_longest(query:str, records:list[str])->int:
+    texts = records + [revcomp(record) for record in records]
+    skip = 1 if occurrences(texts, query) > 0 else 0
+    for length in range(len(query), 0, -1):
+        if any(occurrences(texts, query[i:i+length]) > skip for i in range(len(query) - length + 1)):
+            return length
+    return 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('length', [30, 40])
+def test_longest_offtarget_naive(tmp_path, seed:int, length:int):
+    reference = tmp_path / "genome.fa"
+    records = make_reference(reference, seed)
+    queries = make_queries(records, seed, length)
+    longest = longest_offtarget(queries, str(reference))
+    assert longest.tolist() == [naive_longest(query, records) for query in queries]
+
+
+def test_bucketed_build(tmp_path):
+    # a build in many small buckets gives the index of a single bucket
+    records = make_reference(tmp_path / "genome.fa", 0)
+    (tmp_path / "small").mkdir()
+    make_reference(tmp_path / "small" / "genome.fa", 0)
+    whole = FMIndex(str(tmp_path / "genome.fa"))
+    small = FMIndex(str(tmp_path / "small" / "genome.fa"), memory=1e-6)
+    for a, b in [(whole.bwt, small.bwt), (whole.occ, small.occ), (whole.C, small.C), (whole.kmers, small.kmers)]:
+        assert np.array_equal(a, b)
+    text = ''.join('N' + record for record in records) + 'N'
+    text = text + revcomp(text)
+    suffixes = sorted(range(len(text)+1), key=lambda i: encode(text[i:]).tolist() + [0])
+    assert whole.bwt[:len(suffixes)].tolist() == [encode(text)[i-1] if i > 0 else 0 for i in suffixes]
+    assert not os.path.exists(str(tmp_path / "small" / "genome.fa.fm.tmp"))
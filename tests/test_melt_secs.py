@@ -0,0 +1,65 @@
+# Merging of the melt/secs chunks (melt_secs.merge_chunks), with oligos from the
+# thermodynamics cache left out of the chunks.
+
+import random
+import pytest
+
+from probe_design.src.melt_secs import merge_chunks, unfolded_record, read_ct
+
+
+def write_chunks(workdir, names:list[str], seqs:list[str], melt:dict, secs:dict, chunk:int)->list[str]:
+    # chunk files as process_chunk leaves them: melt_duplex skips the oligos with an N
+    chunks = []
+    for k, start in enumerate(range(0, len(seqs), chunk)):
+        chunkfile = str(workdir / f"c{k:04d}.fa")
+        with open(chunkfile[:-3]+'.tsv', 'w') as f:
+            f.write("oligo_name\tdG\tdH\tdS\tTm\tSeq\n")
+            f.writelines("%s\t%f\t%f\t%f\t%f\t%s\n" % (name, *melt[seq], seq)
+                         for name, seq in zip(names[start:start+chunk], seqs[start:start+chunk]) if 'N' not in seq)
+        with open(chunkfile+'.ct', 'w') as f:
+            f.writelines(unfolded_record(name, seq, secs[seq][0])
+                         for name, seq in zip(names[start:start+chunk], seqs[start:start+chunk]))
+        chunks.append(chunkfile)
+    return chunks
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 100])
+def test_merge_chunks(tmp_path, chunk:int):
+    rng = random.Random(chunk)
+    seqs = [''.join(rng.choice('ACGT') for _ in range(30)) for _ in range(40)]
+    seqs[5] = seqs[5][:10] + 'N' + seqs[5][11:]
+    seqs[20] = seqs[3]          # same oligo twice
+    names = [f"oligo_{k}" for k in range(len(seqs))]
+    melt = {seq: tuple(round(x, 6) for x in (-rng.uniform(20, 40), -rng.uniform(200, 300), -rng.uniform(0.5, 0.8), rng.uniform(40, 70)))
+            for seq in seqs}
+    secs = {seq: (-round(rng.uniform(0, 5), 1),) for seq in seqs}
+    cached = set(rng.sample(seqs, 15)) - {seqs[3]}
+    cached_melt = {seq: melt[seq] for seq in cached if 'N' not in seq}         # never melted
+    cached_secs = {seq: secs[seq] for seq in cached}
+    miss = [k for k, seq in enumerate(seqs) if seq not in cached_melt or seq not in cached_secs]
+    chunks = write_chunks(tmp_path, [names[k] for k in miss], [seqs[k] for k in miss], melt, secs, chunk)
+
+    meltout, secsout = str(tmp_path / "melt.tsv"), str(tmp_path / "secs.fa.ct")
+    computed_melt, computed_secs = merge_chunks(chunks, names, seqs, meltout, secsout, cached_melt, cached_secs)
+    assert computed_melt == {seqs[k]: melt[seqs[k]] for k in miss if 'N' not in seqs[k]}
+    assert computed_secs == {seqs[k]: secs[seqs[k]] for k in miss if seqs[k] not in cached_secs}
+
+    with open(meltout) as f:
+        rows = [line.rstrip('\n').split('\t') for line in f][1:]
+    assert [row[0] for row in rows] == [name for name, seq in zip(names, seqs) if 'N' not in seq]
+    assert [tuple(float(x) for x in row[1:5]) for row in rows] == [melt[row[5]] for row in rows]
+    records = read_ct(secsout)
+    assert [record.split('\n', 1)[0] for record in records] == [f"{len(seq)}\tdG = {secs[seq][0]:g}\t{name}" for name, seq in zip(names, seqs)]
+
+
+def test_merge_chunks_missing(tmp_path):
+    # a chunk without all its structures is not merged
+    seqs = ['ACGT'*8, 'TTGCA'*6]
+    chunks = write_chunks(tmp_path, ['a', 'b'], seqs, {seq: (-30, -250, -0.7, 60) for seq in seqs}, {seq: (-1,) for seq in seqs}, 2)
+    with open(chunks[0]+'.ct') as f:
+        first = f.read().split('\n')
+    with open(chunks[0]+'.ct', 'w') as f:
+        f.write('\n'.join(first[:len(seqs[0])+1]) + '\n')
+    with pytest.raises(RuntimeError):
+        merge_chunks(chunks, ['a', 'b'], seqs, str(tmp_path / "melt.tsv"), str(tmp_path / "secs.fa.ct"))
+    assert not (tmp_path / "secs.fa.ct").exists()
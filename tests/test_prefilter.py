@@ -0,0 +1,75 @@
+# Hard filters on the candidates (prefilter.hard_filters) against regular expressions, and the
+# in-place filtering of the candidate files with the dropped-oligo sidecars.
+
+import random
+import re
+import pandas as pd
+import pytest
+
+from probe_design.src.prefilter import hard_filters, prefilter
+from probe_design.src.seed_hush import read_fasta
+
+
+def naive_reason(seq:str, maxid:int, repeats:int, blacklist:set)->str:
+    upper = seq.upper()
+    if maxid > 0 and re.search(r'(.)\1{%d}' % (maxid-1), seq):
+        return 'homopolymer'
+    if re.search(r'[^ACGT]', upper):
+        return 'N'
+    if repeats > 1 and re.search(r'(([ACGT])(?!\2)[ACGT])\1{%d}' % (repeats-1), upper):
+        return 'repeat'
+    if upper in blacklist:
+        return 'blacklist'
+    return ''
+
+
+def random_oligos(rng:random.Random, n:int)->list[str]:
+    # random oligos, some with a homopolymer, an N, a dinucleotide repeat or lower case
+    seqs = []
+    for _ in range(n):
+        seq = ''.join(rng.choice('ACGT') for _ in range(rng.randint(20, 40)))
+        i = rng.randrange(len(seq) - 12)
+        kind = rng.randrange(5)
+        if kind == 0:
+            seq = seq[:i] + rng.choice('ACGT')*rng.randint(4, 8) + seq[i:]
+        elif kind == 1:
+            seq = seq[:i] + 'N' + seq[i+1:]
+        elif kind == 2:
+            seq = seq[:i] + rng.choice(['AC', 'TG', 'CA', 'AT'])*rng.randint(3, 6) + seq[i:]
+        elif kind == 3:
+            seq = seq[:i] + seq[i:i+10].lower() + seq[i+10:]
+        seqs.append(seq)
+    return seqs
+
+
+@pytest.mark.parametrize('maxid,repeats', [(6, 5), (4, 3), (0, 0)])
+def test_hard_filters_naive(maxid:int, repeats:int):
+    rng = random.Random(maxid)
+    seqs = random_oligos(rng, 300)
+    blacklist = set(seq.upper() for seq in rng.sample(seqs, 30))
+    reasons = hard_filters(seqs, maxid, repeats, blacklist)
+    assert reasons.tolist() == [naive_reason(seq, maxid, repeats, blacklist) for seq in seqs]
+    assert set(reasons) - {''}, "no oligo dropped"
+
+
+def test_prefilter_files(tmp_path):
+    # dropped oligos leave the candidate file for the sidecar, in order, and a second run keeps both
+    candidates, dropped = tmp_path / "candidates", tmp_path / "dropped"
+    candidates.mkdir()
+    seqs = random_oligos(random.Random(1), 100)
+    names = [f"ROI_1 pos=chr1:1000-5000|{k+1}:{k+len(seq)}" for k, seq in enumerate(seqs)]
+    fasta = candidates / "roi_1.GC35to85_Reference.fa"
+    with open(fasta, 'w') as f:
+        f.writelines(f">{name}\n{seq}\n" for name, seq in zip(names, seqs))
+    reasons = hard_filters(seqs)
+
+    assert prefilter(candfolder=str(candidates), droppedfolder=str(dropped)) == ((reasons != '').sum(), len(seqs))
+    assert read_fasta(fasta) == ([n for n, r in zip(names, reasons) if r == ''], [s for s, r in zip(seqs, reasons) if r == ''])
+    table = pd.read_csv(dropped / "roi_1.GC35to85_Reference.tsv", sep="\t")
+    assert table.name.tolist() == [n for n, r in zip(names, reasons) if r != '']
+    assert table.reason.tolist() == [r for r in reasons if r != '']
+    first = [k for k, r in enumerate(reasons) if r != ''][0]
+    assert (table.chromosome[0], table.start[0], table.end[0]) == ('chr1', 1000+first, 1000+first+len(seqs[first])-1)
+
+    assert prefilter(candfolder=str(candidates), droppedfolder=str(dropped)) == (0, (reasons == '').sum())
+    assert len(pd.read_csv(dropped / "roi_1.GC35to85_Reference.tsv", sep="\t")) == (reasons != '').sum()
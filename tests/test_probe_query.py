@@ -0,0 +1,110 @@
+# Exact probe query (probe_query.solve_exact) against a brute force search over all
+# selections of n oligos on tiny databases, split queries against the exact one, probe
+# repair and probe queries past their deadline.
+
+import itertools
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from probe_design.src.probe_query import OligoDB, solve_exact, probe_cost, solve_probe, solve_split, repair_probe
+
+
+def random_db(seed:int, size:int, dmax:int|None=None)->OligoDB:
+    # oligos of 10 to 20 nt starting anywhere in 200 nt, overlapping ones included
+    rng = np.random.default_rng(seed)
+    start = np.sort(rng.choice(200, size, replace=False))
+    frame = pd.DataFrame({'start': start, 'end': start + rng.integers(10, 21, size), 'oligo_cost': rng.random(size)})
+    return OligoDB('test', dmax, frame)
+
+
+def brute_force(db:OligoDB, n:int, pw:float)->float:
+    ideal = db.ideal_gap(n)
+    return min((probe_cost(db, np.array(selection), pw, ideal) for selection in itertools.combinations(range(len(db)), n)),
+               default=np.inf)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('pw', [1e-3, 1e-1, 1])
+@pytest.mark.parametrize('dmax', [None, 40])
+def test_solve_exact_brute_force(seed:int, pw:float, dmax:int|None):
+    db = random_db(seed, 9, dmax)
+    for n in range(1, 7):
+        best = brute_force(db, n, pw)
+        selection = solve_exact(db, n, pw)
+        if np.isinf(best):
+            assert selection is None
+        else:
+            assert len(set(selection.tolist())) == n
+            assert probe_cost(db, selection, pw, db.ideal_gap(n)) == pytest.approx(best)
+
+
+def test_solve_exact_too_few_oligos():
+    db = random_db(0, 4)
+    assert solve_exact(db, 5, 1e-3) is None
+    assert solve_exact(db, 0, 1e-3) is None
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_solve_split_uneven_density(seed:int):
+    # dense candidates in the first 1000 nt, sparse ones in the next 3000
+    rng = np.random.default_rng(seed)
+    start = np.sort(np.concatenate([rng.choice(1000, 400, replace=False), 1000 + rng.choice(3000, 150, replace=False)]))
+    frame = pd.DataFrame({'start': start, 'end': start + rng.integers(18, 23, len(start)), 'oligo_cost': rng.random(len(start))})
+    db = OligoDB('test', None, frame)
+    selection, status = solve_split(db, 40, 1e-2, 10)
+    ideal = db.ideal_gap(40)
+    assert status == 'split' and len(set(selection.tolist())) == 40
+    assert probe_cost(db, selection, 1e-2, ideal) <= 1.1*probe_cost(db, solve_exact(db, 40, 1e-2), 1e-2, ideal)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_repair_probe_database_rows(seed:int):
+    # probe file with other columns than the database (as written by escafish), two oligos rejected
+    db = random_db(seed, 120)
+    db.frame['name'] = [f"oligo_{k}" for k in range(len(db))]
+    selection = np.sort(solve_exact(db, 6, 1e-3))
+    probe = db.frame.iloc[selection][['name', 'start', 'end']].assign(score=1.0)
+    rejected = np.zeros(6, dtype=bool)
+    rejected[[1, 4]] = True
+    filtered = OligoDB('test', None, db.frame[~db.frame.name.isin(probe.name[rejected])])     # updated database
+    repaired = repair_probe(filtered, probe, rejected, 1e-3)
+    assert list(repaired.columns) == list(filtered.frame.columns) and not repaired.isna().any().any()
+    assert len(repaired) == 6 and set(probe.name[~rejected]) <= set(repaired.name)
+    assert not set(probe.name[rejected]) & set(repaired.name)
+    assert (repaired.start.to_numpy()[1:] >= repaired.end.to_numpy()[:-1]).all()
+
+
+def test_solve_probe_past_deadline(tmp_path):
+    # the greedy probe is kept when the time budget is already spent
+    db = random_db(0, 60)
+    for split in [None, 3]:
+        probe, selection, status = solve_probe(db, 6, 1e-3, tmp_path / "probe.tsv",
+                                               deadline=time.monotonic()-1, split=split)
+        assert status == 'deadline'
+        assert len(probe) == 6 and len(set(selection.tolist())) == 6
+
+
+@pytest.mark.parametrize('greedy', [False, True])
+def test_solve_probe_escafish_past_deadline(tmp_path, monkeypatch, greedy:bool):
+    # fake escafish writing the first n oligos of the database
+    escafish = tmp_path / "escafish"
+    escafish.write_text(f"""#!{sys.executable}
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+with open(args['--db']) as f:
+    lines = f.readlines()
+with open(args['--out'], 'w') as f:
+    f.writelines(lines[:int(args['--noligos'])+1])
+""")
+    escafish.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    db = tmp_path / "db.tsv"
+    random_db(0, 20).frame.to_csv(db, sep="\t", index=False)
+    probe, _, status = solve_probe(db, 5, 1e-3, tmp_path / "probe.tsv", greedy=greedy,
+                                   engine='escafish', deadline=time.monotonic()-1)
+    assert status == ('greedy' if greedy else 'deadline')
+    assert len(probe) == 5
@@ -0,0 +1,95 @@
+# Pipeline runner (run.run): the piece graph, and which pieces run again after a change,
+# with stand-in stages that only write their outputs.
+
+import importlib
+import os
+import pytest
+
+from probe_design.src.run import pieces, outputs, stages, run
+
+module = importlib.import_module("probe_design.src.run")      # the package exports the function of that name
+
+params = {'nt_type': 'DNA', 'length': 40, 'sublength': 21, 'mismatch': 3, 'threads': 1, 'inhash': 14,
+          'engine': 'python', 'cutoff': 100, 'abundance': False, 'scoref': 'q_bl', 'maxconsec': 32, 'maxid': 6,
+          'temperature': 72, 'hamdist': 8, 'gap': 2000, 'query': '', 'excl': False, 'gcfilter': True}
+
+
+def test_pieces():
+    graph = pieces([1, 2])
+    assert graph[('get_oligos', 1)] == []
+    assert graph[('run_nHUSH', 2)] == [('get_oligos', 2), ('generate_blacklist', None)]
+    assert graph[('build-db', 1)] == [('reform_hush_combined', 1), ('melt_secs', 1), ('generate_blacklist', None)]
+    assert graph[('cycling_query', None)] == [('build-db', 1), ('build-db', 2)]
+    assert graph[('summarize', None)] == [('cycling_query', None)]
+    assert len(graph) == 5*2 + 3
+
+
+def fake_stage(stage:str):
+    # writes the outputs of the piece and logs the call
+    def function(roi, params:dict, datafolder:os.PathLike)->None:
+        for path in outputs(stage, roi, params, datafolder):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        with open(os.path.join(datafolder, "calls.txt"), 'a') as f:
+            f.write(f"{stage} {roi}\n")
+    return function
+
+
+@pytest.fixture
+def datafolder(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'stage_functions', {stage: fake_stage(stage) for stage in stages})
+    data = tmp_path / "data"
+    (data / "rois").mkdir(parents=True)
+    (data / "ref").mkdir()
+    with open(data / "rois" / "all_regions.tsv", 'w') as f:
+        f.write("window_id\tchrom\tWindow_start\tWindow_end\tref\n1\tchr1\t1000\t5000\thg38\n2\tchr2\t1000\t5000\thg38\n")
+    for name in ["genome.fa", "hg38.chromosome.1.fa", "hg38.chromosome.2.fa"]:
+        (data / "ref" / name).write_text(">chr\nACGT\n")
+    return str(data)
+
+
+def calls(datafolder:str)->set:
+    # pieces run since the last call
+    path = os.path.join(datafolder, "calls.txt")
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        ran = {(line.split()[0], None if line.split()[1] == 'None' else int(line.split()[1])) for line in f}
+    os.remove(path)
+    return ran
+
+
+def test_run_stale(datafolder:str):
+    assert run(params, jobs=2, datafolder=datafolder) == (13, 0, 0)
+    assert calls(datafolder) == set(pieces([1, 2]))
+    assert run(params, jobs=2, datafolder=datafolder) == (0, 13, 0)
+    assert calls(datafolder) == set()
+
+    # a parameter of build-db: build-db of every ROI and everything after it
+    assert run({**params, 'hamdist': 6}, jobs=2, datafolder=datafolder) == (4, 9, 0)
+    assert calls(datafolder) == {('build-db', 1), ('build-db', 2), ('cycling_query', None), ('summarize', None)}
+
+    # a missing output: that piece and the pieces that depend on it
+    os.remove(outputs('melt_secs', 2, params, datafolder)[0])
+    assert run({**params, 'hamdist': 6}, jobs=2, datafolder=datafolder) == (4, 9, 0)
+    assert calls(datafolder) == {('melt_secs', 2), ('build-db', 2), ('cycling_query', None), ('summarize', None)}
+
+    # a changed source file: the pieces of that ROI from the start
+    with open(os.path.join(datafolder, "ref", "hg38.chromosome.1.fa"), 'a') as f:
+        f.write("ACGT\n")
+    assert run({**params, 'hamdist': 6}, jobs=2, datafolder=datafolder, dry_run=True) == (0, 6, 0)
+    assert calls(datafolder) == set()
+    assert run({**params, 'hamdist': 6}, jobs=2, datafolder=datafolder) == (7, 6, 0)
+    assert calls(datafolder) == {('get_oligos', 1), ('run_nHUSH', 1), ('reform_hush_combined', 1), ('melt_secs', 1),
+                                 ('build-db', 1), ('cycling_query', None), ('summarize', None)}
+
+
+def test_run_failed(datafolder:str, monkeypatch):
+    # a failed piece is not recorded, and the pieces depending on it are skipped
+    def fail(roi, params:dict, datafolder:os.PathLike)->None:
+        raise RuntimeError("melt_secs failed")
+    monkeypatch.setitem(module.stage_functions, 'melt_secs', fail)
+    assert run(params, jobs=2, datafolder=datafolder) == (2*3 + 1, 0, 2*2 + 2)
+    assert ('build-db', 1) not in calls(datafolder)
+    monkeypatch.setitem(module.stage_functions, 'melt_secs', fake_stage('melt_secs'))
+    assert run(params, jobs=2, datafolder=datafolder) == (2*2 + 2, 2*3 + 1, 0)
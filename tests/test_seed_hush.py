@@ -0,0 +1,62 @@
+# In-package seed index (seed_hush.search: hushp -C counts, nhush --sfp min distances)
+# against a naive scan of a small random reference.
+
+import numpy as np
+import pytest
+
+from probe_design.src.seed_hush import SeedIndex, search, search_block, seed_scheme, encode, pack_seeds
+from tests.reference import revcomp, make_reference, make_queries
+
+
+def windows(records:list[str], length:int):
+    for record in records:
+        for strand in [record, revcomp(record)]:
+            for i in range(len(strand) - length + 1):
+                yield strand[i:i+length]
+
+
+def naive_search(query:str, records:list[str], mismatch:int)->tuple[int,int]:
+    distances = [sum(a != b for a, b in zip(query, site)) for site in windows(records, len(query))]
+    count = sum(d <= mismatch for d in distances)
+    perfect = sum(d == 0 for d in distances)
+    closest = min((d for d in distances if 0 < d <= mismatch), default=mismatch+1)
+    return count, 0 if perfect > 1 else closest
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('length,mismatch', [(20, 3), (16, 1), (12, 0)])
+def test_search_naive(tmp_path, seed:int, length:int, mismatch:int):
+    reference = tmp_path / "genome.fa"
+    records = make_reference(reference, seed)
+    queries = make_queries(records, seed, length)
+    count, mindist = search(queries, str(reference), mismatch)
+    for k, query in enumerate(queries):
+        assert (count[k], mindist[k]) == naive_search(query, records, mismatch), query
+
+
+@pytest.mark.parametrize('length,mismatch', [(20, 3), (12, 0)])
+def test_search_block_batches(tmp_path, length:int, mismatch:int):
+    # the candidate sites verified a few at a time give the same results
+    reference = tmp_path / "genome.fa"
+    records = make_reference(reference, 0)
+    queries = encode(''.join(make_queries(records, 0, length))).reshape(-1, length)
+    scheme = seed_scheme(length, mismatch)
+    whole = search_block(str(reference), scheme, queries, mismatch)
+    for a, b in zip(whole, search_block(str(reference), scheme, queries, mismatch, batch=3)):
+        assert a.tolist() == b.tolist()
+
+
+@pytest.mark.parametrize('shape', [tuple(range(8)), (0, 1, 2, 3, 9, 10, 11, 12)])
+def test_bucketed_index(tmp_path, shape:tuple[int,...]):
+    # an index sorted in many small buckets is the index of a single bucket
+    make_reference(tmp_path / "genome.fa", 0)
+    (tmp_path / "small").mkdir()
+    make_reference(tmp_path / "small" / "genome.fa", 0)
+    whole = SeedIndex(str(tmp_path / "genome.fa"), shape)
+    small = SeedIndex(str(tmp_path / "small" / "genome.fa"), shape, memory=1e-6)
+    assert np.array_equal(whole.keys, small.keys) and np.array_equal(whole.positions, small.positions)
+    values, invalid = pack_seeds(whole.codes, shape)
+    positions = np.flatnonzero(~invalid)
+    order = np.argsort(values[positions], kind='stable')
+    assert whole.keys.tolist() == values[positions][order].tolist()
+    assert whole.positions.tolist() == positions[order].tolist()
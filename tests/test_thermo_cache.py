@@ -0,0 +1,77 @@
+# Thermodynamics cache (thermo_cache.ThermoCache): lookups by conditions and sequence, and
+# least recently used entries evicted first when the file grows above its size limit.
+
+import importlib
+import random
+import types
+import pytest
+
+from probe_design.src.thermo_cache import ThermoCache
+
+module = importlib.import_module("probe_design.src.thermo_cache")      # the package exports the function of that name
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a settable time.time for the last-use stamps
+    now = [0]
+    monkeypatch.setattr(module, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def batch(rng:random.Random, n:int)->list[str]:
+    return [''.join(rng.choice('ACGT') for _ in range(40)) for _ in range(n)]
+
+
+def test_get_put(tmp_path, clock):
+    cache = ThermoCache(tmp_path / "thermo.sqlite")
+    seqs = batch(random.Random(0), 10)
+    cache.put('melt', 'Na=1', {seq: (-30.0, -250.0, -0.7, 60.0 + k) for k, seq in enumerate(seqs[:5])})
+    cache.put('secs', 'Na=1', {seq: (-1.5,) for seq in seqs[3:]})
+    assert cache.get('melt', 'Na=1', seqs) == {seq: (-30.0, -250.0, -0.7, 60.0 + k) for k, seq in enumerate(seqs[:5])}
+    assert cache.get('secs', 'Na=1', seqs + seqs[3:4]) == {seq: (-1.5,) for seq in seqs[3:]}
+    assert cache.get('melt', 'Na=0.3', seqs) == {}
+    cache.close()
+
+    cache = ThermoCache(tmp_path / "thermo.sqlite")      # persistent
+    assert len(cache.get('secs', 'Na=1', seqs)) == 7
+    cache.close()
+
+
+def test_evict_least_recently_used(tmp_path, clock):
+    cache = ThermoCache(tmp_path / "thermo.sqlite")
+    rng = random.Random(1)
+    batches = [batch(rng, 2000) for _ in range(3)]
+    for t, seqs in enumerate(batches, start=1):
+        clock[0] = t
+        cache.put('melt', 'Na=1', {seq: (-30.0, -250.0, -0.7, 60.0) for seq in seqs})
+        cache.put('secs', 'Na=1', {seq: (-1.0,) for seq in seqs})
+    clock[0] = 4
+    cache.get('melt', 'Na=1', batches[0])        # the oldest batch used again
+    cache.get('secs', 'Na=1', batches[0])
+
+    # 55% of the entries of each table evicted: the second batch, then the oldest of the third
+    size = cache.size()
+    cache.max_size = size/2
+    cache.evict()
+    assert cache.size() < size
+    for table in ['melt', 'secs']:
+        assert len(cache.get(table, 'Na=1', batches[0])) == 2000
+        assert len(cache.get(table, 'Na=1', batches[1])) == 0
+        assert len(cache.get(table, 'Na=1', batches[2])) == 6000 - int(6000*0.55) - 1 - 2000
+    cache.close()
+
+
+def test_put_evicts(tmp_path, clock):
+    # a put above the limit evicts, the new entries last
+    cache = ThermoCache(tmp_path / "thermo.sqlite", max_size=1)
+    rng = random.Random(2)
+    old, new = batch(rng, 3000), batch(rng, 3000)
+    clock[0] = 1
+    cache.put('secs', 'Na=1', {seq: (-1.0,) for seq in old})
+    cache.max_size = cache.size()*1.2
+    clock[0] = 2
+    cache.put('secs', 'Na=1', {seq: (-2.0,) for seq in new})
+    assert len(cache.get('secs', 'Na=1', new)) == 3000
+    assert len(cache.get('secs', 'Na=1', old)) < 3000
+    cache.close()
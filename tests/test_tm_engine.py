@@ -0,0 +1,33 @@
+# In-package melting temperatures (tm_engine) against oligo-melting, which melt_duplex runs.
+
+import random
+import pytest
+
+from probe_design.src.tm_engine import nn_sums, melting
+
+Duplex = pytest.importorskip("oligo_melting").Duplex
+
+conditions = [dict(oligo_conc=0.05e-6, na_conc=1.04, fa_conc=50),           # melt_secs
+              dict(oligo_conc=0.25e-6, na_conc=0.05),
+              dict(oligo_conc=1e-6, na_conc=0.3, fa_conc=30, fa_mode='mcconaughy'),
+              dict(oligo_conc=1e-6, na_conc=0.3, fa_conc=20, fa_mvalue='0.0032L+0.05'),
+              dict(oligo_conc=1e-6, na_conc=0.05, mg_conc=0.01)]
+
+
+@pytest.mark.parametrize('duplex', ['DNA:DNA', 'RNA:DNA', 'DNA:RNA'])
+@pytest.mark.parametrize('condition', conditions)
+def test_tm_engine_oligo_melting(duplex:str, condition:dict):
+    rng = random.Random(0)
+    seqs = [''.join(rng.choice('ACGT') for _ in range(rng.randint(15, 50))) for _ in range(50)]
+    sums = nn_sums(seqs, duplex)
+    dg, tm = melting(sums, duplex, **condition)
+
+    options = {key: value for key, value in condition.items() if key not in ['fa_mode', 'fa_mvalue']}
+    if condition.get('fa_mode') == 'mcconaughy':
+        options['fa_mode'] = Duplex.FA_MODE_MCCONA1969
+    if 'fa_mvalue' in condition:
+        options['fa_mval_s'] = condition['fa_mvalue']
+    for k, seq in enumerate(seqs):
+        seq = seq.replace('T', 'U') if duplex.startswith('RNA') else seq
+        _, g, h, s, t, _ = Duplex.calc_tm(seq, name='oligo', tt_mode=duplex, celsius=False, silent=True, **options)
+        assert (dg[k], sums['h'][k], sums['s'][k], tm[k]) == pytest.approx((g, h, s, t), abs=1e-9)